@@ -1,5 +1,10 @@
-from src.analysis.html_report import make_report
+from src.analysis.cost_basis import COST_BASIS_METHODS, CORRECTED
+from src.analysis.html_report import HTML_REPORT, REPORT_MODES, make_report
+from src.analysis.image_export import IMAGE_FORMATS
+from src.analysis.report_pipeline import REPORT_WORKERS
+from src.client.recorder import RECORD_MODE, REPLAY_MODE, TransportRecorder
 import argparse
+import contextlib
 import logging
 from src.utils.logging import log_format, log_level
 logging.basicConfig(format=log_format, level=log_level)
@@ -9,5 +14,41 @@ if __name__ == '__main__':
     parser.add_argument('api_key', type=str, help='Key from binance profile')
     parser.add_argument('api_secret', type=str, help='Secret key from binance profile')
     parser.add_argument('open_file', type=int, nargs='?', default=1, choices=[0,1], help='Open html report after creating')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--record', type=str, help='Record all api requests to archive')
+    group.add_argument('--replay', type=str, help='Replay api requests from archive without network')
+    parser.add_argument('--replay-latency', action='store_true',
+                        help='Sleep for recorded latency of each request in replay')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Sync only new orders and update persisted orders aggregates with them')
+    parser.add_argument('--cost-basis', type=str, default=CORRECTED, choices=COST_BASIS_METHODS,
+                        help='Method of average purchase price')
+    parser.add_argument('--workers', type=int, default=REPORT_WORKERS, help='Number of workers for rendering figures of coins')
+    parser.add_argument('--no-cache', action='store_true', help='Render all figures without cache of rendered figures')
+    parser.add_argument('--compact', action='store_true',
+                        help='Store figures data once in compressed block and render figures lazily')
+    parser.add_argument('--inline-plotlyjs', action='store_true', help='Embed plotly.js into report to open it offline')
+    parser.add_argument('--gzip', action='store_true', help='Write gzip compressed report')
+    parser.add_argument('--mode', type=str, default=HTML_REPORT, choices=REPORT_MODES,
+                        help='Make html report or summary images for chat')
+    parser.add_argument('--image-format', type=str, default='png', choices=IMAGE_FORMATS, help='Format of summary images')
     args = parser.parse_args()
-    make_report(args.api_key, args.api_secret, args.open_file)
+    if args.record is not None:
+        recorder_context = TransportRecorder(args.record, RECORD_MODE)
+    elif args.replay is not None:
+        recorder_context = TransportRecorder(args.replay, REPLAY_MODE, replay_latency=args.replay_latency)
+    else:
+        recorder_context = contextlib.nullcontext()
+    kwargs = dict(
+        incremental=args.incremental,
+        cost_basis_method=args.cost_basis,
+        workers=args.workers,
+        use_cache=not args.no_cache,
+        compact=args.compact,
+        inline_plotlyjs=args.inline_plotlyjs,
+        compress=args.gzip,
+        mode=args.mode,
+        image_format=args.image_format,
+    )
+    with recorder_context as recorder:
+        make_report(args.api_key, args.api_secret, args.open_file, recorder=recorder, **kwargs)
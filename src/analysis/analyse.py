@@ -1,13 +1,20 @@
 import logging
 from datetime import datetime
-from typing import Dict, List, Optional
+from functools import partial
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 
+from src.analysis.cost_basis import (COST_BASIS_METHODS, CORRECTED, FIFO,
+                                     CostBasisEngine)
+from src.analysis.orders_state import OrdersState
+from src.analysis.portfolio import PortfolioHistory
 from src.constants import remove_from_plots
+from src.data.price_book import PriceBook
+from src.data.schema import apply_order_schema, replace_category
 from src.data.prices import get_prices, round_price
 from src.plot.asset_history import plot_asset_history
 
@@ -17,67 +24,138 @@ QUOTE_COINS = ["USDT", "BUSD", "RUB"]
 
 
 class OrdersAnalyser:
-    def __init__(self, client_helper, orders):
-        self._orders = self.prepare_dataframe(orders)
+    def __init__(self, client_helper, orders, state: Optional[OrdersState] = None):
+        """
+        Args:
+            client_helper: Client for price queries.
+            orders: Processed orders.
+            state: Orders state for incremental mode. It is synced with new orders and used for aggregates
+                   instead of calculating corrected balance over the whole history.
+        """
+        self._state = state
+        self._raw_orders: Optional[pd.DataFrame] = None
+        self._orders: Optional[pd.DataFrame] = None
+        self._version = 0
+        self._cache: Dict[Tuple, Any] = {}
+        self.update_orders(orders)
         self.client_helper = client_helper
         self.width = 1200
         self.height = 400
 
     @property
     def orders(self):
+        # in incremental mode the whole history is filtered only when orders are used
+        if self._orders is None:
+            self._orders = self.filter_orders(self._raw_orders)
         return self._orders
 
+    def update_orders(self, orders: pd.DataFrame):
+        """
+        Replace orders and invalidate cached results. In incremental mode only new orders are processed.
+        """
+        if self._state is None:
+            self._orders = self.prepare_dataframe(orders)
+        else:
+            self._raw_orders, self._orders = orders, None
+            self._state.sync(orders, self.filter_orders)
+        self._version += 1
+        self.invalidate()
+
+    def invalidate(self):
+        self._cache.clear()
+
+    def _cached(self, name: str, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Get result of compute cached by name, orders version and key, i.e. price snapshot.
+        Copies of cached tables are returned, so callers can modify them.
+        """
+        cache_key = (name, self._version, key)
+        if cache_key not in self._cache:
+            self._cache[cache_key] = compute()
+        result = self._cache[cache_key]
+        if isinstance(result, pd.DataFrame):
+            return result.copy()
+        return result
+
     @staticmethod
-    def prepare_dataframe(orders: pd.DataFrame):
-        orders = orders.copy()
-        numerical_columns = ["price", "origQty", "executedQty", "cummulativeQuoteQty"]
-        for col in numerical_columns:
-            orders[col] = orders[col].astype(float)
+    def filter_orders(orders: pd.DataFrame):
+        orders = apply_order_schema(orders)
         # Use only filled orders
-        orders = orders[orders["status"] == "FILLED"]
+        orders = orders[orders["status"] == "FILLED"].copy()
         # Replace payments with BUSD to USDT to simplify
-        orders.loc[orders["quote_coin"] == "BUSD", "quote_coin"] = "USDT"
-        # Calculate executedCorrectedQty, needed for calculation mean buying price
-        updated_orders = []
-        for _, pair_orders in orders.groupby(["base_coin"]):
-            updated_orders.append(calculate_corrected_balance_for_pair(pair_orders))
-        orders = pd.concat(updated_orders)
+        orders["quote_coin"] = replace_category(orders["quote_coin"], "BUSD", "USDT")
+        orders["base_coin"] = orders["base_coin"].cat.remove_unused_categories()
 
         assert np.all(
             np.isin(orders["quote_coin"].unique(), QUOTE_COINS)
         ), f"Only {QUOTE_COINS} quote coins allowed"
         return orders
 
+    @classmethod
+    def prepare_dataframe(cls, orders: pd.DataFrame):
+        orders = cls.filter_orders(orders)
+        # Calculate executedCorrectedQty, needed for calculation mean buying price
+        updated_orders = []
+        for _, pair_orders in orders.groupby("base_coin", observed=True):
+            updated_orders.append(calculate_corrected_balance_for_pair(pair_orders))
+        return pd.concat(updated_orders)
+
     def calculate_mean_price(self):
-        orders = self._orders
-
-        average_prices = []
-        for base_coin, pair_orders in orders.groupby(["base_coin"]):
-            quote_coin = pair_orders["quote_coin"].unique()
-            if len(quote_coin) > 1:
-                msg = (
-                    f"can calculate average purchase price only with single quote_coin, "
-                    f"but for {base_coin} there is several: {quote_coin}"
-                )
-                raise ValueError(msg)
-            quote_coin = quote_coin[0]
-            mask_buy = pair_orders["side"] == "BUY"
-            average_price = (
-                pair_orders.loc[mask_buy, "price"]
-                * pair_orders.loc[mask_buy, "executedCorrectedQty"]
-            ).sum() / pair_orders.loc[mask_buy, "executedCorrectedQty"].sum()
-            average_prices.append(
-                {
-                    "base_coin": base_coin,
-                    "quote_coin": quote_coin,
-                    "average_price": average_price,
-                    "n_purchases": mask_buy.sum(),
-                    "n_sales": (~mask_buy).sum(),
-                }
+        return self._cached("mean_price", None, self._calculate_mean_price)
+
+    def _calculate_mean_price(self):
+        if self._state is not None:
+            return self._state.aggregates()[
+                ["base_coin", "quote_coin", "average_price", "n_purchases", "n_sales"]
+            ]
+        orders = self.orders
+        is_buy = orders["side"] == "BUY"
+        buy_qty = orders["executedCorrectedQty"].where(is_buy, 0.0)
+        grouped = pd.DataFrame(
+            {
+                "base_coin": orders["base_coin"],
+                "quote_coin": orders["quote_coin"],
+                "weighted_price": orders["price"] * buy_qty,
+                "buy_qty": buy_qty,
+                "is_buy": is_buy,
+                "is_sell": ~is_buy,
+            }
+        ).groupby("base_coin", observed=True, sort=True)
+        average_prices = grouped.agg(
+            quote_coin=("quote_coin", "first"),
+            n_quote_coins=("quote_coin", "nunique"),
+            weighted_price=("weighted_price", "sum"),
+            buy_qty=("buy_qty", "sum"),
+            n_purchases=("is_buy", "sum"),
+            n_sales=("is_sell", "sum"),
+        ).reset_index()
+
+        several_quote_coins = average_prices["n_quote_coins"] > 1
+        if several_quote_coins.any():
+            base_coin = average_prices.loc[several_quote_coins, "base_coin"].iloc[0]
+            quote_coin = orders.loc[orders["base_coin"] == base_coin, "quote_coin"]
+            msg = (
+                f"can calculate average purchase price only with single quote_coin, "
+                f"but for {base_coin} there is several: {quote_coin.unique()}"
             )
-        average_prices = pd.DataFrame(average_prices)
+            raise ValueError(msg)
+
+        average_prices["average_price"] = (
+            average_prices["weighted_price"] / average_prices["buy_qty"]
+        )
+        return average_prices[
+            ["base_coin", "quote_coin", "average_price", "n_purchases", "n_sales"]
+        ]
 
-        return average_prices
+    def cost_basis(self, method: str = FIFO) -> CostBasisEngine:
+        """
+        Cost basis of coins with lot matching method: fifo, lifo or average.
+        """
+        return self._cached(
+            "cost_basis",
+            method,
+            lambda: CostBasisEngine(method).process_orders(self.orders),
+        )
 
     def plot_transactions(
         self,
@@ -86,75 +164,22 @@ class OrdersAnalyser:
         add_mean_price: bool = True,
         add_last_price: bool = True,
     ):
-        plot_df = self.orders[self.orders["base_coin"] == base_coin]
-        assert np.all(
-            np.isin(plot_df["quote_coin"].unique(), QUOTE_COINS)
-        ), f"Only {QUOTE_COINS} quote coins are acceptable"
-        fig = px.scatter(
-            plot_df,
-            x="date",
-            y="price",
-            size="executedQty",
-            color="side",
-            title=f"{base_coin} transactions",
-            size_max=10,
-            hover_data=["cummulativeQuoteQty"],
-        )
-        if price_history is not None:
-            fig.add_trace(
-                go.Scatter(
-                    x=price_history["date"],
-                    y=price_history["Close"],
-                    mode="lines",
-                    name="history",
-                    marker_color="grey",
-                )
-            )
-
+        mean_price = None
         if add_mean_price:
             mean_price = self.calculate_mean_price()
             mean_price = mean_price.loc[
                 mean_price["base_coin"] == base_coin, "average_price"
             ].item()
-            fig.add_hline(
-                y=mean_price,
-                line_dash="dot",
-                annotation_text=f"average purchase price = {round_price(mean_price)} usdt",
-                annotation_position="bottom right",
-            )
-
-        if add_last_price:
-            last_price = price_history.iloc[-1]
-            fig.add_annotation(
-                x=last_price["date"],
-                y=last_price["Close"],
-                text=f"Last price = {round_price(last_price['Close'])} usdt",
-                arrowhead=2,
-            )
-        fig.update_xaxes(
-            rangeslider_visible=True,
-            rangeselector=dict(
-                buttons=list(
-                    [
-                        dict(count=1, label="1m", step="month", stepmode="backward"),
-                        dict(count=6, label="6m", step="month", stepmode="backward"),
-                        dict(count=1, label="1y", step="year", stepmode="backward"),
-                        dict(step="all"),
-                    ]
-                )
-            ),
-            type="date",
-        )
-        fig.update_layout(
-            yaxis_title="USDT",
+        return plot_coin_transactions(
+            self.orders[self.orders["base_coin"] == base_coin],
+            base_coin,
+            price_history,
+            mean_price=mean_price,
+            add_last_price=add_last_price,
             width=self.width,
             height=self.height,
-            xaxis_fixedrange=False,
-            yaxis_fixedrange=False,
         )
 
-        return fig
-
     def plot_transactions_many(self, coins):
         fig_dict = {}
         for base_coin in coins:  # ['LTC', 'ETH']:
@@ -165,17 +190,25 @@ class OrdersAnalyser:
             fig_dict[base_coin] = fig
         return fig_dict
 
-    def prepare_coins_asset_history(self) -> Dict[str, pd.DataFrame]:
-        coins_asset_history = {}
+    def prepare_portfolio_history(self) -> PortfolioHistory:
+        """
+        History of holdings, invested cash and usdt value of all coins except remove_from_plots.
+        Daily prices are queried once a day.
+        """
+        return self._cached(
+            "portfolio_history",
+            datetime.today().strftime("%Y-%m-%d"),
+            self._prepare_portfolio_history,
+        )
+
+    def _prepare_portfolio_history(self) -> PortfolioHistory:
         prices = get_prices(self.client_helper)
-        for base_coin, pair_orders in self.orders.groupby("base_coin"):
-            if base_coin in remove_from_plots:
-                continue
-            price_history = prices[["date", base_coin]]
-            price_history.columns = ["date", "price"]
-            asset_history = calculate_asset_worth_history(pair_orders, price_history)
-            coins_asset_history[base_coin] = asset_history
-        return coins_asset_history
+        orders = self.orders[~self.orders["base_coin"].isin(remove_from_plots)]
+        return PortfolioHistory.from_orders(orders, prices)
+
+    def prepare_coins_asset_history(self) -> Dict[str, pd.DataFrame]:
+        portfolio = self.prepare_portfolio_history()
+        return {coin: portfolio.coin_history(coin) for coin in portfolio.coins}
 
     def plot_coins_asset_history(
         self, coins_asset_history: Dict[str, pd.DataFrame], items: Optional[List] = None
@@ -197,6 +230,10 @@ class OrdersAnalyser:
     def plot_full_asset_history(
         self, coins_asset_history: Dict[str, pd.DataFrame], items: Optional[List] = None
     ):
+        """
+        Plot total history of coins from per-coin tables, i.e. from prepare_coins_asset_history.
+        Use plot_portfolio_history to plot it from prepare_portfolio_history without per-coin tables.
+        """
         cash_df = []
         coin_df = []
         if items is None:
@@ -218,41 +255,51 @@ class OrdersAnalyser:
         )
         return fig
 
-    def asset_usdt_composition(self, prices: pd.DataFrame):
-        asset_df = (
-            self._orders[self._orders["side"] == "BUY"]
-            .groupby("base_coin")["executedCorrectedQty"]
-            .sum()
-            .reset_index()
+    def plot_portfolio_history(
+        self, portfolio: PortfolioHistory, items: Optional[List] = None
+    ):
+        full_asset_history = portfolio.total_history(items)
+        fig = plot_asset_history(
+            full_asset_history,
+            title="Asset usdt value history",
+            width=self.width,
+            height=self.height,
+        )
+        return fig
+
+    def asset_usdt_composition(self, prices: PriceBook):
+        return self._cached(
+            "asset_usdt_composition",
+            prices.snapshot_id,
+            partial(self._asset_usdt_composition, prices),
         )
 
-        def convert_to_usd_price(
-            raw,
-        ):
-            try:
-                return (
-                    raw["executedCorrectedQty"]
-                    * prices.loc[
-                        prices["base_coin"] == raw["base_coin"], "price"
-                    ].item()
-                )
-            except ValueError:
-                logger.info(
-                    f'{raw["base_coin"]} coin is not listed in binance, price is not available'
-                )
-                return None
+    def _asset_usdt_composition(self, prices: PriceBook):
+        if self._state is not None:
+            asset_df = self._state.aggregates()[["base_coin", "executedCorrectedQty"]]
+        else:
+            asset_df = (
+                self._orders[self._orders["side"] == "BUY"]
+                .groupby("base_coin", observed=True)["executedCorrectedQty"]
+                .sum()
+                .reset_index()
+            )
 
-        asset_df["usdt_value"] = asset_df.apply(convert_to_usd_price, axis=1)
+        asset_df["usdt_value"] = asset_df["executedCorrectedQty"] * prices.lookup(
+            asset_df["base_coin"]
+        )
+        for coin in asset_df.loc[asset_df["usdt_value"].isna(), "base_coin"]:
+            logger.info(f"{coin} coin is not listed in binance, price is not available")
         asset_df = asset_df[asset_df["base_coin"] != "USDT"]
         return asset_df
 
-    def plot_asset_usdt_composition(self, prices: pd.DataFrame):
+    def plot_asset_usdt_composition(self, prices: PriceBook):
         """
         Plot the most actual composition of asset in usdt.
 
         Args:
             history_assets: Table with columns ['type', 'date', 'totalAssetOfBtc', all coins in asset].
-            prices: Table with columns ['price', 'base_coin', 'quote_coin'].
+            prices: Current prices.
 
         Returns:
 
@@ -268,16 +315,128 @@ class OrdersAnalyser:
         return fig
 
 
+def plot_coin_transactions(
+    plot_df: pd.DataFrame,
+    base_coin: str,
+    price_history: Optional[pd.DataFrame] = None,
+    mean_price: Optional[float] = None,
+    add_last_price: bool = True,
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+) -> go.Figure:
+    """
+    Plot transactions of coin over its price history.
+
+    Args:
+        plot_df: Orders of coin.
+        base_coin: Name of coin.
+        price_history: Daily price history of coin.
+        mean_price: Average purchase price, it is shown as horizontal line if passed.
+        add_last_price: Annotate the last price of history.
+        width: Figure width.
+        height: Figure height.
+    """
+    assert np.all(
+        np.isin(plot_df["quote_coin"].unique(), QUOTE_COINS)
+    ), f"Only {QUOTE_COINS} quote coins are acceptable"
+    fig = px.scatter(
+        plot_df,
+        x="date",
+        y="price",
+        size="executedQty",
+        color="side",
+        title=f"{base_coin} transactions",
+        size_max=10,
+        hover_data=["cummulativeQuoteQty"],
+    )
+    if price_history is not None:
+        fig.add_trace(
+            go.Scatter(
+                x=price_history["date"],
+                y=price_history["Close"],
+                mode="lines",
+                name="history",
+                marker_color="grey",
+            )
+        )
+
+    if mean_price is not None:
+        fig.add_hline(
+            y=mean_price,
+            line_dash="dot",
+            annotation_text=f"average purchase price = {round_price(mean_price)} usdt",
+            annotation_position="bottom right",
+        )
+
+    if add_last_price:
+        last_price = price_history.iloc[-1]
+        fig.add_annotation(
+            x=last_price["date"],
+            y=last_price["Close"],
+            text=f"Last price = {round_price(last_price['Close'])} usdt",
+            arrowhead=2,
+        )
+    fig.update_xaxes(
+        rangeslider_visible=True,
+        rangeselector=dict(
+            buttons=list(
+                [
+                    dict(count=1, label="1m", step="month", stepmode="backward"),
+                    dict(count=6, label="6m", step="month", stepmode="backward"),
+                    dict(count=1, label="1y", step="year", stepmode="backward"),
+                    dict(step="all"),
+                ]
+            )
+        ),
+        type="date",
+    )
+    fig.update_layout(
+        yaxis_title="USDT",
+        width=width,
+        height=height,
+        xaxis_fixedrange=False,
+        yaxis_fixedrange=False,
+    )
+
+    return fig
+
+
 def generate_asset_table(
-    order_analyser: OrdersAnalyser, current_prices: pd.DataFrame
+    order_analyser: OrdersAnalyser,
+    current_prices: PriceBook,
+    cost_basis_method: str = CORRECTED,
 ) -> pd.DataFrame:
-    asset_df = order_analyser.calculate_mean_price()
+    """
+    Table of coins with average purchase price, its change and share in asset.
+
+    Args:
+        order_analyser: Analyser of orders.
+        current_prices: Current prices.
+        cost_basis_method: "corrected" for average price of corrected balance or lot matching method
+                           "fifo", "lifo", "average". Lot matching adds realized and unrealized PnL columns.
+    """
+    if cost_basis_method not in COST_BASIS_METHODS:
+        raise ValueError(
+            f"cost_basis_method should be one of {COST_BASIS_METHODS}, got {cost_basis_method}"
+        )
+    if cost_basis_method == CORRECTED:
+        asset_df = order_analyser.calculate_mean_price()
+    else:
+        asset_df = order_analyser.cost_basis(cost_basis_method).summary(current_prices)
+        asset_df = asset_df[
+            [
+                "base_coin",
+                "quote_coin",
+                "average_price",
+                "n_purchases",
+                "n_sales",
+                "realized_pnl",
+                "unrealized_pnl",
+            ]
+        ]
 
-    asset_df = pd.merge(
-        asset_df,
-        current_prices.rename(columns={"price": "current_price"}),
-        on=["base_coin", "quote_coin"],
-        how="left",
+    asset_df = current_prices.join(
+        asset_df, quote_col="quote_coin", price_col="current_price"
     )
     asset_df["price_change_usd"] = asset_df["current_price"] - asset_df["average_price"]
     asset_df["price_change_percent"] = (
@@ -300,106 +459,57 @@ def generate_asset_table(
 
 
 def calculate_corrected_balance_for_pair(pair_orders: pd.DataFrame):
+    """
+    Calculate executedCorrectedQty - quantity of coins of each buy order which is left after later sales.
+    Each sale decreases quantity of all previous buy orders with the same ratio:
+    sale quote amount to usdt value of previous purchases at sale price.
+    Ratios are accumulated in one pass, so quantity of buy order is multiplied by product of ratios of later sales.
+
+    Args:
+        pair_orders: Orders of single base coin sorted by time.
+
+    Returns:
+        Orders with executedCorrectedQty column, it is NaN for sell orders.
+    """
     assert (
         len(pair_orders["base_coin"].unique()) == 1
     ), f'DataFrame should contain one base coin, but there are several: {pair_orders["base_coin"].unique()}'
 
-    pair_orders["executedCorrectedQty"] = pair_orders[
-        "executedQty"
-    ]  # corrected coin quantity by selled tokens
-    pair_orders["usdtValue"] = np.nan  # usdt value of buyed tokens
-    pair_orders[
-        "usdtValueCorrection"
-    ] = np.nan  # delta correction usdt value of buyed tokens
-    pair_orders.loc[
-        pair_orders["side"] == "SELL", ["executedCorrectedQty", "usdtValue"]
-    ] = None
-    pair_orders["usdtQtyWeight"] = np.nan  # weights of buy orders in usdt terms
     pair_orders = pair_orders.reset_index(drop=True)
-    cash_usdt_amount = 0
-    for i in range(len(pair_orders)):
-        mask_slice = pair_orders.index <= i
-        mask_buy = pair_orders["side"] == "BUY"
-        mask_slice_buy = mask_slice & mask_buy
-        if pair_orders.loc[mask_slice, "side"].iloc[-1] == "SELL":
-            pair_orders.loc[mask_slice_buy, "usdtValue"] = (
-                pair_orders.loc[mask_slice_buy, "cummulativeQuoteQty"]
-                * pair_orders.loc[mask_slice, "price"].iloc[-1]
-                / pair_orders.loc[mask_slice_buy, "price"]
-            )
-            pair_orders.loc[mask_slice_buy, "usdtQtyWeight"] = (
-                pair_orders.loc[mask_slice_buy, "usdtValue"]
-                / pair_orders.loc[mask_slice_buy, "usdtValue"].sum()
-            )
-            sell_amount = pair_orders.loc[mask_slice, "cummulativeQuoteQty"].iloc[-1]
-            pair_orders.loc[mask_slice_buy, "usdtValueCorrection"] = (
-                sell_amount * pair_orders.loc[mask_slice_buy, "usdtQtyWeight"]
-            )
-            cash_usdt_amount += sell_amount
-            # Reduce corrected coin quantity with ratio of decreased usdtValue from sell order
-            if pair_orders.loc[mask_slice_buy, "executedCorrectedQty"].sum() == 0:
-                raise ValueError(
-                    "Bad balance error, looks like not all orders are listed. There are no coins available for selling"
-                )
-            # pair_orders.loc[mask_slice_buy, 'executedCorrectedQty'] -= pair_orders.loc[mask_slice_buy, 'usdtValueCorrection']/pair_orders.loc[mask_slice_buy, 'price']
-            pair_orders.loc[mask_slice_buy, "executedCorrectedQty"] *= (
-                1
-                - pair_orders.loc[mask_slice_buy, "usdtValueCorrection"]
-                / pair_orders.loc[mask_slice_buy, "usdtValue"]
-            )
-    pair_orders = pair_orders.drop(
-        ["usdtValue", "usdtValueCorrection", "usdtQtyWeight"], axis=1
-    )
-    return pair_orders
-
-
-def calculate_asset_worth_history(pair_orders, price_history):
-    price_history = price_history.copy()
-    pair_orders = pair_orders.apply(calc_transfers, axis=1)
-    pair_orders["usdt_cash_in_cum"] = pair_orders["usdt_cash_transfer"].cumsum()
-    pair_orders["coin_cum"] = pair_orders["coin_transfer"].cumsum()
-
-    price_history.date = price_history.date.dt.to_period("D")
-
-    asset_history = pair_orders[["date", "usdt_cash_in_cum", "coin_cum"]]
-    asset_history_last_row = asset_history.iloc[0].copy()
-    asset_history_last_row[:] = np.nan
-    asset_history_last_row["date"] = pd.Timestamp(datetime.today().strftime("%Y-%m-%d"))
-    asset_history = pd.concat([asset_history, asset_history_last_row.to_frame().T])
+    is_buy = (pair_orders["side"] == "BUY").to_numpy()
+    executed_qty = pair_orders["executedQty"].to_numpy(dtype=float)
+    quote_qty = pair_orders["cummulativeQuoteQty"].to_numpy(dtype=float)
+    price = pair_orders["price"].to_numpy(dtype=float)
+
+    is_sell = ~is_buy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # coins bought for quote amounts of purchases at their prices, cumulative
+        buy_coins_value = np.cumsum(np.where(is_buy, quote_qty / price, 0.0))
+        # 1 - share of previous purchases sold by order, 1 for buy orders
+        sale_ratio = np.ones(len(pair_orders))
+        sale_ratio[is_sell] = 1 - quote_qty[is_sell] / (
+            price[is_sell] * buy_coins_value[is_sell]
+        )
 
-    asset_history = (
-        asset_history.set_index("date")
-        .resample("D", label="right", closed="right")
-        .last()
-        .ffill()
-        .bfill()
-        .reset_index()
-    )
+    corrected_qty_sum = 0.0  # corrected coin quantity of previous purchases
+    for buy, qty, ratio in zip(
+        is_buy.tolist(), executed_qty.tolist(), sale_ratio.tolist()
+    ):
+        if buy:
+            corrected_qty_sum += qty
+            continue
+        if corrected_qty_sum == 0:
+            raise ValueError(
+                "Bad balance error, looks like not all orders are listed. There are no coins available for selling"
+            )
+        corrected_qty_sum *= ratio
 
-    asset_history.date = asset_history.date.dt.to_period("D")
-    asset_history = pd.merge(asset_history, price_history, on="date", how="left")
-    asset_history["coin_cum_usdt_value"] = (
-        asset_history["coin_cum"] * asset_history["price"]
+    # product of ratios of the order and all later orders, ratio of buy order is 1
+    later_sale_ratio = np.cumprod(sale_ratio[::-1])[::-1]
+    pair_orders["executedCorrectedQty"] = np.where(
+        is_buy, executed_qty * later_sale_ratio, np.nan
     )
-    asset_history.date = asset_history.date.dt.to_timestamp()
-    asset_history.date -= pd.Timedelta("1 day")
-
-    return asset_history
-
-
-def calc_transfers(row):
-    if row["side"] == "BUY":
-        row["usdt_cash_in"] = row["cummulativeQuoteQty"]
-        row["usdt_cash_out"] = np.nan
-        row["usdt_cash_transfer"] = row["cummulativeQuoteQty"]
-        row["coin_transfer"] = row["executedQty"]
-
-    else:
-        row["usdt_cash_in"] = np.nan
-        row["usdt_cash_out"] = row["cummulativeQuoteQty"]
-        row["usdt_cash_transfer"] = -row["cummulativeQuoteQty"]
-        row["coin_transfer"] = -row["executedQty"]
-    return row
+    return pair_orders
 
 
 class AssetAnalyser:
@@ -409,14 +519,14 @@ class AssetAnalyser:
         self.height = 400
 
     def plot_asset_composition_in_usdt(
-        self, history_assets: pd.DataFrame, prices: pd.DataFrame
+        self, history_assets: pd.DataFrame, prices: PriceBook
     ) -> go.Figure:
         """
         Plot the most actual composition of asset in usdt.
 
         Args:
             history_assets: Table with columns ['type', 'date', 'totalAssetOfBtc', all coins in asset].
-            prices: Table with columns ['price', 'base_coin', 'quote_coin'].
+            prices: Current prices.
 
         Returns:
 
@@ -424,15 +534,11 @@ class AssetAnalyser:
         plot_df = history_assets.drop(["type", "totalAssetOfBtc"], axis=1)
         labels = plot_df
         labels = [c for c in labels if c not in ["RUB", "date"]]
-        values = plot_df[labels].iloc[-1]
-        for i, coin in enumerate(labels):
-            try:
-                price = prices.loc[prices["base_coin"] == coin, "price"].item()
-            except ValueError:
-                logger.info(
-                    f"{coin} coin is not listed in binance, price is not available"
-                )
-            values[i] *= price
+        values = plot_df[labels].iloc[-1] * prices.lookup(labels)
+        for coin in values.index[values.isna()]:
+            logger.info(f"{coin} coin is not listed in binance, price is not available")
+        values = values.dropna()
+        labels = list(values.index)
         fig = go.Figure(
             data=[
                 go.Pie(
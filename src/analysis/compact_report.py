@@ -0,0 +1,184 @@
+import base64
+import hashlib
+import json
+import logging
+import zlib
+from typing import Any, Dict, List
+
+from src.utils.utils import get_html_body_from_plotly_figure
+
+logger = logging.getLogger(__name__)
+
+MIN_SHARED_LENGTH = 16  # shorter arrays are kept in figure
+DEFAULT_FIGURE_HEIGHT = 450
+LAZY_ROOT_MARGIN = "200px"
+REF_KEY = "$ref"
+
+COMPACT_FIGURES_LOADER = """
+<script type="text/javascript">
+(async function () {
+    const encoded = document.getElementById("report-shared-data").textContent.trim();
+    const bytes = Uint8Array.from(atob(encoded), (c) => c.charCodeAt(0));
+    const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("gzip"));
+    const shared = JSON.parse(await new Response(stream).text());
+    const resolve = (value) => {
+        if (Array.isArray(value)) {
+            return value.map(resolve);
+        }
+        if (value !== null && typeof value === "object") {
+            if (REF_KEY in value) {
+                return shared[value[REF_KEY]];
+            }
+            const resolved = {};
+            for (const key in value) {
+                resolved[key] = resolve(value[key]);
+            }
+            return resolved;
+        }
+        return value;
+    };
+    const render = (div) => {
+        const spec = document.getElementById(div.id + "-spec").textContent;
+        const figure = resolve(JSON.parse(spec));
+        Plotly.newPlot(div, figure.data, figure.layout, {responsive: true});
+    };
+    const observer = new IntersectionObserver((entries) => {
+        entries.forEach((entry) => {
+            if (entry.isIntersecting) {
+                observer.unobserve(entry.target);
+                render(entry.target);
+            }
+        });
+    }, {rootMargin: "LAZY_ROOT_MARGIN"});
+    document.querySelectorAll(".compact-figure").forEach((div) => observer.observe(div));
+})();
+</script>
+""".replace(
+    "REF_KEY", json.dumps(REF_KEY)
+).replace(
+    "LAZY_ROOT_MARGIN", LAZY_ROOT_MARGIN
+)
+
+
+def serialize_figure(fig, compact: bool = False) -> str:
+    """
+    Serialize figure to report fragment: plotly json for compact report, html div otherwise.
+    """
+    if compact:
+        return fig.to_json()
+    return get_html_body_from_plotly_figure(fig)
+
+
+def _script_json(value: Any) -> str:
+    # "</" would close script tag, "<\/" is the same string in json
+    return json.dumps(value, separators=(",", ":")).replace("</", "<\\/")
+
+
+class SharedData:
+    """
+    Distinct values of figures, i.e. date arrays of price history and layout template,
+    which are stored once and referenced from figures by index.
+    Values are compressed as they are added, so only compressed json array and digests are kept in memory.
+    """
+
+    def __init__(self):
+        self._index: Dict[str, int] = {}
+        # wbits=31 writes gzip container, which DecompressionStream("gzip") reads
+        self._compressor = zlib.compressobj(wbits=31)
+        self._chunks: List[bytes] = []
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _write(self, text: str):
+        self._chunks.append(self._compressor.compress(text.encode()))
+
+    def ref(self, value: Any) -> Dict[str, int]:
+        dumped = json.dumps(value, separators=(",", ":"))
+        digest = hashlib.sha1(dumped.encode()).hexdigest()
+        if digest not in self._index:
+            self._write("[" if len(self._index) == 0 else ",")
+            self._write(dumped)
+            self._index[digest] = len(self._index)
+        return {REF_KEY: self._index[digest]}
+
+    def _extract(self, value: Any) -> Any:
+        if isinstance(value, list):
+            if len(value) >= MIN_SHARED_LENGTH:
+                return self.ref(value)
+            return [self._extract(item) for item in value]
+        if isinstance(value, dict):
+            # plotly serializes numpy arrays as base64 typed arrays
+            if "bdata" in value and len(value["bdata"]) >= MIN_SHARED_LENGTH:
+                return self.ref(value)
+            return {key: self._extract(item) for key, item in value.items()}
+        return value
+
+    def extract(self, figure: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Replace arrays of traces and layout template of figure with references.
+        """
+        figure = dict(figure)
+        figure["data"] = [self._extract(trace) for trace in figure.get("data", [])]
+        layout = dict(figure.get("layout", {}))
+        if "template" in layout:
+            layout["template"] = self.ref(layout["template"])
+        figure["layout"] = layout
+        return figure
+
+    def encode(self) -> str:
+        """
+        Json array of values compressed with gzip and encoded with base64. It finishes compression,
+        so no values can be added after.
+        """
+        self._write("[]" if len(self._index) == 0 else "]")
+        self._chunks.append(self._compressor.flush())
+        return base64.b64encode(b"".join(self._chunks)).decode()
+
+
+class CompactFigures:
+    """
+    Figures of compact report. Each figure is written as placeholder with json spec referencing
+    shared data, the shared data block and loader are written once after all figures.
+    Loader decompresses shared data with DecompressionStream and renders figure when its placeholder
+    gets close to viewport, so figures below the fold are not rendered on opening.
+    """
+
+    def __init__(self):
+        self.shared = SharedData()
+        self._n_figures = 0
+
+    def add(self, fragment: str) -> str:
+        """
+        Get html of figure.
+
+        Args:
+            fragment: Plotly json of figure, see serialize_figure.
+
+        Returns:
+            Placeholder div and json spec of figure.
+        """
+        figure = self.shared.extract(json.loads(fragment))
+        layout = figure["layout"]
+        style = f"height:{layout.get('height', DEFAULT_FIGURE_HEIGHT)}px;"
+        if "width" in layout:
+            style += f"width:{layout['width']}px;"
+        figure_id = f"figure-{self._n_figures}"
+        self._n_figures += 1
+        return (
+            f'<div class="compact-figure" id="{figure_id}" style="{style}"></div>\n'
+            f'<script type="application/json" id="{figure_id}-spec">'
+            f"{_script_json(figure)}</script>\n"
+        )
+
+    def footer(self) -> str:
+        """
+        Get html of shared data block and loader, it should follow all figures.
+        """
+        logger.info(
+            f"{self._n_figures} figures reference {len(self.shared)} shared values"
+        )
+        return (
+            '<script type="application/octet-stream" id="report-shared-data">'
+            f"{self.shared.encode()}</script>\n" + COMPACT_FIGURES_LOADER
+        )
@@ -0,0 +1,205 @@
+import logging
+from collections import deque
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from src.data.price_book import PriceBook
+
+logger = logging.getLogger(__name__)
+
+CORRECTED = "corrected"
+FIFO = "fifo"
+LIFO = "lifo"
+AVERAGE = "average"
+COST_BASIS_METHODS = [CORRECTED, FIFO, LIFO, AVERAGE]
+LOT_METHODS = [FIFO, LIFO, AVERAGE]
+SUMMARY_COLUMNS = [
+    "base_coin",
+    "quote_coin",
+    "average_price",
+    "n_purchases",
+    "n_sales",
+    "open_qty",
+    "open_cost",
+    "n_open_lots",
+    "realized_pnl",
+    "unrealized_pnl",
+]
+
+
+class CoinCostBasis:
+    """
+    Cost basis of single coin. Purchases open lots of (quantity, cost), sales close them:
+    the oldest lots first for FIFO, the newest first for LIFO. With average method
+    all purchases form one lot with average cost. Work per order is amortized O(1)
+    and memory is bounded by the number of open lots.
+    """
+
+    def __init__(self, method: str):
+        if method not in LOT_METHODS:
+            raise ValueError(f"method should be one of {LOT_METHODS}, got {method}")
+        self.method = method
+        self.lots = deque()  # [quantity, cost] of open lots, from the oldest
+        self.realized_pnl = 0.0
+        # sold quantity without open lots, i.e. deposited coins
+        self.unmatched_qty = 0.0
+        self.quote_coins = set()
+        self.n_purchases = 0
+        self.n_sales = 0
+
+    def buy(self, qty: float, cost: float):
+        self.n_purchases += 1
+        if self.method == AVERAGE and len(self.lots) > 0:
+            self.lots[0][0] += qty
+            self.lots[0][1] += cost
+        else:
+            self.lots.append([qty, cost])
+
+    def sell(self, qty: float, proceeds: float):
+        self.n_sales += 1
+        left = qty
+        matched_cost = 0.0
+        while left > 0 and len(self.lots) > 0:
+            lot = self.lots[-1] if self.method == LIFO else self.lots[0]
+            lot_qty, lot_cost = lot
+            if lot_qty <= left:
+                matched_cost += lot_cost
+                left -= lot_qty
+                if self.method == LIFO:
+                    self.lots.pop()
+                else:
+                    self.lots.popleft()
+            else:
+                part_cost = lot_cost * left / lot_qty
+                lot[0] -= left
+                lot[1] -= part_cost
+                matched_cost += part_cost
+                left = 0.0
+        matched_qty = qty - left
+        self.unmatched_qty += left
+        self.realized_pnl += proceeds * matched_qty / qty - matched_cost
+
+    @property
+    def open_qty(self) -> float:
+        return sum(lot[0] for lot in self.lots)
+
+    @property
+    def open_cost(self) -> float:
+        return sum(lot[1] for lot in self.lots)
+
+    def open_lots(self) -> pd.DataFrame:
+        lots = pd.DataFrame(list(self.lots), columns=["qty", "cost"])
+        lots["price"] = lots["cost"] / lots["qty"]
+        return lots
+
+
+class CostBasisEngine:
+    """
+    Stream orders sorted by time into cost basis of each coin and report realized and unrealized PnL.
+    """
+
+    def __init__(self, method: str = FIFO):
+        self.method = method
+        self._coins: Dict[str, CoinCostBasis] = {}
+
+    @property
+    def coins(self) -> List[str]:
+        return sorted(self._coins)
+
+    def process(
+        self, base_coin: str, quote_coin: str, side: str, qty: float, quote_qty: float
+    ):
+        """
+        Apply single order.
+
+        Args:
+            base_coin: Traded coin.
+            quote_coin: Coin of cost and proceeds.
+            side: BUY or SELL.
+            qty: Executed quantity of base coin.
+            quote_qty: Cumulative quote quantity of order.
+        """
+        coin = self._coins.get(base_coin)
+        if coin is None:
+            coin = self._coins[base_coin] = CoinCostBasis(self.method)
+        coin.quote_coins.add(quote_coin)
+        if qty <= 0:
+            return
+        if side == "BUY":
+            coin.buy(qty, quote_qty)
+        else:
+            coin.sell(qty, quote_qty)
+
+    def process_orders(self, orders: pd.DataFrame) -> "CostBasisEngine":
+        """
+        Apply orders in time order.
+
+        Args:
+            orders: Orders with columns ['time', 'base_coin', 'quote_coin', 'side', 'executedQty',
+                    'cummulativeQuoteQty'].
+        """
+        orders = orders.sort_values("time", kind="stable")
+        for order in zip(
+            orders["base_coin"].tolist(),
+            orders["quote_coin"].tolist(),
+            orders["side"].tolist(),
+            orders["executedQty"].tolist(),
+            orders["cummulativeQuoteQty"].tolist(),
+        ):
+            self.process(*order)
+        for base_coin, coin in self._coins.items():
+            if coin.unmatched_qty > 0:
+                logger.info(
+                    f"{coin.unmatched_qty} {base_coin} were sold without purchases, PnL is calculated for purchased coins"
+                )
+        return self
+
+    def open_lots(self, base_coin: str) -> pd.DataFrame:
+        """
+        Open lots of coin with columns ['qty', 'cost', 'price'], from the oldest.
+        """
+        return self._coins[base_coin].open_lots()
+
+    def summary(self, prices: PriceBook) -> pd.DataFrame:
+        """
+        Cost basis and PnL of each coin.
+
+        Args:
+            prices: Current prices for unrealized PnL.
+
+        Returns:
+            Table with SUMMARY_COLUMNS columns, average_price is average cost of open lots.
+
+        Raises:
+            ValueError: If coin was traded with several quote coins.
+        """
+        rows = []
+        for base_coin, coin in sorted(self._coins.items()):
+            if len(coin.quote_coins) > 1:
+                msg = (
+                    f"can calculate cost basis only with single quote_coin, "
+                    f"but for {base_coin} there is several: {sorted(coin.quote_coins)}"
+                )
+                raise ValueError(msg)
+            open_qty, open_cost = coin.open_qty, coin.open_cost
+            rows.append(
+                {
+                    "base_coin": base_coin,
+                    "quote_coin": next(iter(coin.quote_coins)),
+                    "average_price": open_cost / open_qty if open_qty > 0 else np.nan,
+                    "n_purchases": coin.n_purchases,
+                    "n_sales": coin.n_sales,
+                    "open_qty": open_qty,
+                    "open_cost": open_cost,
+                    "n_open_lots": len(coin.lots),
+                    "realized_pnl": coin.realized_pnl,
+                }
+            )
+        summary = pd.DataFrame(rows, columns=SUMMARY_COLUMNS[:-1])
+        current_prices = prices.lookup(summary["base_coin"], summary["quote_coin"])
+        summary["unrealized_pnl"] = (
+            summary["open_qty"] * current_prices - summary["open_cost"]
+        )
+        return summary
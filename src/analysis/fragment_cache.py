@@ -0,0 +1,140 @@
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+import pandas as pd
+import plotly
+
+from src.data.dump_data import DUMP_FOLDER
+
+logger = logging.getLogger(__name__)
+
+FRAGMENT_CACHE_FOLDER = DUMP_FOLDER / "fragments"
+FRAGMENT_CACHE_MAX_SIZE = 256 * 1024 * 1024
+FRAGMENT_SUFFIX = ".html"
+
+
+def _normalize_dates(
+    value: Union[pd.DataFrame, pd.Series],
+) -> Union[pd.DataFrame, pd.Series]:
+    """
+    Cast datetimes to nanoseconds, equal dates of different resolution have different hashes otherwise.
+    """
+    if isinstance(value, pd.Series):
+        return _normalize_dates(value.to_frame()).iloc[:, 0]
+    dates = value.select_dtypes(include="datetime").columns
+    if len(dates) == 0:
+        return value
+    return value.astype({col: "datetime64[ns]" for col in dates})
+
+
+def fragment_key(*inputs) -> str:
+    """
+    Content hash of figure inputs. Tables are hashed by their columns and values,
+    other inputs, i.e. layout settings and price day, by their repr. Plotly version is
+    part of key, so fragments are rendered again after upgrade.
+    """
+    digest = hashlib.sha256(plotly.__version__.encode())
+    for value in inputs:
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            if isinstance(value, pd.DataFrame):
+                digest.update(repr(list(value.columns)).encode())
+            hashes = pd.util.hash_pandas_object(_normalize_dates(value), index=False)
+            digest.update(hashes.to_numpy().tobytes())
+        else:
+            digest.update(repr(value).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class FragmentCache:
+    """
+    On-disk cache of serialized report fragments addressed by hash of their inputs.
+    Reading fragment updates its modification time, so when total size exceeds the limit
+    the least recently used fragments are removed. Binary fragments, i.e. images, are kept
+    with get_bytes and put_bytes.
+    """
+
+    def __init__(
+        self,
+        folder: Path = FRAGMENT_CACHE_FOLDER,
+        max_size_bytes: int = FRAGMENT_CACHE_MAX_SIZE,
+        suffix: str = FRAGMENT_SUFFIX,
+    ):
+        self.folder = folder
+        self.max_size_bytes = max_size_bytes
+        self.suffix = suffix
+
+    def _fpath(self, key: str) -> Path:
+        return self.folder / f"{key}{self.suffix}"
+
+    def __contains__(self, key: str) -> bool:
+        return self._fpath(key).exists()
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        fpath = self._fpath(key)
+        try:
+            with open(fpath, "rb") as f:
+                data = f.read()
+            os.utime(fpath)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put_bytes(self, key: str, data: bytes):
+        """
+        Save fragment and evict the least recently used ones if cache is too large.
+        File is written to temporary path and renamed, so readers never see partial fragment.
+        """
+        self.folder.mkdir(exist_ok=True, parents=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._fpath(key))
+        self.evict()
+
+    def get(self, key: str) -> Optional[str]:
+        data = self.get_bytes(key)
+        if data is None:
+            return None
+        return data.decode("utf-8")
+
+    def put(self, key: str, fragment: str):
+        self.put_bytes(key, fragment.encode("utf-8"))
+
+    def evict(self):
+        files = []
+        for fpath in self.folder.glob(f"*{self.suffix}"):
+            try:
+                stat = fpath.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, fpath))
+        total_size = sum(size for _, size, _ in files)
+        n_removed = 0
+        for _, size, fpath in sorted(files, key=lambda file: file[0]):
+            if total_size <= self.max_size_bytes:
+                break
+            fpath.unlink(missing_ok=True)
+            total_size -= size
+            n_removed += 1
+        if n_removed > 0:
+            logger.info(f"{n_removed} fragments were evicted from cache {self.folder}")
+
+
+def cached_fragment(
+    cache: Optional[FragmentCache], key: str, render: Callable[[], str]
+) -> str:
+    """
+    Get fragment from cache or render and save it. Fragment is always rendered if cache is None.
+    """
+    if cache is None:
+        return render()
+    fragment = cache.get(key)
+    if fragment is None:
+        fragment = render()
+        cache.put(key, fragment)
+    return fragment
@@ -1,67 +1,333 @@
+import asyncio
 import logging
 import time
 import webbrowser
+from dataclasses import dataclass
 from datetime import datetime
+from functools import partial
+from pathlib import Path
+from typing import Iterable, List, Optional, Union
 
+import pandas as pd
 
-from src.analysis.analyse import (OrdersAnalyser, generate_asset_table)
+from src.analysis.analyse import OrdersAnalyser, generate_asset_table
+from src.analysis.compact_report import serialize_figure
+from src.analysis.cost_basis import CORRECTED
+from src.analysis.fragment_cache import (FragmentCache, cached_fragment,
+                                         fragment_key)
+from src.analysis.image_export import get_image_exporter
+from src.analysis.orders_state import OrdersState
+from src.analysis.report_pipeline import REPORT_WORKERS, ReportPipeline
+from src.analysis.report_writer import HtmlReportWriter
+from src.client.async_client import (AsyncClientHelper,
+                                     PrefetchedClientHelper,
+                                     gather_cancel_on_error)
 from src.client.client import ClientHelper
+from src.client.recorder import TransportRecorder
 from src.constants import remove_from_plots
 from src.data.dump_data import DATA_FOLDER, dump_orders_data
-from src.data.orders_handler import load_and_process
+from src.data.price_book import PriceBook
 from src.data.preprocessing.orders import OrdersProcessor
-from src.utils.utils import get_html_body_from_plotly_figure
+from src.data.prices import (PRICES_INTERVAL, START_PRICES_DATE,
+                             get_price_symbols)
+from src.utils.utils import get_plotlyjs_script
 
 logger = logging.getLogger(__name__)
 
 REPORT_FOLDER = DATA_FOLDER / "html_reports"
+SUMMARY_IMAGES_FOLDER = DATA_FOLDER / "summary_images"
+HTML_REPORT = "html"
+SUMMARY_IMAGES = "summary_images"
+REPORT_MODES = [HTML_REPORT, SUMMARY_IMAGES]
 
 
-def make_report(api_key: str, api_secret: str, open_file: bool):
+@dataclass
+class ReportData:
+    orders: pd.DataFrame
+    current_prices: PriceBook
+    client_helper: PrefetchedClientHelper
+
+
+def make_report(
+    api_key: str,
+    api_secret: str,
+    open_file: bool,
+    recorder: Optional[TransportRecorder] = None,
+    incremental: bool = False,
+    cost_basis_method: str = CORRECTED,
+    workers: int = REPORT_WORKERS,
+    use_cache: bool = True,
+    compact: bool = False,
+    inline_plotlyjs: bool = False,
+    compress: bool = False,
+    mode: str = HTML_REPORT,
+    image_format: str = "png",
+):
     start = time.time()
-    client_helper = ClientHelper(api_key, api_secret)
+    client_helper = ClientHelper(api_key, api_secret, recorder=recorder)
     current_prices = client_helper.query_prices()
+    orders = client_helper.load_orders(incremental=incremental)
+
+    fpath = build_report(
+        client_helper,
+        orders,
+        current_prices,
+        open_file=open_file,
+        orders_state=get_orders_state(api_key, incremental, recorder),
+        cost_basis_method=cost_basis_method,
+        workers=workers,
+        fragment_cache=FragmentCache() if use_cache else None,
+        compact=compact,
+        inline_plotlyjs=inline_plotlyjs,
+        compress=compress,
+        mode=mode,
+        image_format=image_format,
+    )
+    end = time.time()
+    logger.info(f"HTML report executed for {round(end - start)} seconds")
+
+    return fpath
+
+
+def get_orders_state(
+    api_key: str, incremental: bool, recorder: Optional[TransportRecorder] = None
+) -> Optional[OrdersState]:
+    """
+    Get persisted orders state for incremental report. Recorded session keeps state in state folder of recorder,
+    so persisted state is not changed by recorded or replayed orders.
+    """
+    if not incremental:
+        return None
+    if recorder is not None:
+        return OrdersState(api_key, recorder.state_folder / "orders_state")
+    return OrdersState(api_key)
+
+
+async def fetch_report_data(
+    async_helper: AsyncClientHelper, **load_orders_kwargs
+) -> ReportData:
+    """
+    Fetch all data of report concurrently: orders, current prices, daily prices of coins and
+    minute klines for prices of coin-to-coin orders, which are queried as soon as orders are loaded.
+
+    Args:
+        async_helper: Client for queries.
+        load_orders_kwargs: Arguments of load_orders.
+
+    Returns:
+        ReportData with client serving prefetched klines, so report is built without requests.
+    """
+    coins = async_helper.currency_items
+    # daily prices of portfolio history and transactions figures, see get_prices and ReportPipeline
+    daily_symbols = set(get_price_symbols(coins).values())
+    daily_symbols.update(c + "USDT" for c in coins if c not in remove_from_plots)
+    prefetched = PrefetchedClientHelper(coins)
+
+    async def load_orders() -> pd.DataFrame:
+        orders = await async_helper.load_orders(**load_orders_kwargs)
+        await async_helper.prefetch_klines(
+            OrdersProcessor(prefetched).klines_requests(orders), prefetched
+        )
+        return orders
+
+    orders, current_prices, _ = await gather_cancel_on_error(
+        load_orders(),
+        async_helper.query_prices(),
+        async_helper.prefetch_klines(
+            [
+                (symbol, PRICES_INTERVAL, START_PRICES_DATE, None)
+                for symbol in sorted(daily_symbols)
+            ],
+            prefetched,
+        ),
+    )
+    return ReportData(orders, current_prices, prefetched)
+
+
+async def make_report_async(
+    api_key: str,
+    api_secret: str,
+    open_file: bool = False,
+    recorder: Optional[TransportRecorder] = None,
+    incremental: bool = False,
+    cost_basis_method: str = CORRECTED,
+    workers: int = REPORT_WORKERS,
+    use_cache: bool = True,
+    compact: bool = False,
+    inline_plotlyjs: bool = False,
+    compress: bool = False,
+    mode: str = HTML_REPORT,
+    image_format: str = "png",
+):
+    """
+    Make report without blocking event loop. All data of report is fetched concurrently
+    with AsyncClientHelper, then report is built from it in executor without requests.
+    """
+    start = time.time()
+    async with await AsyncClientHelper.create(
+        api_key, api_secret, recorder=recorder
+    ) as async_helper:
+        report_data = await fetch_report_data(async_helper, incremental=incremental)
+
+    loop = asyncio.get_running_loop()
+    orders_state = await loop.run_in_executor(
+        None, get_orders_state, api_key, incremental, recorder
+    )
+    fpath = await loop.run_in_executor(
+        None,
+        partial(
+            build_report,
+            report_data.client_helper,
+            report_data.orders,
+            report_data.current_prices,
+            open_file=open_file,
+            orders_state=orders_state,
+            cost_basis_method=cost_basis_method,
+            workers=workers,
+            fragment_cache=FragmentCache() if use_cache else None,
+            compact=compact,
+            inline_plotlyjs=inline_plotlyjs,
+            compress=compress,
+            mode=mode,
+            image_format=image_format,
+        ),
+    )
+    end = time.time()
+    logger.info(f"HTML report executed for {round(end - start)} seconds")
+
+    return fpath
+
+
+def build_report(
+    client_helper: Union[ClientHelper, PrefetchedClientHelper],
+    orders: pd.DataFrame,
+    current_prices: PriceBook,
+    open_file: bool = False,
+    orders_state: Optional[OrdersState] = None,
+    cost_basis_method: str = CORRECTED,
+    workers: int = REPORT_WORKERS,
+    fragment_cache: Optional[FragmentCache] = None,
+    compact: bool = False,
+    inline_plotlyjs: bool = False,
+    compress: bool = False,
+    mode: str = HTML_REPORT,
+    image_format: str = "png",
+) -> Union[Path, List[Path]]:
+    """
+    Process loaded orders and generate html report.
+
+    Args:
+        client_helper: Client for klines of prices, PrefetchedClientHelper builds report without requests.
+        orders: Raw orders from load_orders.
+        current_prices: Prices from query_prices.
+        open_file: Open report after creating.
+        orders_state: Persisted orders state for incremental aggregates.
+        cost_basis_method: Method of average purchase price, see generate_asset_table.
+        workers: Number of workers for fetching data and rendering figures of coins.
+        fragment_cache: Cache of rendered figures, figures with unchanged inputs are not rendered again.
+        compact: Write compact report, see generate_html_report.
+        inline_plotlyjs: Embed plotly.js into report.
+        compress: Write gzip compressed report.
+        mode: HTML_REPORT or SUMMARY_IMAGES for sending to chat, see generate_summary_images.
+        image_format: Format of summary images, one of IMAGE_FORMATS.
+
+    Returns:
+        Path to html report or paths to summary images.
+    """
+    if mode not in REPORT_MODES:
+        raise ValueError(f"mode should be one of {REPORT_MODES}, got {mode}")
+    # summary images are exported from plotly json
+    compact = compact or mode == SUMMARY_IMAGES
 
     orders_processor = OrdersProcessor(client_helper=client_helper)
-    orders = load_and_process(client_helper, orders_processor)
+    orders = orders_processor.transform(orders)
     dump_orders_data(orders)
 
-    order_analyser = OrdersAnalyser(client_helper, orders)
+    order_analyser = OrdersAnalyser(client_helper, orders, state=orders_state)
+    if orders_state is not None:
+        orders_state.dump()
 
-    portfolio_fig = order_analyser.plot_asset_usdt_composition(current_prices)
+    portfolio_fragment = serialize_figure(
+        order_analyser.plot_asset_usdt_composition(current_prices), compact
+    )
 
-    asset_df = generate_asset_table(order_analyser, current_prices)
+    asset_df = generate_asset_table(
+        order_analyser, current_prices, cost_basis_method=cost_basis_method
+    )
 
-    history_assets = order_analyser.prepare_coins_asset_history()
-    asset_history_long_fig = order_analyser.plot_full_asset_history(history_assets)
+    # daily prices of asset history are queried once a day, like in prepare_portfolio_history
+    asset_history_key = fragment_key(
+        "asset_history",
+        order_analyser.orders[
+            ["date", "base_coin", "side", "executedQty", "cummulativeQuoteQty"]
+        ],
+        datetime.today().strftime("%Y-%m-%d"),
+        order_analyser.width,
+        order_analyser.height,
+        compact,
+    )
+    asset_history_fragment = cached_fragment(
+        fragment_cache,
+        asset_history_key,
+        lambda: serialize_figure(
+            order_analyser.plot_portfolio_history(
+                order_analyser.prepare_portfolio_history()
+            ),
+            compact,
+        ),
+    )
 
     coins = asset_df["base_coin"]
     coins = [c for c in coins if c not in remove_from_plots]
-    transactions_plots_dict = order_analyser.plot_transactions_many(coins)
-    transactions_plots_html = ""
-    for coin, fig in transactions_plots_dict.items():
-        transactions_plots_html += get_html_body_from_plotly_figure(fig)
+    pipeline = ReportPipeline(
+        client_helper, workers=workers, cache=fragment_cache, compact=compact
+    )
+    transactions_fragments = pipeline.iter_transactions(order_analyser, coins)
 
-    fpath = generate_html_report(
+    if mode == SUMMARY_IMAGES:
+        return generate_summary_images(
+            portfolio_fragment,
+            asset_history_fragment,
+            transactions_fragments,
+            coins,
+            image_format=image_format,
+        )
+    return generate_html_report(
         asset_df,
-        portfolio_fig,
-        asset_history_long_fig,
-        transactions_plots_html,
+        portfolio_fragment,
+        asset_history_fragment,
+        transactions_fragments,
         open_file=open_file,
+        compact=compact,
+        inline_plotlyjs=inline_plotlyjs,
+        compress=compress,
     )
-    end = time.time()
-    logger.info(f"HTML report executed for {round(end - start)} seconds")
-
-    return fpath
 
 
 def generate_html_report(
     mean_price,
-    portfolio_fig,
-    asset_history_long_fig,
-    transactions_plots_html,
-    open_file=False,
+    portfolio_fragment: str,
+    asset_history_fragment: str,
+    transactions_fragments: Iterable[str],
+    open_file: bool = False,
+    compact: bool = False,
+    inline_plotlyjs: bool = False,
+    compress: bool = False,
 ):
+    """
+    Write html report of rendered figures. Report is streamed to file, transactions fragments
+    are written one by one as they are produced.
+
+    Args:
+        mean_price: Asset table.
+        portfolio_fragment: Asset composition figure, see serialize_figure.
+        asset_history_fragment: Asset history figure.
+        transactions_fragments: Transactions figures of coins, i.e. ReportPipeline.iter_transactions.
+        open_file: Open report after creating.
+        compact: Fragments are plotly json, which are written as compact figures with shared data.
+        inline_plotlyjs: Embed plotly.js into report, so it can be opened offline.
+        compress: Write gzip compressed report.
+    """
     now_datetime = datetime.now()
 
     mean_price_table = (
@@ -73,50 +339,26 @@ def generate_html_report(
         )
     )  # use bootstrap styling
 
-    html_string = (
-        """
-    <html>
-        <head>
-            <link rel="stylesheet" href="https://maxcdn.bootstrapcdn.com/bootstrap/3.3.1/css/bootstrap.min.css">
-            <style>body{ margin:0 100; background:white; }</style>
-            <script type="text/javascript" src="https://cdn.plot.ly/plotly-latest.min.js"></script></head>
-        </head>
-        <body>
-            <h1>Binance profile report at """
-        + now_datetime.strftime("%Y-%m-%d %H:%M")
-        + """</h1>
-
-            <h2>Section 1: Asset composition</h2>
-            """
-        + get_html_body_from_plotly_figure(portfolio_fig)
-        + """
-            """
-        + get_html_body_from_plotly_figure(asset_history_long_fig)
-        + """
-            """
-        + ""
-        + """
-
-            <h2>Section 2: Analysis of purchases</h2>
-
-            <h3>Average purchase price and benefits compared to current price</h3>
-            """
-        + mean_price_table
-        + """
-            <h3>Transactions history</h3>
-            """
-        + transactions_plots_html
-        + """
-
-        </body>
-    </html>"""
-    )
-
     now_time = now_datetime.strftime("%Y-%m-%d_%Hh%Mm")
-    REPORT_FOLDER.mkdir(exist_ok=True, parents=True)
-    fpath = REPORT_FOLDER / f"{now_time}.html"
-    with open(fpath, "w") as f:
-        f.write(html_string)
+    suffix = ".html.gz" if compress else ".html"
+    fpath = REPORT_FOLDER / f"{now_time}{suffix}"
+    with HtmlReportWriter(fpath, compact=compact) as writer:
+        writer.write_head(
+            get_plotlyjs_script(inline_plotlyjs),
+            "Binance profile report at " + now_datetime.strftime("%Y-%m-%d %H:%M"),
+        )
+        writer.write_heading("Section 1: Asset composition")
+        writer.write_figure(portfolio_fragment)
+        writer.write_figure(asset_history_fragment)
+
+        writer.write_heading("Section 2: Analysis of purchases")
+        writer.write_heading(
+            "Average purchase price and benefits compared to current price", level=3
+        )
+        writer.write(mean_price_table)
+        writer.write_heading("Transactions history", level=3)
+        for fragment in transactions_fragments:
+            writer.write_figure(fragment)
     logger.info(f"Report was saved at: {fpath}")
 
     if open_file:
@@ -124,3 +366,40 @@ def generate_html_report(
         webbrowser.open(url, new=2)
 
     return fpath
+
+
+def generate_summary_images(
+    portfolio_fragment: str,
+    asset_history_fragment: str,
+    transactions_fragments: Iterable[str],
+    coins: List[str],
+    image_format: str = "png",
+) -> List[Path]:
+    """
+    Export report figures to images for sending to chat. Figures are exported in parallel,
+    see ImageExporter.
+
+    Args:
+        portfolio_fragment: Plotly json of asset composition figure.
+        asset_history_fragment: Plotly json of asset history figure.
+        transactions_fragments: Plotly json of transactions figures of coins.
+        coins: Coins of transactions figures.
+        image_format: One of IMAGE_FORMATS.
+
+    Returns:
+        Paths to images in the order of report figures.
+    """
+    names = ["portfolio", "asset_history"] + [f"transactions_{coin}" for coin in coins]
+    figures = [portfolio_fragment, asset_history_fragment, *transactions_fragments]
+    images = get_image_exporter().export_many(figures, image_format)
+
+    folder = SUMMARY_IMAGES_FOLDER / datetime.now().strftime("%Y-%m-%d_%Hh%Mm")
+    folder.mkdir(exist_ok=True, parents=True)
+    fpaths = []
+    for i, (name, image) in enumerate(zip(names, images)):
+        fpath = folder / f"{i:02d}_{name}.{image_format}"
+        with open(fpath, "wb") as f:
+            f.write(image)
+        fpaths.append(fpath)
+    logger.info(f"{len(fpaths)} summary images were saved at: {folder}")
+    return fpaths
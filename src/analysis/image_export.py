@@ -0,0 +1,175 @@
+import atexit
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Union
+
+from src.analysis.fragment_cache import FragmentCache, fragment_key
+from src.data.dump_data import DUMP_FOLDER
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FORMATS = ["png", "svg", "webp"]
+IMAGE_EXPORT_WORKERS = 4
+IMAGE_CACHE_FOLDER = DUMP_FOLDER / "images"
+IMAGE_CACHE_MAX_SIZE = 256 * 1024 * 1024
+IMAGE_CACHE_SUFFIX = ".img"
+
+_default_exporter: Optional["ImageExporter"] = None
+_default_exporter_lock = threading.Lock()
+
+
+def _figure_json(fig: Union[str, Dict[str, Any], Any]) -> str:
+    if isinstance(fig, str):
+        return fig
+    if isinstance(fig, dict):
+        return json.dumps(fig)
+    return fig.to_json()
+
+
+class ImageExporter:
+    """
+    Export plotly figures to static images with pool of kaleido processes.
+    Each worker thread starts its own kaleido process on its first figure, so there is no startup cost
+    until images are exported, and several figures are converted in parallel.
+    Images are cached by hash of figure json and export settings.
+    """
+
+    def __init__(
+        self,
+        workers: int = IMAGE_EXPORT_WORKERS,
+        cache: Optional[FragmentCache] = None,
+    ):
+        """
+        Args:
+            workers: Number of kaleido processes.
+            cache: Cache of exported images, i.e. FragmentCache with IMAGE_CACHE_SUFFIX.
+        """
+        self.workers = workers
+        self.cache = cache
+        self._local = threading.local()
+        self._scopes = []
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="kaleido"
+                )
+            return self._pool
+
+    def _get_scope(self):
+        scope = getattr(self._local, "scope", None)
+        if scope is None:
+            from kaleido.scopes.plotly import PlotlyScope
+
+            scope = self._local.scope = PlotlyScope()
+            with self._lock:
+                self._scopes.append(scope)
+        return scope
+
+    def _transform(
+        self,
+        figure_json: str,
+        image_format: str,
+        width: Optional[int],
+        height: Optional[int],
+        scale: float,
+    ) -> bytes:
+        return self._get_scope().transform(
+            json.loads(figure_json),
+            format=image_format,
+            width=width,
+            height=height,
+            scale=scale,
+        )
+
+    def export_many(
+        self,
+        figs: List[Union[str, Dict[str, Any], Any]],
+        image_format: str = "png",
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        scale: float = 1,
+    ) -> List[bytes]:
+        """
+        Export figures to images.
+
+        Args:
+            figs: Plotly figures, figure dicts or json, see serialize_figure.
+            image_format: One of IMAGE_FORMATS.
+            width: Image width in layout pixels, figure layout width if None.
+            height: Image height in layout pixels, figure layout height if None.
+            scale: Factor of image resolution.
+
+        Returns:
+            Images in the order of figures.
+        """
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(
+                f"image_format should be one of {IMAGE_FORMATS}, got {image_format}"
+            )
+        figures_json = [_figure_json(fig) for fig in figs]
+        settings = (image_format, width, height, scale)
+        keys = [fragment_key("image", figure, *settings) for figure in figures_json]
+
+        images: List[Optional[bytes]] = [None] * len(figs)
+        if self.cache is not None:
+            images = [self.cache.get_bytes(key) for key in keys]
+        missing = [i for i, image in enumerate(images) if image is None]
+        if len(missing) > 0:
+            pool = self._get_pool()
+            exports = {
+                i: pool.submit(self._transform, figures_json[i], *settings)
+                for i in missing
+            }
+            for i, export in exports.items():
+                images[i] = export.result()
+                if self.cache is not None:
+                    self.cache.put_bytes(keys[i], images[i])
+        logger.info(
+            f"{len(figs)} figures were exported to {image_format}, "
+            f"{len(figs) - len(missing)} of them were taken from cache"
+        )
+        return images
+
+    def export(
+        self,
+        fig,
+        image_format: str = "png",
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        scale: float = 1,
+    ) -> bytes:
+        return self.export_many([fig], image_format, width, height, scale)[0]
+
+    def close(self):
+        """
+        Stop worker threads and kaleido processes.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+            scopes, self._scopes = self._scopes, []
+        if pool is not None:
+            pool.shutdown()
+        for scope in scopes:
+            scope._shutdown_kaleido()
+
+
+def get_image_exporter() -> ImageExporter:
+    """
+    Shared exporter of process with on-disk image cache, it is created on the first call.
+    """
+    global _default_exporter
+    with _default_exporter_lock:
+        if _default_exporter is None:
+            _default_exporter = ImageExporter(
+                cache=FragmentCache(
+                    IMAGE_CACHE_FOLDER, IMAGE_CACHE_MAX_SIZE, suffix=IMAGE_CACHE_SUFFIX
+                )
+            )
+            atexit.register(_default_exporter.close)
+        return _default_exporter
@@ -0,0 +1,263 @@
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.client.order_sync import get_account_id
+from src.data.dump_data import DUMP_FOLDER
+
+logger = logging.getLogger(__name__)
+
+ORDERS_STATE_FOLDER = DUMP_FOLDER / "orders_state"
+AGGREGATES_COLUMNS = [
+    "base_coin",
+    "quote_coin",
+    "average_price",
+    "n_purchases",
+    "n_sales",
+    "executedCorrectedQty",
+    "cash_in",
+    "cash_out",
+]
+
+
+KEY_COLUMNS = ["symbol", "orderId", "side", "updateTime"]
+
+
+def order_keys(orders: pd.DataFrame) -> np.ndarray:
+    """
+    64-bit hash of each order version. Both legs of divided coin-to-coin order have the same orderId,
+    so symbol and side are part of key. updateTime is part of key, so order which was open
+    and is updated later, i.e. filled, gets new key.
+    """
+    return pd.util.hash_pandas_object(orders[KEY_COLUMNS], index=False).to_numpy()
+
+
+def new_coin_state() -> Dict[str, Any]:
+    return {
+        "quote_coins": [],
+        "corrected_qty": 0.0,  # sum of executedCorrectedQty of buy orders
+        "weighted_price_sum": 0.0,  # sum of price * executedCorrectedQty of buy orders
+        "buy_coins_value": 0.0,  # coins bought for quote amounts of purchases at their prices
+        "cash_in": 0.0,
+        "cash_out": 0.0,
+        "n_purchases": 0,
+        "n_sales": 0,
+        "last_time": None,
+    }
+
+
+def apply_pair_orders(state: Dict[str, Any], pair_orders: pd.DataFrame):
+    """
+    Update state of coin with its new orders sorted by time, like calculate_corrected_balance_for_pair does.
+    Sale multiplies corrected quantity of all previous purchases by the same ratio,
+    so sums of corrected quantities and of their prices are multiplied by it too.
+    """
+    for side, qty, quote_qty, price in zip(
+        pair_orders["side"].tolist(),
+        pair_orders["executedQty"].tolist(),
+        pair_orders["cummulativeQuoteQty"].tolist(),
+        pair_orders["price"].tolist(),
+    ):
+        if side == "BUY":
+            state["corrected_qty"] += qty
+            state["weighted_price_sum"] += price * qty
+            state["buy_coins_value"] += quote_qty / price
+            state["cash_in"] += quote_qty
+            state["n_purchases"] += 1
+            continue
+        if state["corrected_qty"] == 0:
+            raise ValueError(
+                "Bad balance error, looks like not all orders are listed. There are no coins available for selling"
+            )
+        ratio = 1 - quote_qty / (price * state["buy_coins_value"])
+        state["corrected_qty"] *= ratio
+        state["weighted_price_sum"] *= ratio
+        state["cash_out"] += quote_qty
+        state["n_sales"] += 1
+
+    quote_coins = set(state["quote_coins"]) | set(pair_orders["quote_coin"])
+    state["quote_coins"] = sorted(quote_coins)
+    state["last_time"] = int(pair_orders["time"].max())
+
+
+class OrdersState:
+    """
+    Aggregates of account orders per base coin, which are updated with new orders without replaying history.
+    Each coin keeps corrected quantity of purchases, sums for average purchase price, cash in and out and
+    orders counts. Orders are expected to be filtered like in OrdersAnalyser: only filled and with BUSD
+    replaced by USDT.
+    Sorted keys of seen orders are kept in .npy file next to aggregates. New orders are selected by vectorized
+    lookup of their keys, and only them are filtered and applied, so sync costs time proportional to the new orders.
+    """
+
+    def __init__(self, api_key: str, folder: Path = ORDERS_STATE_FOLDER):
+        self.fpath = folder / f"{get_account_id(api_key)}.json"
+        self.keys_fpath = folder / f"{get_account_id(api_key)}_keys.npy"
+        self._coins: Dict[str, Dict[str, Any]] = {}
+        self._keys = np.empty(0, dtype=np.uint64)
+        self._lock = threading.Lock()
+        if self.fpath.exists() and self.keys_fpath.exists():
+            with open(self.fpath) as f:
+                self._coins = json.load(f)["coins"]
+            self._keys = np.load(self.keys_fpath)
+        elif self.fpath.exists():
+            logger.info(f"Orders state without keys of orders is rebuilt: {self.fpath}")
+
+    def dump(self):
+        self.fpath.parent.mkdir(exist_ok=True, parents=True)
+        with self._lock:
+            with open(self.fpath, "w") as f:
+                json.dump({"coins": self._coins}, f)
+            np.save(self.keys_fpath, self._keys)
+        logger.info(f"Orders state was saved: {self.fpath}")
+
+    @property
+    def coins(self) -> List[str]:
+        return sorted(self._coins)
+
+    def new_orders(self, orders: pd.DataFrame) -> pd.DataFrame:
+        """
+        Select orders which were not seen yet. Orders may be raw, i.e. not filtered.
+        """
+        with self._lock:
+            keys = self._keys
+        return orders[~np.isin(order_keys(orders), keys)]
+
+    def _add_keys(self, orders: pd.DataFrame):
+        with self._lock:
+            self._keys = np.union1d(self._keys, order_keys(orders))
+
+    def append(self, orders: pd.DataFrame) -> int:
+        """
+        Apply new orders, orders which were already seen are skipped.
+
+        Args:
+            orders: Filtered orders with columns ['time', 'updateTime', 'symbol', 'orderId', 'side', 'base_coin',
+                    'quote_coin', 'price', 'executedQty', 'cummulativeQuoteQty'].
+
+        Returns:
+            Number of applied orders.
+
+        Raises:
+            ValueError: If order is older than the last applied order of its coin, coin should be rebuilt.
+        """
+        orders = self.new_orders(orders).sort_values("time", kind="stable")
+        with self._lock:
+            for base_coin, pair_orders in orders.groupby("base_coin", observed=True):
+                last_time = self._coins.get(base_coin, {}).get("last_time")
+                if last_time is not None and pair_orders["time"].min() < last_time:
+                    raise ValueError(
+                        f"Orders of {base_coin} are older than applied ones, coin should be rebuilt"
+                    )
+            for base_coin, pair_orders in orders.groupby("base_coin", observed=True):
+                apply_pair_orders(
+                    self._coins.setdefault(base_coin, new_coin_state()), pair_orders
+                )
+        self._add_keys(orders)
+        if len(orders) > 0:
+            logger.info(f"{len(orders)} new orders were applied to orders state")
+        return len(orders)
+
+    def rebuild(self, orders: pd.DataFrame, coins: List[str] = None):
+        """
+        Apply all orders of coins from scratch.
+
+        Args:
+            orders: All filtered orders of account.
+            coins: Coins for rebuilding, all coins of orders if None.
+        """
+        if coins is None:
+            coins = orders["base_coin"].unique()
+        orders = orders[orders["base_coin"].isin(coins)]
+        orders = orders.sort_values("time", kind="stable")
+        with self._lock:
+            for base_coin in coins:
+                self._coins.pop(base_coin, None)
+            for base_coin, pair_orders in orders.groupby("base_coin", observed=True):
+                state = new_coin_state()
+                apply_pair_orders(state, pair_orders)
+                self._coins[base_coin] = state
+        self._add_keys(orders)
+        logger.info(f"Orders state of {len(coins)} coins was rebuilt")
+
+    def sync(
+        self,
+        orders: pd.DataFrame,
+        filter_orders: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+    ) -> int:
+        """
+        Bring state up to date with all orders of account. New orders are applied incrementally,
+        coins with new orders older than applied ones are rebuilt.
+
+        Args:
+            orders: All orders of account.
+            filter_orders: Filter of raw orders, i.e. OrdersAnalyser.filter_orders. It is applied to new orders
+                           and to orders of rebuilt coins only. Orders should be filtered already if None.
+
+        Returns:
+            Number of new orders.
+        """
+        seen_orders = self.new_orders(orders)
+        orders_new = seen_orders
+        if filter_orders is not None:
+            orders_new = filter_orders(orders_new)
+        with self._lock:
+            last_times = {c: state["last_time"] for c, state in self._coins.items()}
+        first_new_times = orders_new.groupby("base_coin", observed=True)["time"].min()
+        stale_coins = [
+            coin
+            for coin, first_time in first_new_times.items()
+            if last_times.get(coin) is not None and first_time < last_times[coin]
+        ]
+        if len(stale_coins) > 0:
+            stale_orders = orders[orders["base_coin"].isin(stale_coins)]
+            if filter_orders is not None:
+                stale_orders = filter_orders(stale_orders)
+            self.rebuild(stale_orders, stale_coins)
+        self.append(orders_new[~orders_new["base_coin"].isin(stale_coins)])
+        # filtered out orders are not checked again until they are updated
+        self._add_keys(seen_orders)
+        return len(orders_new)
+
+    def aggregates(self) -> pd.DataFrame:
+        """
+        Current aggregates of coins.
+
+        Returns:
+            Table with AGGREGATES_COLUMNS columns. average_price is weighted by executedCorrectedQty.
+
+        Raises:
+            ValueError: If coin was traded with several quote coins.
+        """
+        rows = []
+        with self._lock:
+            for base_coin, state in sorted(self._coins.items()):
+                if len(state["quote_coins"]) > 1:
+                    msg = (
+                        f"can calculate average purchase price only with single quote_coin, "
+                        f"but for {base_coin} there is several: {state['quote_coins']}"
+                    )
+                    raise ValueError(msg)
+                corrected_qty = state["corrected_qty"]
+                rows.append(
+                    {
+                        "base_coin": base_coin,
+                        "quote_coin": state["quote_coins"][0],
+                        "average_price": (
+                            state["weighted_price_sum"] / corrected_qty
+                            if corrected_qty != 0
+                            else float("nan")
+                        ),
+                        "n_purchases": state["n_purchases"],
+                        "n_sales": state["n_sales"],
+                        "executedCorrectedQty": corrected_qty,
+                        "cash_in": state["cash_in"],
+                        "cash_out": state["cash_out"],
+                    }
+                )
+        return pd.DataFrame(rows, columns=AGGREGATES_COLUMNS)
@@ -0,0 +1,162 @@
+import logging
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.constants import time_col
+
+logger = logging.getLogger(__name__)
+
+DAY = pd.Timedelta("1 day")
+
+
+class PortfolioHistory:
+    """
+    Daily history of all coins of portfolio kept as dense (days x coins) matrices.
+    Holdings and cash invested are cumulative sums of daily order transfers,
+    usdt value is holdings multiplied by aligned matrix of daily prices.
+    Row of day contains state after orders of that day.
+    """
+
+    def __init__(
+        self,
+        dates: pd.DatetimeIndex,
+        coins: List[str],
+        holdings: np.ndarray,
+        cash: np.ndarray,
+        prices: np.ndarray,
+        first_days: np.ndarray,
+    ):
+        """
+        Args:
+            dates: Days of history.
+            coins: Base coins, columns of matrices.
+            holdings: Coins quantity.
+            cash: Usdt cash invested into coins.
+            prices: Usdt prices of coins, NaN if price is not available.
+            first_days: Index of day with the first order of each coin.
+        """
+        self.dates = dates
+        self.coins = coins
+        self.holdings = holdings
+        self.cash = cash
+        self.prices = prices
+        self.values = holdings * prices
+        self.first_days = first_days
+        self._coin_idx = {coin: i for i, coin in enumerate(coins)}
+
+    @classmethod
+    def from_orders(
+        cls, orders: pd.DataFrame, prices: pd.DataFrame
+    ) -> "PortfolioHistory":
+        """
+        Build portfolio history from orders and daily prices.
+
+        Args:
+            orders: Orders with columns ['date', 'base_coin', 'side', 'executedQty', 'cummulativeQuoteQty'].
+            prices: Table with date column and column of close prices per coin, i.e. from get_prices.
+        """
+        coin_codes, coins = pd.factorize(orders["base_coin"], sort=True)
+        order_dates = pd.DatetimeIndex(orders[time_col])
+        # order belongs to the day of its time, orders made at midnight belong to the previous day
+        order_days = order_dates.ceil("D") - DAY
+        start = order_days.min()
+        end = max(
+            order_days.max(), pd.Timestamp(datetime.today().strftime("%Y-%m-%d")) - DAY
+        )
+        dates = pd.date_range(start, end, freq="D", name=time_col)
+        day_idx = ((order_days - start) // DAY).to_numpy()
+
+        is_buy = (orders["side"] == "BUY").to_numpy()
+        sign = np.where(is_buy, 1.0, -1.0)
+        shape = (len(dates), len(coins))
+        holdings = np.zeros(shape)
+        cash = np.zeros(shape)
+        np.add.at(
+            holdings,
+            (day_idx, coin_codes),
+            sign * orders["executedQty"].to_numpy(float),
+        )
+        np.add.at(
+            cash,
+            (day_idx, coin_codes),
+            sign * orders["cummulativeQuoteQty"].to_numpy(float),
+        )
+        holdings = np.cumsum(holdings, axis=0)
+        cash = np.cumsum(cash, axis=0)
+
+        first_days = np.full(len(coins), len(dates))
+        np.minimum.at(first_days, coin_codes, day_idx)
+
+        return cls(
+            dates,
+            list(coins),
+            holdings,
+            cash,
+            align_prices(prices, dates, list(coins)),
+            first_days,
+        )
+
+    def coin_history(self, coin: str) -> pd.DataFrame:
+        """
+        History of single coin since its first order.
+
+        Returns:
+            Table with columns ['date', 'usdt_cash_in_cum', 'coin_cum', 'price', 'coin_cum_usdt_value'].
+        """
+        i = self._coin_idx[coin]
+        days = slice(self.first_days[i], None)
+        return pd.DataFrame(
+            {
+                time_col: self.dates[days],
+                "usdt_cash_in_cum": self.cash[days, i],
+                "coin_cum": self.holdings[days, i],
+                "price": self.prices[days, i],
+                "coin_cum_usdt_value": self.values[days, i],
+            }
+        )
+
+    def total_history(self, coins: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        History of all coins together. Usdt value of coin is kept from the previous day when its price is missing.
+
+        Args:
+            coins: Coins to sum, all coins if None.
+
+        Returns:
+            Table with columns ['date', 'usdt_cash_in_cum', 'coin_cum_usdt_value'].
+        """
+        if coins is None:
+            coins = self.coins
+        idx = [self._coin_idx[coin] for coin in coins]
+        values = pd.DataFrame(self.values[:, idx]).ffill().to_numpy()
+        return pd.DataFrame(
+            {
+                time_col: self.dates,
+                "usdt_cash_in_cum": self.cash[:, idx].sum(axis=1),
+                "coin_cum_usdt_value": np.nansum(values, axis=1),
+            }
+        )
+
+
+def align_prices(
+    prices: pd.DataFrame, dates: pd.DatetimeIndex, coins: List[str]
+) -> np.ndarray:
+    """
+    Get (days x coins) matrix of prices at the end of each day, NaN if price is not available.
+
+    Args:
+        prices: Table with date column of daily klines open time and column of close prices per coin.
+        dates: Days of matrix rows.
+        coins: Coins of matrix columns.
+    """
+    prices = prices.set_index(prices[time_col].dt.to_period("D"))
+    prices = prices[~prices.index.duplicated(keep="last")]
+    missing = [coin for coin in coins if coin not in prices.columns]
+    if len(missing) > 0:
+        logger.info(f"Prices are not available for {missing}")
+    # day gets close price of the next daily kline, i.e. price at the end of day
+    periods = (dates + DAY).to_period("D")
+    return prices.reindex(index=periods, columns=coins).to_numpy(dtype=float)
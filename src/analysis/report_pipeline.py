@@ -0,0 +1,227 @@
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from src.analysis.analyse import OrdersAnalyser, plot_coin_transactions
+from src.analysis.compact_report import serialize_figure
+from src.analysis.fragment_cache import FragmentCache, fragment_key
+from src.client.client import ClientHelper
+
+logger = logging.getLogger(__name__)
+
+REPORT_WORKERS = 4
+PENDING_PER_WORKER = 2
+# fork of process with running fetch threads, i.e. inside bot event loop, may copy held locks and deadlock
+RENDER_START_METHOD = "spawn"
+PRICE_HISTORY_START_DATE = "1 Jan, 2021"
+TRANSACTIONS_PLOT_COLUMNS = [
+    "date",
+    "price",
+    "executedQty",
+    "side",
+    "cummulativeQuoteQty",
+    "quote_coin",
+]
+
+
+def render_transactions_html(
+    base_coin: str,
+    coin_orders: pd.DataFrame,
+    price_history: pd.DataFrame,
+    mean_price: Optional[float],
+    width: int,
+    height: int,
+    compact: bool = False,
+) -> str:
+    """
+    Build transactions figure of coin and serialize it, see serialize_figure. It is run in spawned
+    worker processes, so it and its arguments should be picklable.
+    """
+    fig = plot_coin_transactions(
+        coin_orders,
+        base_coin,
+        price_history,
+        mean_price=mean_price,
+        width=width,
+        height=height,
+    )
+    return serialize_figure(fig, compact)
+
+
+class ReportPipeline:
+    """
+    Render per-coin report fragments with overlapping stages.
+    Price histories are fetched in thread pool, each figure is built and serialized in process pool
+    as soon as its data is ready, and fragments are yielded in the order of coins.
+    """
+
+    def __init__(
+        self,
+        client_helper: ClientHelper,
+        workers: int = REPORT_WORKERS,
+        cache: Optional[FragmentCache] = None,
+        compact: bool = False,
+    ):
+        """
+        Args:
+            client_helper: Client for price histories of coins.
+            workers: Number of workers of each pool. If 1 or less then fragments are rendered sequentially.
+            cache: Cache of rendered fragments. Cached coins are neither fetched nor rendered.
+            compact: Render fragments for compact report.
+        """
+        self.client_helper = client_helper
+        self.workers = workers
+        self.cache = cache
+        self.compact = compact
+
+    def _get_price_history(self, base_coin: str) -> pd.DataFrame:
+        return self.client_helper.get_historical_prices(
+            base_coin + "USDT", start_date=PRICE_HISTORY_START_DATE
+        )
+
+    def _transactions_inputs(
+        self, order_analyser: OrdersAnalyser, coins: List[str]
+    ) -> Dict[str, tuple]:
+        """
+        Get arguments of render_transactions_html of each coin except price history.
+        """
+        mean_prices = order_analyser.calculate_mean_price()
+        mean_prices = dict(
+            zip(mean_prices["base_coin"].astype(str), mean_prices["average_price"])
+        )
+        orders = order_analyser.orders
+        orders = orders[orders["base_coin"].isin(coins)]
+        coins_orders = {
+            str(coin): coin_orders[TRANSACTIONS_PLOT_COLUMNS]
+            for coin, coin_orders in orders.groupby("base_coin", observed=True)
+        }
+        return {
+            coin: (
+                coins_orders[coin],
+                mean_prices[coin],
+                order_analyser.width,
+                order_analyser.height,
+                self.compact,
+            )
+            for coin in coins
+        }
+
+    @staticmethod
+    def _transactions_key(coin: str, inputs: tuple) -> str:
+        """
+        Daily price history from PRICE_HISTORY_START_DATE is determined by the current day,
+        so it is part of key instead of price history itself and cached coins don't need fetching.
+        """
+        price_day = datetime.today().strftime("%Y-%m-%d")
+        return fragment_key(
+            "transactions", coin, PRICE_HISTORY_START_DATE, price_day, *inputs
+        )
+
+    def _render_coin(self, coin: str, inputs: Dict[str, tuple]) -> str:
+        return render_transactions_html(
+            coin,
+            inputs[coin][0],
+            self._get_price_history(coin),
+            *inputs[coin][1:],
+        )
+
+    def _iter_rendered(
+        self, coins: List[str], inputs: Dict[str, tuple]
+    ) -> Iterator[str]:
+        """
+        Render fragments of coins and yield them in the order of coins. At most PENDING_PER_WORKER
+        coins per worker are fetched or rendered ahead, so memory doesn't grow with the number of coins.
+        """
+        if self.workers <= 1:
+            for coin in coins:
+                yield self._render_coin(coin, inputs)
+            return
+
+        window = PENDING_PER_WORKER * self.workers
+        coins_to_fetch = iter(coins)
+        fetches: Deque[Tuple[str, Future]] = deque()
+        renders: Deque[Future] = deque()
+        with ThreadPoolExecutor(self.workers) as io_pool, ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context(RENDER_START_METHOD)
+        ) as cpu_pool:
+
+            def submit_fetch():
+                coin = next(coins_to_fetch, None)
+                if coin is not None:
+                    fetch = io_pool.submit(self._get_price_history, coin)
+                    fetches.append((coin, fetch))
+
+            for _ in range(window):
+                submit_fetch()
+            while len(fetches) > 0:
+                coin, fetch = fetches.popleft()
+                renders.append(
+                    cpu_pool.submit(
+                        render_transactions_html,
+                        coin,
+                        inputs[coin][0],
+                        fetch.result(),
+                        *inputs[coin][1:],
+                    )
+                )
+                submit_fetch()
+                if len(renders) >= window:
+                    yield renders.popleft().result()
+            while len(renders) > 0:
+                yield renders.popleft().result()
+
+    def iter_transactions(
+        self, order_analyser: OrdersAnalyser, coins: List[str]
+    ) -> Iterator[str]:
+        """
+        Render transactions figures of coins and yield fragments in the order of coins as soon as they are ready.
+        Cached fragments are read from cache when their turn comes.
+
+        Args:
+            order_analyser: Analyser with orders of coins.
+            coins: Base coins for plotting.
+
+        Yields:
+            Fragments of coins, see serialize_figure.
+        """
+        inputs = self._transactions_inputs(order_analyser, coins)
+
+        keys: Dict[str, str] = {}
+        cached = set()
+        if self.cache is not None:
+            keys = {coin: self._transactions_key(coin, inputs[coin]) for coin in coins}
+            cached = {coin for coin in coins if keys[coin] in self.cache}
+        missing = [coin for coin in coins if coin not in cached]
+        rendered = self._iter_rendered(missing, inputs)
+
+        for coin in coins:
+            if coin in cached:
+                fragment = self.cache.get(keys[coin])
+                if fragment is None:
+                    # evicted by concurrent report
+                    fragment = self._render_coin(coin, inputs)
+            else:
+                fragment = next(rendered)
+                if self.cache is not None:
+                    self.cache.put(keys[coin], fragment)
+            yield fragment
+        logger.info(
+            f"Transactions figures of {len(coins)} coins were rendered, "
+            f"{len(cached)} of them were taken from cache"
+        )
+
+    def render_transactions(
+        self, order_analyser: OrdersAnalyser, coins: List[str]
+    ) -> List[str]:
+        """
+        Render transactions figures of coins, see iter_transactions.
+
+        Returns:
+            Fragments in the order of coins.
+        """
+        return list(self.iter_transactions(order_analyser, coins))
@@ -0,0 +1,78 @@
+import gzip
+import logging
+from pathlib import Path
+from typing import Optional, TextIO
+
+from src.analysis.compact_report import CompactFigures
+
+logger = logging.getLogger(__name__)
+
+REPORT_HEAD = """
+    <html>
+        <head>
+            <link rel="stylesheet" href="https://maxcdn.bootstrapcdn.com/bootstrap/3.3.1/css/bootstrap.min.css">
+            <style>body{ margin:0 100; background:white; }</style>
+            """
+REPORT_END = """
+
+        </body>
+    </html>"""
+
+
+class HtmlReportWriter:
+    """
+    Write html report to file part by part, so only the current figure is kept in memory.
+    File is gzip compressed if its name ends with .gz. Partially written file is removed on error.
+
+    Example:
+        with HtmlReportWriter(fpath) as writer:
+            writer.write_head(plotlyjs_script, title)
+            writer.write_figure(fragment)
+    """
+
+    def __init__(self, fpath: Path, compact: bool = False):
+        """
+        Args:
+            fpath: Path to report.
+            compact: Figures are plotly json which are written as compact figures, see CompactFigures.
+        """
+        self.fpath = fpath
+        self._figures: Optional[CompactFigures] = CompactFigures() if compact else None
+        self._file: Optional[TextIO] = None
+
+    def __enter__(self) -> "HtmlReportWriter":
+        self.fpath.parent.mkdir(exist_ok=True, parents=True)
+        if self.fpath.suffix == ".gz":
+            self._file = gzip.open(self.fpath, "wt", encoding="utf-8")
+        else:
+            self._file = open(self.fpath, "w", encoding="utf-8")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                if self._figures is not None:
+                    self.write(self._figures.footer())
+                self.write(REPORT_END)
+        finally:
+            self._file.close()
+            if exc_type is not None:
+                self.fpath.unlink(missing_ok=True)
+
+    def write(self, html: str):
+        self._file.write(html)
+
+    def write_head(self, plotlyjs_script: str, title: str):
+        self.write(REPORT_HEAD + plotlyjs_script + "</head>\n        </head>\n")
+        self.write(f"        <body>\n            <h1>{title}</h1>\n")
+
+    def write_heading(self, text: str, level: int = 2):
+        self.write(f"\n            <h{level}>{text}</h{level}>\n            ")
+
+    def write_figure(self, fragment: str):
+        """
+        Write figure fragment, see serialize_figure.
+        """
+        if self._figures is not None:
+            fragment = self._figures.add(fragment)
+        self.write(fragment + "\n            ")
@@ -0,0 +1,407 @@
+import asyncio
+import logging
+from collections import defaultdict
+from functools import partial
+from typing import (Any, Awaitable, Dict, Iterable, List, Optional, Set,
+                    Tuple, Union)
+
+import numpy as np
+import pandas as pd
+from binance import AsyncClient
+from binance.exceptions import BinanceAPIException
+
+from src.client.client import (AGG_TRADES_MAX_WINDOW_MS, PROCESSES_NUMBER,
+                               BaseClientHelper, Plan, account_balances_plan,
+                               account_snapshot_plan, aggregate_trade_plan,
+                               concat_orders_lists, exchange_symbols_plan,
+                               fill_market_orders_average_price,
+                               fill_orders_close_prices, held_coins_plan,
+                               klines_plan, merge_synced_orders,
+                               pair_orders_plan, parse_klines, tickers_plan,
+                               unfilled_orders_klines_ranges)
+from src.client.order_sync import OrdersSyncState
+from src.client.rate_limiter import (ENDPOINT_WEIGHTS, IP_RATE_LIMITER,
+                                     SAPI_RATE_LIMITER, RateLimiter)
+from src.client.recorder import TransportRecorder
+from src.client.symbols import (dump_cached_symbols, load_cached_symbols,
+                                select_currency_pairs)
+from src.data.klines_store import (KLINES_STORE, KlinesStore, Range,
+                                   merge_ranges, subtract_ranges)
+from src.data.price_book import PriceBook
+
+logger = logging.getLogger(__name__)
+
+KlinesRequest = Tuple[str, str, Union[int, str], Optional[Union[int, str]]]
+
+
+async def gather_cancel_on_error(*aws: Awaitable) -> List[Any]:
+    """
+    Run awaitables concurrently and return their results in the same order.
+    If one of them fails then the others are cancelled before the error is raised.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+class PrefetchedClientHelper:
+    """
+    Client serving klines which were fetched in advance, it doesn't send requests.
+    It has klines methods of ClientHelper, so report can be built from prefetched data without network.
+    Errors of prefetching are raised when klines of the same symbol and interval are requested.
+    """
+
+    def __init__(self, currency_items: List[str]):
+        self.currency_items = currency_items
+        self._klines: Dict[Tuple[str, str], np.ndarray] = {}
+        self._ranges: Dict[Tuple[str, str], List[Range]] = defaultdict(list)
+        self._errors: Dict[Tuple[str, str], BinanceAPIException] = {}
+
+    def add(
+        self,
+        symbol: str,
+        interval: str,
+        start_time: int,
+        end_time: int,
+        klines: np.ndarray,
+    ):
+        """
+        Keep klines fetched for [start_time, end_time) range.
+        """
+        key = (symbol, interval)
+        if key in self._klines:
+            klines = np.concatenate([self._klines[key], klines])
+        _, unique_idx = np.unique(klines[:, 0], return_index=True)
+        self._klines[key] = klines[unique_idx]
+        self._ranges[key] = merge_ranges(self._ranges[key] + [(start_time, end_time)])
+
+    def add_error(self, symbol: str, interval: str, error: BinanceAPIException):
+        self._errors[(symbol, interval)] = error
+
+    def get_klines(self, coin_pair, interval, start_time, end_time=None):
+        """
+        Get prefetched klines opened in [start_time, end_time).
+        If end_time is None then klines up to the end of prefetched range are returned.
+        """
+        key = (coin_pair, interval)
+        if key in self._errors:
+            raise self._errors[key]
+        start_time, end_time = KlinesStore.normalize_range(start_time, end_time)
+        ranges = self._ranges[key]
+        if len(ranges) > 0 and end_time > ranges[-1][1]:
+            end_time = ranges[-1][1]
+        missing = subtract_ranges(start_time, end_time, ranges)
+        if len(ranges) == 0 or len(missing) > 0:
+            raise KeyError(
+                f"{coin_pair} {interval} klines of {missing} were not prefetched"
+            )
+        data = self._klines[key]
+        start, end = np.searchsorted(data[:, 0], [start_time, end_time])
+        return data[start:end]
+
+    def get_historical_prices(self, coin_pair, start_date="1 Jan, 2020"):
+        data = self.get_klines(coin_pair, AsyncClient.KLINE_INTERVAL_1DAY, start_date)
+        return parse_klines(data)
+
+
+class AsyncClientHelper(BaseClientHelper):
+    """
+    Coroutine version of ClientHelper built on python-binance AsyncClient.
+    Requests are built and parsed by the same plans as in ClientHelper. All requests share
+    one concurrency limit and the rate limiter of ClientHelper, files are read and written in executor.
+    """
+
+    def __init__(
+        self,
+        client: AsyncClient,
+        api_key: str,
+        max_concurrency: int = PROCESSES_NUMBER,
+        rate_limiter: RateLimiter = IP_RATE_LIMITER,
+        sapi_rate_limiter: RateLimiter = SAPI_RATE_LIMITER,
+        klines_store: KlinesStore = KLINES_STORE,
+        recorder: Optional[TransportRecorder] = None,
+    ):
+        super().__init__(
+            api_key, rate_limiter, sapi_rate_limiter, klines_store, recorder
+        )
+        self.client = client
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._klines_locks: Dict[Tuple[str, str], asyncio.Lock] = defaultdict(
+            asyncio.Lock
+        )
+
+    @classmethod
+    async def create(
+        cls,
+        api_key: str,
+        api_secret: str,
+        recorder: Optional[TransportRecorder] = None,
+        **kwargs,
+    ) -> "AsyncClientHelper":
+        client = None
+        if recorder is None or not recorder.replay:
+            client = await AsyncClient.create(api_key, api_secret)
+        return cls(client, api_key, recorder=recorder, **kwargs)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close_connection()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _call(self, endpoint: str, *args, **kwargs):
+        """
+        Call AsyncClient method under the concurrency limit and through the rate limiter.
+        """
+        if self._replay:
+            return await self._recorder.acall(endpoint, *args, **kwargs)
+        func = getattr(self.client, endpoint)
+        if self._recorder is not None:
+            func = self._recorder.wrap_async(endpoint, func)
+        async with self._semaphore:
+            return await self._endpoint_rate_limiter(endpoint).acall(
+                ENDPOINT_WEIGHTS[endpoint],
+                func,
+                *args,
+                headers_getter=self._last_response_headers,
+                **kwargs,
+            )
+
+    async def _run(self, plan: Plan) -> Any:
+        """
+        Send requests of plan, independent requests are sent concurrently.
+
+        Returns:
+            Result of plan.
+        """
+        try:
+            step = next(plan)
+            while True:
+                try:
+                    if isinstance(step, list):
+                        response = await gather_cancel_on_error(
+                            *[self._call(r.endpoint, **r.params) for r in step]
+                        )
+                    else:
+                        response = await self._call(step.endpoint, **step.params)
+                except BinanceAPIException as ex:
+                    step = plan.throw(ex)
+                else:
+                    step = plan.send(response)
+        except StopIteration as stop:
+            return stop.value
+
+    async def _run_in_executor(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+    async def _query_pair_orders(
+        self, currency_pair: Tuple[str, str], sync_state: Optional[OrdersSyncState]
+    ) -> Optional[List[Any]]:
+        pair_name = "".join(currency_pair)
+        start_order_id = (
+            None if sync_state is None else sync_state.get_start_order_id(pair_name)
+        )
+        orders = await self._run(pair_orders_plan(currency_pair, start_order_id))
+        if orders is None:
+            return None
+        orders = await self._fill_price_for_market_price_transaction(orders)
+        return merge_synced_orders(sync_state, pair_name, orders)
+
+    async def _fill_price_for_market_price_transaction(
+        self, orders: List[Any]
+    ) -> List[Any]:
+        unfilled_orders = fill_market_orders_average_price(orders)
+        if len(unfilled_orders) == 0:
+            return orders
+
+        symbol = unfilled_orders[0]["symbol"]
+        klines_pages = await gather_cancel_on_error(
+            *[
+                self._get_minute_klines(symbol, start_time, end_time)
+                for start_time, end_time in unfilled_orders_klines_ranges(
+                    unfilled_orders
+                )
+            ]
+        )
+        fill_orders_close_prices(unfilled_orders, np.concatenate(klines_pages))
+        return orders
+
+    async def get_exchange_symbols(
+        self, force_update: bool = False
+    ) -> List[Dict[str, str]]:
+        symbols = None
+        if not force_update:
+            symbols = await self._run_in_executor(
+                load_cached_symbols, self._symbols_cache_fpath
+            )
+        if symbols is None:
+            symbols = await self._run(exchange_symbols_plan())
+            await self._run_in_executor(
+                dump_cached_symbols, symbols, self._symbols_cache_fpath
+            )
+        return symbols
+
+    async def get_held_coins(self) -> Set[str]:
+        return await self._run(held_coins_plan())
+
+    async def get_currency_pairs(
+        self, discover_symbols: bool = True, held_only: bool = False
+    ) -> List[Tuple[str, str]]:
+        if not discover_symbols:
+            return self._all_currency_pairs()
+        held_coins = await self.get_held_coins() if held_only else None
+        return select_currency_pairs(
+            await self.get_exchange_symbols(), self.currency_items, held_coins
+        )
+
+    async def load_orders(
+        self,
+        discover_symbols: bool = True,
+        held_only: bool = False,
+        incremental: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Query history of orders for currency pairs concurrently.
+        Arguments are the same as in ClientHelper.load_orders.
+        """
+        currency_combinations = await self.get_currency_pairs(
+            discover_symbols, held_only
+        )
+        logger.info(f"fetching orders for {len(currency_combinations)} pairs")
+        sync_state = await self._run_in_executor(self._orders_sync_state, incremental)
+        orders_lists = await gather_cancel_on_error(
+            *[
+                self._query_pair_orders(pair, sync_state)
+                for pair in currency_combinations
+            ]
+        )
+        if sync_state is not None:
+            await self._run_in_executor(sync_state.dump)
+        return concat_orders_lists(orders_lists)
+
+    async def get_all_assets(self, all_coins: bool = False) -> pd.DataFrame:
+        return await self._run(
+            account_balances_plan(None if all_coins else self.currency_items)
+        )
+
+    async def get_history_assets(
+        self, trade_type: str = "SPOT", days: int = 30
+    ) -> pd.DataFrame:
+        return await self._run(account_snapshot_plan(trade_type, days))
+
+    async def _fetch_klines(self, coin_pair, interval, start_time: int, end_time: int):
+        return await self._run(klines_plan(coin_pair, interval, start_time, end_time))
+
+    def _save_and_read_klines(
+        self,
+        symbol: str,
+        interval: str,
+        start_time: int,
+        end_time: int,
+        missing: List[Range],
+        fetched: List[list],
+    ) -> np.ndarray:
+        with self.klines_store.lock(symbol, interval):
+            return self.klines_store.save_and_read(
+                symbol, interval, start_time, end_time, missing, fetched
+            )
+
+    async def get_klines(self, coin_pair, interval, start_time, end_time=None):
+        """
+        Get klines through the local klines store like ClientHelper.get_klines.
+        Missing ranges are queried on event loop, only store files are read and written in executor,
+        so executor threads never wait for requests. Concurrent calls for the same symbol and interval
+        are serialized, so each missing range is queried once.
+        """
+        start_time, end_time = KlinesStore.normalize_range(start_time, end_time)
+        async with self._klines_locks[(coin_pair, interval)]:
+            missing = await self._run_in_executor(
+                self.klines_store.missing_ranges,
+                coin_pair,
+                interval,
+                start_time,
+                end_time,
+            )
+            pages = await gather_cancel_on_error(
+                *[
+                    self._fetch_klines(coin_pair, interval, range_start, range_end - 1)
+                    for range_start, range_end in missing
+                ]
+            )
+            return await self._run_in_executor(
+                self._save_and_read_klines,
+                coin_pair,
+                interval,
+                start_time,
+                end_time,
+                missing,
+                [kline for page in pages for kline in page],
+            )
+
+    async def _get_minute_klines(self, coin_pair, start_time: int, end_time: int):
+        return await self.get_klines(
+            coin_pair, AsyncClient.KLINE_INTERVAL_1MINUTE, start_time, end_time
+        )
+
+    async def get_historical_prices(self, coin_pair, start_date="1 Jan, 2020"):
+        data = await self.get_klines(
+            coin_pair, AsyncClient.KLINE_INTERVAL_1DAY, start_date
+        )
+        return parse_klines(data)
+
+    async def query_prices(self) -> PriceBook:
+        return await self._run(tickers_plan())
+
+    async def get_aggregate_trades(
+        self, symbol: str, time: int, max_window_ms: int = AGG_TRADES_MAX_WINDOW_MS
+    ) -> Optional[Dict[str, Any]]:
+        return await self._run(aggregate_trade_plan(symbol, time, max_window_ms))
+
+    async def _prefetch_klines(
+        self,
+        prefetched: PrefetchedClientHelper,
+        symbol: str,
+        interval: str,
+        start_time: Union[int, str],
+        end_time: Optional[Union[int, str]] = None,
+    ):
+        start_time, end_time = KlinesStore.normalize_range(start_time, end_time)
+        try:
+            klines = await self.get_klines(symbol, interval, start_time, end_time)
+        except BinanceAPIException as ex:
+            logger.info(f"Can not get {symbol} {interval} klines: {ex.message}")
+            prefetched.add_error(symbol, interval, ex)
+            return
+        prefetched.add(symbol, interval, start_time, end_time, klines)
+
+    async def prefetch_klines(
+        self,
+        requests: Iterable[KlinesRequest],
+        prefetched: Optional[PrefetchedClientHelper] = None,
+    ) -> PrefetchedClientHelper:
+        """
+        Fetch klines concurrently for building report without network, see PrefetchedClientHelper.
+
+        Args:
+            requests: Tuples of (symbol, interval, start_time, end_time) like arguments of get_klines.
+            prefetched: Client to add klines to. If None then new one is created.
+
+        Returns:
+            Client serving fetched klines.
+        """
+        if prefetched is None:
+            prefetched = PrefetchedClientHelper(self.currency_items)
+        await gather_cancel_on_error(
+            *[self._prefetch_klines(prefetched, *request) for request in requests]
+        )
+        return prefetched
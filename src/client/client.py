@@ -1,46 +1,88 @@
 import itertools
 import logging
+from functools import partial
 from multiprocessing.dummy import Pool as ThreadPool
-from time import sleep
-from typing import Any, Dict, List, Optional
+from typing import (Any, Dict, Generator, List, NamedTuple, Optional,
+                    Sequence, Set, Tuple, Union)
 
+import numpy as np
 import pandas as pd
 from binance import Client
 from binance.exceptions import BinanceAPIException
 
-from src.utils.utils import (cast_all_to_float, convert_timestamp_to_datetime,
-                             load_config_json)
+from src.client.order_sync import ORDERS_SYNC_FOLDER, OrdersSyncState
+from src.client.rate_limiter import (ENDPOINT_WEIGHTS, IP_RATE_LIMITER,
+                                     SAPI_ENDPOINTS, SAPI_RATE_LIMITER,
+                                     RateLimiter)
+from src.client.recorder import TransportRecorder
+from src.client.symbols import (EXCHANGE_SYMBOLS_FPATH, dump_cached_symbols,
+                                load_cached_symbols, parse_exchange_symbols,
+                                select_currency_pairs)
+from src.data.klines_store import KLINES_STORE, KlinesStore
+from src.data.price_book import PriceBook
+from src.data.schema import (BALANCES_SCHEMA, KLINES_SCHEMA, SNAPSHOT_SCHEMA,
+                             apply_order_schema, parse_records,
+                             to_local_datetime)
+from src.utils.utils import load_config_json
 
 logger = logging.getLogger(__name__)
 MAX_ORDERS = 1000
+MAX_KLINES = 1000
+MINUTE_MS = 60 * 1000
+# aggregate trades can be queried within 1 hour window
+AGG_TRADES_MAX_WINDOW_MS = 60 * MINUTE_MS
 PROCESSES_NUMBER = 15
 RECV_WINDOW = 5000
-KLINES_COLUMNS = [
-    "Open time",
-    "Open",
-    "High",
-    "Low",
-    "Close",
-    "Volume",
-    "Close time",
-    "Quote asset volume",
-    "Number of trades",
-    "Taker buy base asset volume",
-    "Taker buy quote asset volume",
-    "Can be ignored",
-]
-
-
-class ClientHelper:
-    def __init__(self, api_key: str, api_secret: str):
-        self.client: Client = None
-        try:
-            self.client = Client(api_key, api_secret)
-        except BinanceAPIException as err:
-            if err.code == -1003:
-                err.message
-                # raise err(f'IP blocked until {convert_timestamp_to_datetime}')
-            raise err
+KLINES_COLUMNS = list(KLINES_SCHEMA)
+CLOSE_TIME_IDX = KLINES_COLUMNS.index("Close time")
+
+
+class Request(NamedTuple):
+    """
+    Request of python-binance client method.
+    """
+
+    endpoint: str
+    params: Dict[str, Any]
+
+
+def request(endpoint: str, **params) -> Request:
+    return Request(endpoint, params)
+
+
+# Request plan is a generator which yields Request or list of independent requests and gets their responses,
+# errors of requests are thrown into it. Plans build requests and parse responses,
+# so ClientHelper and AsyncClientHelper only send requests.
+Plan = Generator[Union[Request, List[Request]], Any, Any]
+
+
+class BaseClientHelper:
+    """
+    Settings and local state shared by ClientHelper and AsyncClientHelper.
+    With recorder, klines store, orders sync state and exchange symbols cache are kept in state folder of recorder,
+    so recorded session neither depends on nor changes persisted state, see TransportRecorder.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        rate_limiter: RateLimiter = IP_RATE_LIMITER,
+        sapi_rate_limiter: RateLimiter = SAPI_RATE_LIMITER,
+        klines_store: KlinesStore = KLINES_STORE,
+        recorder: Optional[TransportRecorder] = None,
+    ):
+        self.client = None
+        self.klines_store = klines_store
+        self._orders_sync_folder = ORDERS_SYNC_FOLDER
+        self._symbols_cache_fpath = EXCHANGE_SYMBOLS_FPATH
+        if recorder is not None:
+            self.klines_store = KlinesStore(recorder.state_folder / "klines")
+            self._orders_sync_folder = recorder.state_folder / "orders_sync"
+            self._symbols_cache_fpath = recorder.state_folder / "exchange_symbols.json"
+        self._rate_limiter = rate_limiter
+        self._sapi_rate_limiter = sapi_rate_limiter
+        self._recorder = recorder
+        self._api_key = api_key
         query_config = load_config_json("config/query.json")
         self._currency_items = query_config["orders_history"]["currency_items"]
         logger.info(f"fetching coins: {self.currency_items}")
@@ -53,111 +95,235 @@ class ClientHelper:
     def currency_items(self, value):
         self._currency_items = value
 
-    def _query_pair_orders(self, currency_pair: list) -> Optional[List[Any]]:
+    @property
+    def _replay(self) -> bool:
+        return self._recorder is not None and self._recorder.replay
+
+    def _endpoint_rate_limiter(self, endpoint: str) -> RateLimiter:
+        if endpoint in SAPI_ENDPOINTS:
+            return self._sapi_rate_limiter
+        return self._rate_limiter
+
+    def _last_response_headers(self):
+        response = getattr(self.client, "response", None)
+        return None if response is None else response.headers
+
+    def _orders_sync_state(self, incremental: bool) -> Optional[OrdersSyncState]:
+        if not incremental:
+            return None
+        return OrdersSyncState(self._api_key, self._orders_sync_folder)
+
+    def _all_currency_pairs(self) -> List[Tuple[str, str]]:
+        return list(itertools.permutations(self.currency_items, 2))
+
+
+class ClientHelper(BaseClientHelper):
+    def __init__(
+        self,
+        api_key: str,
+        api_secret: str,
+        rate_limiter: RateLimiter = IP_RATE_LIMITER,
+        sapi_rate_limiter: RateLimiter = SAPI_RATE_LIMITER,
+        klines_store: KlinesStore = KLINES_STORE,
+        recorder: Optional[TransportRecorder] = None,
+    ):
+        """
+        Args:
+            api_key: Key from binance profile.
+            api_secret: Secret key from binance profile.
+            rate_limiter: Limiter of request weight.
+            sapi_rate_limiter: Limiter of SAPI request weight.
+            klines_store: Local store of klines. With recorder, empty store of session is used instead.
+            recorder: Record requests or replay them without network.
+        """
+        super().__init__(
+            api_key, rate_limiter, sapi_rate_limiter, klines_store, recorder
+        )
+        self.client: Client = None
+        try:
+            if not self._replay:
+                self.client = Client(api_key, api_secret)
+        except BinanceAPIException as err:
+            if err.code == -1003:
+                err.message
+                # raise err(f'IP blocked until {convert_timestamp_to_datetime}')
+            raise err
+
+    def _call(self, endpoint: str, *args, **kwargs):
+        """
+        Call python-binance client method through the rate limiter.
+
+        Args:
+            endpoint: Name of client method, its weight is taken from ENDPOINT_WEIGHTS.
+        Returns:
+            Response of client method.
+        """
+        if self._replay:
+            return self._recorder.call(endpoint, *args, **kwargs)
+        func = getattr(self.client, endpoint)
+        if self._recorder is not None:
+            func = self._recorder.wrap(endpoint, func)
+        return self._endpoint_rate_limiter(endpoint).call(
+            ENDPOINT_WEIGHTS[endpoint],
+            func,
+            *args,
+            headers_getter=self._last_response_headers,
+            **kwargs,
+        )
+
+    def _run(self, plan: Plan) -> Any:
+        """
+        Send requests of plan one by one.
+
+        Returns:
+            Result of plan.
+        """
+        try:
+            step = next(plan)
+            while True:
+                try:
+                    if isinstance(step, list):
+                        response = [self._call(r.endpoint, **r.params) for r in step]
+                    else:
+                        response = self._call(step.endpoint, **step.params)
+                except BinanceAPIException as ex:
+                    step = plan.throw(ex)
+                else:
+                    step = plan.send(response)
+        except StopIteration as stop:
+            return stop.value
+
+    def _query_pair_orders(
+        self, currency_pair: list, sync_state: Optional[OrdersSyncState] = None
+    ) -> Optional[List[Any]]:
         """
         Query history of orders for currency pair
         Args:
             currency_pair: list with 2 names for base and quote currency
+            sync_state: If set then only new and still open orders are queried and merged into sync state.
 
         Returns:
             List of dicts with order's info
         """
         pair_name = "".join(currency_pair)
-        try:
-            orders = self.client.get_all_orders(
-                symbol=pair_name, limit=MAX_ORDERS, recvWindow=RECV_WINDOW
-            )
-            if len(orders) == 0:
-                return None
-            for i in range(len(orders)):
-                orders[i]["base_coin"] = currency_pair[0]
-                orders[i]["quote_coin"] = currency_pair[1]
-
-        except BinanceAPIException as e:
-            if e.code == -1121:
-                # Invalid symbol
-                return None
-            raise e
-
+        start_order_id = (
+            None if sync_state is None else sync_state.get_start_order_id(pair_name)
+        )
+        orders = self._run(pair_orders_plan(currency_pair, start_order_id))
+        if orders is None:
+            return None
         orders = self._fill_price_for_market_price_transaction(orders)
-        return orders
+        return merge_synced_orders(sync_state, pair_name, orders)
 
     def _fill_price_for_market_price_transaction(
         self, orders: Optional[List[Any]]
     ) -> Optional[List[Any]]:
-        if len(orders) == 0:
+        """
+        Fill price of MARKET orders of one symbol with average fill price.
+        Orders without executed quantity get close price of minute kline, klines are queried by ranges.
+        """
+        unfilled_orders = fill_market_orders_average_price(orders)
+        if len(unfilled_orders) == 0:
             return orders
 
-        for i in range(len(orders)):
-            order = orders[i]
-            if order["type"] == "MARKET":
-                order["price"] = self._get_timestamp_price(
-                    order["symbol"], order["time"]
-                )
-
+        symbol = unfilled_orders[0]["symbol"]
+        klines = []
+        for start_time, end_time in unfilled_orders_klines_ranges(unfilled_orders):
+            klines.extend(self._get_minute_klines(symbol, start_time, end_time))
+        fill_orders_close_prices(unfilled_orders, klines)
         return orders
 
-    def load_orders(self):
+    def get_exchange_symbols(
+        self, force_update: bool = False
+    ) -> List[Dict[str, str]]:
         """
-        Query history of orders for all possible combinations of currency pairs.
+        Get spot symbols listed in exchange.
+        Symbols are cached on disk and refreshed after TTL expiration.
 
         Args:
-            currency_items: List of currencies for fetching.
-                All possible pairs generated from that list.
-                If None then default use currency_items from configs.
+            force_update: Ignore disk cache and query exchange info.
         Returns:
-            DataFrame with orders details
+            List of dicts with symbol, baseAsset and quoteAsset.
         """
-        currency_combinations = list(itertools.permutations(self.currency_items, 2))
-        # bypass protection. Avoid APIError(code=-1003): Too much request weight used
-        n_batches = 3
-        batch_size = len(currency_combinations) // n_batches
-        orders_lists = []
-        for i in range(n_batches + 1):
-            logger.info(f"Avoid APIError(code=-1003), batch {i}")
-            while True:
-                try:
-                    with ThreadPool(PROCESSES_NUMBER) as pool:
-                        orders_lists.extend(
-                            pool.map(
-                                self._query_pair_orders,
-                                currency_combinations[
-                                    i * batch_size: i * batch_size + batch_size
-                                ],
-                            )
-                        )
-                    break
-                except BinanceAPIException as ex:
-                    logger.warning(ex.message)
-                    logger.info("Avoid APIError(code=-1003), sleep extra 60 seconds")
-                    sleep(60)
-            sleep(10)
-
-        orders_lists = [o for o in orders_lists if o is not None]
-        orders = list(itertools.chain.from_iterable(orders_lists))
-        return pd.DataFrame(orders)
+        symbols = None
+        if not force_update:
+            symbols = load_cached_symbols(self._symbols_cache_fpath)
+        if symbols is None:
+            symbols = self._run(exchange_symbols_plan())
+            dump_cached_symbols(symbols, self._symbols_cache_fpath)
+        return symbols
 
-    def _query_asset(self, currency):
+    def get_held_coins(self) -> Set[str]:
         """
-        Query asset for selected currency.
+        Get coins with non-zero balance now or in the daily spot snapshots of the last 30 days.
         """
-        return self.client.get_asset_balance(asset=currency)
+        return self._run(held_coins_plan())
 
-    def get_all_assets(self) -> pd.DataFrame:
+    def get_currency_pairs(
+        self, discover_symbols: bool = True, held_only: bool = False
+    ) -> List[Tuple[str, str]]:
         """
-        Query assets for selected currencies.
+        Get (base, quote) pairs for orders querying.
+
+        Args:
+            discover_symbols: Use only pairs listed in exchange info.
+                If False then all permutations of currency_items are used.
+            held_only: Use only pairs with base coin which is held by account now or was held
+                in the last 30 days, see get_held_coins. Works with discover_symbols only.
         Returns:
-            Pandas DataFrame with assets.
+            List of (base_coin, quote_coin) tuples.
+        """
+        if not discover_symbols:
+            return self._all_currency_pairs()
+        held_coins = self.get_held_coins() if held_only else None
+        return select_currency_pairs(
+            self.get_exchange_symbols(), self.currency_items, held_coins
+        )
 
+    def load_orders(
+        self,
+        discover_symbols: bool = True,
+        held_only: bool = False,
+        incremental: bool = False,
+    ):
         """
+        Query history of orders for currency pairs.
+
+        Args:
+            discover_symbols: Query only pairs listed in exchange info.
+                If False then all possible pairs generated from currency_items are queried.
+            held_only: Query only pairs with base coin which is held by account, see get_currency_pairs.
+            incremental: Query only orders which are new or still open since the previous sync,
+                orders history and cursors are stored on disk per api key and symbol.
+        Returns:
+            DataFrame with orders details
+        """
+        currency_combinations = self.get_currency_pairs(discover_symbols, held_only)
+        logger.info(f"fetching orders for {len(currency_combinations)} pairs")
+        sync_state = self._orders_sync_state(incremental)
+        # requests are paced by the rate limiter shared between pool workers
         with ThreadPool(PROCESSES_NUMBER) as pool:
-            assets = pool.map(self._query_asset, self.currency_items)
+            orders_lists = pool.map(
+                partial(self._query_pair_orders, sync_state=sync_state),
+                currency_combinations,
+            )
+        if sync_state is not None:
+            sync_state.dump()
+
+        return concat_orders_lists(orders_lists)
 
-        assets = [o for o in assets if len(o) > 0]
+    def get_all_assets(self, all_coins: bool = False) -> pd.DataFrame:
+        """
+        Query balances of account with a single request.
 
-        assets = pd.DataFrame(assets)
-        assets = assets.sort_values("asset").reset_index(drop=True)
-        return assets
+        Args:
+            all_coins: Return all coins with non-zero balance instead of selected currencies.
+        Returns:
+            Pandas DataFrame with asset, free and locked columns.
+        """
+        return self._run(
+            account_balances_plan(None if all_coins else self.currency_items)
+        )
 
     def get_history_assets(self, trade_type: str = "SPOT", days: int = 30):
         """
@@ -170,89 +336,346 @@ class ClientHelper:
         Returns:
             Pandas DataFrame with history of asset.
         """
-        df = self.client.get_account_snapshot(type=trade_type, limit=days)
-        df = pd.DataFrame(df["snapshotVos"])
-        df["date"] = df["updateTime"].apply(
-            convert_timestamp_to_datetime
-        ) + pd.Timedelta(seconds=1)
-        df = df.drop("updateTime", axis=1)
-        df["totalAssetOfBtc"] = pd.DataFrame(
-            [d["totalAssetOfBtc"] for d in df["data"].values]
+        return self._run(account_snapshot_plan(trade_type, days))
+
+    def _fetch_klines(self, coin_pair, interval, start_time: int, end_time: int):
+        return self._run(klines_plan(coin_pair, interval, start_time, end_time))
+
+    def get_klines(self, coin_pair, interval, start_time, end_time=None):
+        """
+        Get klines through the local klines store, only missing ranges are queried.
+
+        Args:
+            coin_pair: Name of symbol.
+            interval: Klines interval.
+            start_time: Milliseconds or date string.
+            end_time: Milliseconds or date string, exclusive. If None then up to now.
+
+        Returns:
+            Array with KLINES_COLUMNS columns.
+        """
+        return self.klines_store.get_klines(
+            self._fetch_klines, coin_pair, interval, start_time, end_time
         )
-        balances = [d["balances"] for d in df["data"].values]
-        balances_ = []
-        for balance in balances:
-            asset = {d["asset"]: (d["free"] + d["locked"]) for d in balance}
-            balances_.append(asset)
-        balances_ = pd.DataFrame(balances_)
-        balances = pd.concat([df.drop("data", axis=1), balances_], axis=1)
-
-        # get rid of extra points in asset quantity, i.e. usdt count may be 724.15828343149.8
-        for c in ["RUB", "USDT"]:
-            balances[c] = balances[c].apply(lambda x: x[:-4])
-        cast_all_to_float(balances, except_columns=["date"])
-
-        return balances
-
-    def _get_timestamp_price(self, coin_pair, timestamp):
-        data = self.client.get_historical_klines(
-            coin_pair,
-            Client.KLINE_INTERVAL_1MINUTE,
-            start_str=timestamp,
-            end_str=int(timestamp + 60 * 1e3),
+
+    def _get_minute_klines(self, coin_pair, start_time: int, end_time: int):
+        return self.get_klines(
+            coin_pair, Client.KLINE_INTERVAL_1MINUTE, start_time, end_time
         )
-        data = dict(zip(KLINES_COLUMNS, data[0]))
-        return float(data["Close"])
 
     def get_historical_prices(self, coin_pair, start_date="1 Jan, 2020"):
-        data = self.client.get_historical_klines(
-            coin_pair, Client.KLINE_INTERVAL_1DAY, start_date, limit=1000
+        data = self.get_klines(coin_pair, Client.KLINE_INTERVAL_1DAY, start_date)
+        return parse_klines(data)
+
+    def query_prices(self) -> PriceBook:
+        return self._run(tickers_plan())
+
+    def get_aggregate_trades(
+        self, symbol: str, time: int, max_window_ms: int = AGG_TRADES_MAX_WINDOW_MS
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Get the first aggregate trade after time.
+        For many lookups use TradePriceResolver, it needs a few klines requests per symbol.
+
+        Returns:
+            Aggregate trade or None if there are no trades within max_window_ms.
+        """
+        return self._run(aggregate_trade_plan(symbol, time, max_window_ms))
+
+
+def symbol_orders_plan(symbol: str, start_order_id: Optional[int] = None) -> Plan:
+    """
+    Query orders of symbol page by page starting from selected orderId.
+
+    Args:
+        symbol: Name of symbol.
+        start_order_id: The first orderId to query. If None then full history is queried.
+
+    Returns:
+        List of dicts with order's info
+    """
+    orders = []
+    order_id = 0 if start_order_id is None else start_order_id
+    while True:
+        page = yield request(
+            "get_all_orders",
+            symbol=symbol,
+            orderId=order_id,
+            limit=MAX_ORDERS,
+            recvWindow=RECV_WINDOW,
         )
-        data = pd.DataFrame(data, columns=KLINES_COLUMNS)
-        cast_all_to_float(data)
-        data["date"] = data["Open time"].apply(convert_timestamp_to_datetime)
-        return data
-
-    def query_prices(self):
-        prices = self.client.get_all_tickers()
-        prices = pd.DataFrame(prices)
-        cast_all_to_float(prices)
-        main_currency = "USDT"
-        prices = prices[
-            prices["symbol"].apply(lambda x: x[-len(main_currency):] == main_currency)
-        ]
-        prices["base_coin"] = prices["symbol"].apply(lambda x: x[: -len(main_currency)])
-        prices["quote_coin"] = main_currency
-        prices = prices.drop("symbol", axis=1)
-        # add BETH price
-        eth_price = prices.loc[prices["base_coin"] == "ETH", "price"].item()
-        prices = pd.concat(
-            [
-                prices,
-                pd.DataFrame(
-                    [{"price": eth_price, "base_coin": "BETH", "quote_coin": "USDT"}]
-                ),
-            ]
+        orders.extend(page)
+        if len(page) < MAX_ORDERS:
+            return orders
+        order_id = page[-1]["orderId"] + 1
+
+
+def pair_orders_plan(
+    currency_pair: Sequence[str], start_order_id: Optional[int] = None
+) -> Plan:
+    """
+    Query orders of pair and add its coins to orders.
+
+    Returns:
+        List of dicts with order's info or None if pair is not listed.
+    """
+    try:
+        orders = yield from symbol_orders_plan("".join(currency_pair), start_order_id)
+    except BinanceAPIException as e:
+        if e.code == -1121:
+            # Invalid symbol
+            return None
+        raise e
+    add_pair_coins(orders, currency_pair)
+    return orders
+
+
+def exchange_symbols_plan() -> Plan:
+    exchange_info = yield request("get_exchange_info")
+    return parse_exchange_symbols(exchange_info)
+
+
+def held_coins_plan() -> Plan:
+    account, snapshots = yield [
+        request("get_account", recvWindow=RECV_WINDOW),
+        request("get_account_snapshot", type="SPOT", limit=30),
+    ]
+    return parse_held_coins(account, snapshots)
+
+
+def account_balances_plan(currency_items: Optional[List[str]] = None) -> Plan:
+    account = yield request("get_account", recvWindow=RECV_WINDOW)
+    return parse_account_balances(account, currency_items)
+
+
+def account_snapshot_plan(trade_type: str = "SPOT", days: int = 30) -> Plan:
+    snapshot = yield request("get_account_snapshot", type=trade_type, limit=days)
+    return parse_account_snapshot(snapshot)
+
+
+def tickers_plan() -> Plan:
+    prices = yield request("get_all_tickers")
+    return parse_tickers(prices)
+
+
+def klines_plan(symbol: str, interval: str, start_time: int, end_time: int) -> Plan:
+    """
+    Query klines opened in [start_time, end_time] page by page, so each page is charged by the rate limiter.
+
+    Returns:
+        List of klines.
+    """
+    klines = []
+    while start_time <= end_time:
+        page = yield request(
+            "get_klines",
+            symbol=symbol,
+            interval=interval,
+            startTime=start_time,
+            endTime=end_time,
+            limit=MAX_KLINES,
         )
-        # add USDT itself price
-        prices["price"] = prices["price"].astype(float)
-        prices = pd.concat(
-            [
-                prices,
-                pd.DataFrame([{"price": 1, "base_coin": "USDT", "quote_coin": "USDT"}]),
-            ]
+        klines.extend(page)
+        if len(page) < MAX_KLINES:
+            break
+        start_time = page[-1][CLOSE_TIME_IDX] + 1  # open time of the next kline
+    return klines
+
+
+def aggregate_trade_plan(
+    symbol: str, time: int, max_window_ms: int = AGG_TRADES_MAX_WINDOW_MS
+) -> Plan:
+    window_ms = 1000  # aggregate trades in 1 second window for a start
+    while window_ms <= max_window_ms:
+        trades = yield request(
+            "get_aggregate_trades",
+            symbol=symbol,
+            startTime=time,
+            endTime=time + window_ms,
+            limit=1,
         )
-        return prices
-
-    def get_aggregate_trades(self, symbol: str, time: int) -> Dict[str, Any]:
-        window_ms = 1000  # aggregate trades in 1 second window for a start
-        while True:
-            try:
-                return self.client.get_aggregate_trades(
-                    symbol=symbol, startTime=time, endTime=time + window_ms, limit=1
-                )[0]
-            except IndexError:
-                window_ms *= 2  # double the window size if no trades are found
-                if window_ms > 300000:
-                    logger.warning(f"Windows size exceed 5 minutes in get_candle")
-                continue
+        if len(trades) > 0:
+            return trades[0]
+        window_ms *= 2  # double the window size if no trades are found
+    logger.warning(f"There are no {symbol} trades within {max_window_ms} ms")
+    return None
+
+
+def add_pair_coins(orders: List[Dict[str, Any]], currency_pair: Sequence[str]):
+    for order in orders:
+        order["base_coin"] = currency_pair[0]
+        order["quote_coin"] = currency_pair[1]
+
+
+def concat_orders_lists(orders_lists: List[Optional[List[Any]]]) -> pd.DataFrame:
+    orders_lists = [o for o in orders_lists if o is not None]
+    orders = list(itertools.chain.from_iterable(orders_lists))
+    return apply_order_schema(pd.DataFrame(orders))
+
+
+def fill_market_orders_average_price(orders: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Set price of MARKET orders to average fill price cummulativeQuoteQty / executedQty.
+
+    Returns:
+        MARKET orders without executed quantity, their price is not changed.
+    """
+    unfilled_orders = []
+    for order in orders:
+        if order["type"] != "MARKET":
+            continue
+        executed_qty = float(order["executedQty"])
+        if executed_qty > 0:
+            order["price"] = float(order["cummulativeQuoteQty"]) / executed_qty
+        else:
+            unfilled_orders.append(order)
+    return unfilled_orders
+
+
+def merge_synced_orders(
+    sync_state: Optional[OrdersSyncState], symbol: str, orders: List[Dict[str, Any]]
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Merge queried orders of symbol into sync state.
+
+    Returns:
+        All known orders of symbol or None if there are no orders.
+    """
+    if sync_state is not None:
+        sync_state.update(symbol, orders)
+        orders = sync_state.get_orders(symbol)
+    if len(orders) == 0:
+        return None
+    return orders
+
+
+def split_klines_ranges(
+    timestamps: List[int], interval_ms: int = MINUTE_MS, limit: int = MAX_KLINES
+) -> List[Tuple[int, int]]:
+    """
+    Split sorted timestamps into contiguous time ranges, each range is covered by one klines request.
+
+    Returns:
+        List of (start_time, end_time) in milliseconds.
+    """
+    ranges = []
+    for timestamp in sorted(timestamps):
+        if len(ranges) > 0 and timestamp + interval_ms <= ranges[-1][0] + interval_ms * limit:
+            ranges[-1] = (ranges[-1][0], timestamp + interval_ms)
+        else:
+            ranges.append((timestamp, timestamp + interval_ms))
+    return ranges
+
+
+def match_klines_close_prices(timestamps: List[int], klines: List[List[Any]]) -> List[float]:
+    """
+    Get close price of the first kline opened at or after each timestamp.
+
+    Returns:
+        Prices in the order of timestamps, NaN if there is no such kline.
+    """
+    times = pd.DataFrame({"time": timestamps})
+    times["position"] = range(len(times))
+    klines = pd.DataFrame(klines, columns=KLINES_COLUMNS)[["Open time", "Close"]]
+    klines = klines.astype({"Open time": "int64", "Close": float})
+    matched = pd.merge_asof(
+        times.astype({"time": "int64"}).sort_values("time"),
+        klines.sort_values("Open time").drop_duplicates("Open time"),
+        left_on="time",
+        right_on="Open time",
+        direction="forward",
+    )
+    return matched.sort_values("position")["Close"].tolist()
+
+
+def unfilled_orders_klines_ranges(
+    unfilled_orders: List[Dict[str, Any]],
+) -> List[Tuple[int, int]]:
+    """
+    Get ranges of minute klines covering orders, see fill_orders_close_prices.
+    """
+    return split_klines_ranges([order["time"] for order in unfilled_orders])
+
+
+def fill_orders_close_prices(
+    unfilled_orders: List[Dict[str, Any]], klines: List[List[Any]]
+):
+    """
+    Set price of orders to close price of the first minute kline opened at or after order time.
+    """
+    timestamps = [order["time"] for order in unfilled_orders]
+    prices = match_klines_close_prices(timestamps, klines)
+    for order, price in zip(unfilled_orders, prices):
+        order["price"] = price
+
+
+def parse_held_coins(account: Dict[str, Any], snapshots: Dict[str, Any]) -> Set[str]:
+    balances = list(account["balances"])
+    for snapshot in snapshots["snapshotVos"]:
+        balances.extend(snapshot["data"]["balances"])
+    return {b["asset"] for b in balances if float(b["free"]) + float(b["locked"]) > 0}
+
+
+def parse_account_balances(
+    account: Dict[str, Any], currency_items: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    Make typed table of balances from account response.
+
+    Args:
+        account: Response of account endpoint.
+        currency_items: Keep balances of selected coins. If None then all coins with non-zero balance are kept.
+
+    Returns:
+        Table with asset, free and locked columns sorted by asset.
+    """
+    assets = parse_records(account["balances"], BALANCES_SCHEMA)
+    if currency_items is None:
+        assets = assets[assets["free"] + assets["locked"] > 0]
+    else:
+        assets = assets[assets["asset"].isin(currency_items)]
+    assets = assets.sort_values("asset").reset_index(drop=True)
+    return assets
+
+
+def parse_account_snapshot(snapshot: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Make typed table of daily account snapshots.
+
+    Returns:
+        Table with columns ['type', 'date', 'totalAssetOfBtc', quantity of each asset].
+    """
+    snapshots = snapshot["snapshotVos"]
+    df = parse_records(
+        [
+            [s["type"], s["updateTime"], s["data"]["totalAssetOfBtc"]]
+            for s in snapshots
+        ],
+        SNAPSHOT_SCHEMA,
+    )
+    df.insert(1, "date", to_local_datetime(df["updateTime"]) + pd.Timedelta(seconds=1))
+    df = df.drop("updateTime", axis=1)
+
+    balances = parse_records(
+        [b for s in snapshots for b in s["data"]["balances"]], BALANCES_SCHEMA
+    )
+    balances["snapshot"] = np.repeat(
+        np.arange(len(snapshots)), [len(s["data"]["balances"]) for s in snapshots]
+    )
+    balances["quantity"] = balances["free"] + balances["locked"]
+    balances = balances.pivot_table(
+        index="snapshot", columns="asset", values="quantity", aggfunc="sum"
+    ).reindex(range(len(snapshots)))
+    balances.columns.name = None
+    return pd.concat([df, balances], axis=1)
+
+
+def parse_klines(data: Union[List[List[Any]], np.ndarray]) -> pd.DataFrame:
+    data = np.asarray(data, dtype=float).reshape(-1, len(KLINES_COLUMNS))
+    data = parse_records(data, KLINES_SCHEMA)
+    data["date"] = to_local_datetime(data["Open time"])
+    return data
+
+
+def parse_tickers(prices: List[Dict[str, str]]) -> PriceBook:
+    return PriceBook.from_tickers(prices, quote_coins=["USDT"])
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.data.dump_data import DUMP_FOLDER
+
+logger = logging.getLogger(__name__)
+
+ORDERS_SYNC_FOLDER = DUMP_FOLDER / "orders_sync"
+OPEN_ORDER_STATUSES = {"NEW", "PARTIALLY_FILLED", "PENDING_CANCEL"}
+
+
+def get_account_id(api_key: str) -> str:
+    """
+    Short hash of api key, used to store account data without exposing the key.
+    """
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+class OrdersSyncState:
+    """
+    Orders of account with sync cursor per symbol.
+    Cursor keeps last seen orderId and ids of orders which are still open. Open orders are queried again
+    from the oldest of them, so their updates are refreshed without a separate updateTime cursor.
+    """
+
+    def __init__(self, api_key: str, folder: Path = ORDERS_SYNC_FOLDER):
+        self.fpath = folder / f"{get_account_id(api_key)}.json"
+        self._symbols: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if self.fpath.exists():
+            with open(self.fpath) as f:
+                self._symbols = json.load(f)["symbols"]
+
+    def dump(self):
+        self.fpath.parent.mkdir(exist_ok=True, parents=True)
+        with self._lock, open(self.fpath, "w") as f:
+            json.dump({"symbols": self._symbols}, f)
+        logger.info(f"Orders sync state was saved: {self.fpath}")
+
+    def get_start_order_id(self, symbol: str) -> Optional[int]:
+        """
+        Get the first orderId which should be queried for symbol: the oldest open order or next after last seen.
+
+        Returns:
+            orderId or None if symbol was never synced.
+        """
+        with self._lock:
+            state = self._symbols.get(symbol)
+        if state is None or state["last_order_id"] is None:
+            return None
+        return min(state["open_order_ids"] + [state["last_order_id"] + 1])
+
+    def update(self, symbol: str, orders: List[Dict[str, Any]]):
+        """
+        Merge queried orders into symbol's orders by orderId and move cursor forward.
+        """
+        with self._lock:
+            state = self._symbols.setdefault(
+                symbol,
+                {
+                    "last_order_id": None,
+                    "open_order_ids": [],
+                    "orders": [],
+                },
+            )
+            merged = {order["orderId"]: order for order in state["orders"]}
+            merged.update({order["orderId"]: order for order in orders})
+            state["orders"] = [merged[order_id] for order_id in sorted(merged)]
+            if len(merged) == 0:
+                return
+            state["last_order_id"] = max(merged)
+            state["open_order_ids"] = [
+                o["orderId"]
+                for o in state["orders"]
+                if o["status"] in OPEN_ORDER_STATUSES
+            ]
+
+    def get_orders(self, symbol: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            state = self._symbols.get(symbol)
+            return [] if state is None else list(state["orders"])
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Mapping, Optional
+
+from binance.exceptions import BinanceAPIException
+
+logger = logging.getLogger(__name__)
+
+# Binance spot limits are counted per IP, so a single limiter is shared by all clients
+REQUEST_WEIGHT_LIMIT = 1200
+SAPI_WEIGHT_LIMIT = 12000
+WEIGHT_PERIOD_SECONDS = 60
+WEIGHT_SAFETY_RATIO = 0.9
+MAX_RETRIES = 3
+DEFAULT_RETRY_AFTER_SECONDS = 60
+USED_WEIGHT_HEADER = "x-mbx-used-weight-1m"
+SAPI_USED_WEIGHT_HEADER = "x-sapi-used-ip-weight-1m"
+
+# Weights of requests of python-binance client methods. Methods which page internally,
+# i.e. get_historical_klines, are not used: ClientHelper queries pages itself, so each page is charged
+ENDPOINT_WEIGHTS = {
+    "get_all_orders": 10,
+    "get_klines": 2,
+    "get_aggregate_trades": 1,
+    "get_account": 10,
+    "get_all_tickers": 2,
+    "get_exchange_info": 10,
+    "get_account_snapshot": 2400,
+}
+SAPI_ENDPOINTS = {"get_account_snapshot"}
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket of request weight.
+    Bucket is refilled continuously, so callers run at the maximum rate allowed by weight limit.
+    Bucket is synchronized with used weight reported by exchange and is blocked for ban duration.
+    """
+
+    def __init__(
+        self,
+        weight_limit: int = REQUEST_WEIGHT_LIMIT,
+        period_seconds: float = WEIGHT_PERIOD_SECONDS,
+        safety_ratio: float = WEIGHT_SAFETY_RATIO,
+        max_retries: int = MAX_RETRIES,
+        used_weight_header: str = USED_WEIGHT_HEADER,
+    ):
+        self.capacity = weight_limit * safety_ratio
+        self.refill_rate = self.capacity / period_seconds
+        self.max_retries = max_retries
+        self.used_weight_header = used_weight_header
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._banned_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.refill_rate
+        )
+        self._updated_at = now
+
+    def reserve(self, weight: float) -> float:
+        """
+        Take weight from bucket.
+
+        Returns:
+            Seconds to wait before request may be sent.
+        """
+        weight = min(weight, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= weight
+            wait = max(0.0, -self._tokens / self.refill_rate)
+            return max(wait, self._banned_until - now)
+
+    def acquire(self, weight: float):
+        """
+        Block until request with selected weight may be sent.
+        """
+        wait = self.reserve(weight)
+        if wait > 0:
+            logger.debug(f"Rate limiter waits {wait:.2f} seconds")
+            time.sleep(wait)
+
+    def update_used_weight(self, headers: Optional[Mapping[str, str]]):
+        """
+        Synchronize bucket with used weight from response headers.
+        """
+        if headers is None or self.used_weight_header not in headers:
+            return
+        used_weight = float(headers[self.used_weight_header])
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, self.capacity - used_weight)
+
+    def ban(self, seconds: float):
+        """
+        Block all requests for selected duration.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._banned_until = max(self._banned_until, now + seconds)
+            self._tokens = min(self._tokens, 0.0)
+            self._updated_at = now
+
+    def handle_exception(self, ex: BinanceAPIException) -> bool:
+        """
+        Block requests according to Retry-After header if exception is caused by limits.
+
+        Returns:
+            True if request may be retried.
+        """
+        if ex.status_code not in (418, 429) and ex.code != -1003:
+            return False
+        headers = getattr(ex.response, "headers", None) or {}
+        retry_after = float(headers.get("Retry-After", DEFAULT_RETRY_AFTER_SECONDS))
+        logger.warning(f"{ex.message}. Requests are paused for {retry_after} seconds")
+        self.ban(retry_after)
+        return True
+
+    def call(
+        self,
+        weight: float,
+        func: Callable,
+        *args,
+        headers_getter: Optional[Callable[[], Optional[Mapping[str, str]]]] = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Call func when weight is available, retry it after bans.
+
+        Args:
+            weight: Request weight of func.
+            func: Function sending request.
+            headers_getter: Returns headers of the last response to synchronize used weight.
+        Returns:
+            Result of func.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(weight)
+            try:
+                result = func(*args, **kwargs)
+            except BinanceAPIException as ex:
+                if attempt == self.max_retries or not self.handle_exception(ex):
+                    raise
+                continue
+            if headers_getter is not None:
+                self.update_used_weight(headers_getter())
+            return result
+
+    async def acall(
+        self,
+        weight: float,
+        func: Callable[..., Awaitable],
+        *args,
+        headers_getter: Optional[Callable[[], Optional[Mapping[str, str]]]] = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Coroutine version of call, waits without blocking event loop.
+        """
+        for attempt in range(self.max_retries + 1):
+            wait = self.reserve(weight)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                result = await func(*args, **kwargs)
+            except BinanceAPIException as ex:
+                if attempt == self.max_retries or not self.handle_exception(ex):
+                    raise
+                continue
+            if headers_getter is not None:
+                self.update_used_weight(headers_getter())
+            return result
+
+
+IP_RATE_LIMITER = RateLimiter()
+SAPI_RATE_LIMITER = RateLimiter(
+    weight_limit=SAPI_WEIGHT_LIMIT, used_weight_header=SAPI_USED_WEIGHT_HEADER
+)
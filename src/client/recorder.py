@@ -0,0 +1,214 @@
+import asyncio
+import gzip
+import json
+import logging
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from binance.exceptions import BinanceAPIException
+
+logger = logging.getLogger(__name__)
+
+RECORD_MODE = "record"
+REPLAY_MODE = "replay"
+# arguments which depend on current time, they are ignored when exact request is not found in replay
+TIME_ARGUMENTS = {"start_str", "end_str", "startTime", "endTime", "recvWindow"}
+
+
+class ReplayMissError(KeyError):
+    pass
+
+
+def request_key(endpoint: str, args: tuple, kwargs: Dict[str, Any]) -> str:
+    return json.dumps([endpoint, list(args), kwargs], sort_keys=True, default=str)
+
+
+def fallback_request_key(endpoint: str, args: tuple, kwargs: Dict[str, Any]) -> str:
+    kwargs = {k: v for k, v in kwargs.items() if k not in TIME_ARGUMENTS}
+    args = [a for a in args if not isinstance(a, (int, float))]
+    return request_key(endpoint, tuple(args), kwargs)
+
+
+class TransportRecorder:
+    """
+    Record and replay client requests.
+    In record mode each request with its response, error and latency is kept and dumped to gzip json lines archive.
+    In replay mode responses are served from archive without network. Requests are matched exactly,
+    otherwise by arguments without time ones in the recorded order, so reports relative to current time replay too.
+    Clients of session keep local state, i.e. klines store and orders sync state, in temporary state_folder
+    instead of persisted one, so both record and replay start from empty state and send the same requests.
+    """
+
+    def __init__(self, fpath: Path, mode: str, replay_latency: bool = False):
+        """
+        Args:
+            fpath: Path to archive.
+            mode: "record" or "replay".
+            replay_latency: Sleep for recorded latency of each request in replay mode.
+        """
+        if mode not in (RECORD_MODE, REPLAY_MODE):
+            raise ValueError(
+                f"mode should be {RECORD_MODE} or {REPLAY_MODE}, got {mode}"
+            )
+        self.fpath = Path(fpath)
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self._records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._exact = defaultdict(deque)
+        self._fallback = defaultdict(deque)
+        self._state_dir = tempfile.TemporaryDirectory(prefix="recorded_session_")
+        if self.replay:
+            self._load()
+
+    @property
+    def replay(self) -> bool:
+        return self.mode == REPLAY_MODE
+
+    @property
+    def state_folder(self) -> Path:
+        """
+        Temporary folder for local state of clients of session, it is removed on exit.
+        """
+        return Path(self._state_dir.name)
+
+    def _load(self):
+        with gzip.open(self.fpath, "rt") as f:
+            for line in f:
+                record = json.loads(line)
+                record["used"] = False
+                self._exact[record["key"]].append(record)
+                self._fallback[record["fallback_key"]].append(record)
+        logger.info(f"Replay requests from {self.fpath}")
+
+    def dump(self):
+        if self.replay:
+            return
+        self.fpath.parent.mkdir(exist_ok=True, parents=True)
+        with self._lock, gzip.open(self.fpath, "wt") as f:
+            for record in self._records:
+                f.write(json.dumps(record) + "\n")
+        logger.info(f"{len(self._records)} requests were recorded: {self.fpath}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.dump()
+        finally:
+            self._state_dir.cleanup()
+
+    def _add(
+        self,
+        endpoint: str,
+        args: tuple,
+        kwargs: Dict[str, Any],
+        latency: float,
+        response: Any = None,
+        error: Optional[BinanceAPIException] = None,
+    ):
+        record = {
+            "key": request_key(endpoint, args, kwargs),
+            "fallback_key": fallback_request_key(endpoint, args, kwargs),
+            "latency": latency,
+            "response": response,
+            "error": (
+                None
+                if error is None
+                else {
+                    "status_code": error.status_code,
+                    "code": error.code,
+                    "msg": error.message,
+                }
+            ),
+        }
+        with self._lock:
+            self._records.append(record)
+
+    def wrap(self, endpoint: str, func: Callable) -> Callable:
+        """
+        Wrap client method to record its requests.
+        """
+
+        def recorded(*args, **kwargs):
+            start = time.monotonic()
+            try:
+                response = func(*args, **kwargs)
+            except BinanceAPIException as ex:
+                self._add(endpoint, args, kwargs, time.monotonic() - start, error=ex)
+                raise
+            self._add(endpoint, args, kwargs, time.monotonic() - start, response)
+            return response
+
+        return recorded
+
+    def wrap_async(self, endpoint: str, func: Callable) -> Callable:
+        """
+        Wrap coroutine client method to record its requests.
+        """
+
+        async def recorded(*args, **kwargs):
+            start = time.monotonic()
+            try:
+                response = await func(*args, **kwargs)
+            except BinanceAPIException as ex:
+                self._add(endpoint, args, kwargs, time.monotonic() - start, error=ex)
+                raise
+            self._add(endpoint, args, kwargs, time.monotonic() - start, response)
+            return response
+
+        return recorded
+
+    def _pop(
+        self, endpoint: str, args: tuple, kwargs: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        with self._lock:
+            for key, records in (
+                (request_key(endpoint, args, kwargs), self._exact),
+                (fallback_request_key(endpoint, args, kwargs), self._fallback),
+            ):
+                queue = records.get(key)
+                # records are shared by exact and fallback queues, skip used ones
+                while queue and len(queue) > 1 and queue[0]["used"]:
+                    queue.popleft()
+                if queue:
+                    record = queue[0]
+                    # keep the last response for repeated requests
+                    if len(queue) > 1:
+                        queue.popleft()
+                    record["used"] = True
+                    return record
+        raise ReplayMissError(
+            f"Request is not recorded: {request_key(endpoint, args, kwargs)}"
+        )
+
+    @staticmethod
+    def _response(record: Dict[str, Any]) -> Any:
+        error = record["error"]
+        if error is not None:
+            text = json.dumps({"code": error["code"], "msg": error["msg"]})
+            raise BinanceAPIException(None, error["status_code"], text)
+        return record["response"]
+
+    def call(self, endpoint: str, *args, **kwargs) -> Any:
+        """
+        Serve recorded response of request.
+        """
+        record = self._pop(endpoint, args, kwargs)
+        if self.replay_latency:
+            time.sleep(record["latency"])
+        return self._response(record)
+
+    async def acall(self, endpoint: str, *args, **kwargs) -> Any:
+        """
+        Coroutine version of call.
+        """
+        record = self._pop(endpoint, args, kwargs)
+        if self.replay_latency:
+            await asyncio.sleep(record["latency"])
+        return self._response(record)
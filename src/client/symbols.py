@@ -0,0 +1,97 @@
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.data.dump_data import DATA_FOLDER
+
+logger = logging.getLogger(__name__)
+
+CACHE_FOLDER = DATA_FOLDER / "cache"
+EXCHANGE_SYMBOLS_FPATH = CACHE_FOLDER / "exchange_symbols.json"
+EXCHANGE_SYMBOLS_TTL_SECONDS = 24 * 60 * 60
+
+
+def parse_exchange_symbols(exchange_info: Dict) -> List[Dict[str, str]]:
+    """
+    Extract symbols from spot exchange info response.
+    Symbols with any status are kept, because halted pairs may still have orders history.
+
+    Args:
+        exchange_info: Response of exchange info endpoint.
+
+    Returns:
+        List of dicts with symbol, baseAsset and quoteAsset.
+    """
+    symbols = []
+    for item in exchange_info["symbols"]:
+        symbols.append(
+            {
+                "symbol": item["symbol"],
+                "baseAsset": item["baseAsset"],
+                "quoteAsset": item["quoteAsset"],
+            }
+        )
+    return symbols
+
+
+def load_cached_symbols(
+    fpath: Path = EXCHANGE_SYMBOLS_FPATH,
+    ttl_seconds: float = EXCHANGE_SYMBOLS_TTL_SECONDS,
+) -> Optional[List[Dict[str, str]]]:
+    """
+    Load spot symbols from disk cache.
+
+    Returns:
+        List of symbols or None if cache is absent or expired.
+    """
+    if not fpath.exists():
+        return None
+    with open(fpath) as f:
+        cache = json.load(f)
+    if time.time() - cache["timestamp"] > ttl_seconds:
+        logger.info(f"Exchange symbols cache is expired: {fpath}")
+        return None
+    return cache["symbols"]
+
+
+def dump_cached_symbols(
+    symbols: List[Dict[str, str]], fpath: Path = EXCHANGE_SYMBOLS_FPATH
+):
+    fpath.parent.mkdir(exist_ok=True, parents=True)
+    with open(fpath, "w") as f:
+        json.dump({"timestamp": time.time(), "symbols": symbols}, f)
+    logger.info(
+        f"Exchange symbols cache was updated with {len(symbols)} symbols: {fpath}"
+    )
+
+
+def select_currency_pairs(
+    symbols: List[Dict[str, str]],
+    currency_items: Iterable[str],
+    held_coins: Optional[Iterable[str]] = None,
+) -> List[Tuple[str, str]]:
+    """
+    Select existing (base, quote) pairs with both coins from currency_items.
+
+    Args:
+        symbols: Spot symbols from exchange info.
+        currency_items: Coins to build pairs from.
+        held_coins: If set, keep only pairs with base coin from that list. Coin is held
+            if it has non-zero balance now or in daily snapshots of the last 30 days.
+
+    Returns:
+        List of (base_coin, quote_coin) tuples.
+    """
+    currency_items = set(currency_items)
+    held_coins = set(held_coins) if held_coins is not None else None
+    pairs = []
+    for item in symbols:
+        base_coin, quote_coin = item["baseAsset"], item["quoteAsset"]
+        if base_coin not in currency_items or quote_coin not in currency_items:
+            continue
+        if held_coins is not None and base_coin not in held_coins:
+            continue
+        pairs.append((base_coin, quote_coin))
+    return sorted(pairs)
@@ -3,16 +3,22 @@ from pathlib import Path
 
 import pandas as pd
 
-from src.utils.utils import cast_all_to_float
+from src.data.schema import apply_schema
 
 logger = logging.getLogger(__name__)
 
+TRADE_HISTORY_SCHEMA = {
+    "price": "float64",
+    "amount": "float64",
+    "total": "float64",
+    "fee": "float64",
+}
+
 
 def update_history(df):
     fpath = Path("long_binance_history.csv")
     if fpath.exists():
-        old_df = pd.read_csv(fpath)
-        cast_all_to_float(old_df)
+        old_df = apply_schema(pd.read_csv(fpath), TRADE_HISTORY_SCHEMA)
         new_df = pd.concat([old_df, df]).drop_duplicates().reset_index(drop=True)
     else:
         new_df = df
@@ -32,7 +38,7 @@ def get_data():
     # df = df[df['status'] != 'Canceled']
     # df = df[~df['date'].isna()].reset_index(drop=True)
     df["coin"] = df["market"].apply(lambda x: x[:-4])
-    cast_all_to_float(df)
+    df = apply_schema(df, TRADE_HISTORY_SCHEMA)
     df = update_history(df)
     return df
 
@@ -2,6 +2,7 @@ import logging
 
 import pandas as pd
 
+from src.data.schema import apply_order_schema
 from src.utils.utils import get_project_dir
 
 logger = logging.getLogger(__name__)
@@ -14,7 +15,7 @@ DUMP_PRICES_FPATH = DUMP_FOLDER / "prices_dump.csv"
 
 def load_orders_data():
     orders = pd.read_csv(DUMP_ORDERS_FPATH, parse_dates=["date"])
-    return orders
+    return apply_order_schema(orders)
 
 
 def dump_orders_data(orders: pd.DataFrame):
@@ -23,7 +24,9 @@ def dump_orders_data(orders: pd.DataFrame):
     if DUMP_ORDERS_FPATH.exists():
         orders_old = load_orders_data()
         mask_new = ~orders.date.apply(lambda t: t in orders_old.date.values)
-        new_orders = pd.concat([orders_old, orders[mask_new]], axis=0)
+        new_orders = apply_order_schema(
+            pd.concat([orders_old, orders[mask_new]], axis=0)
+        )
         new_lines = mask_new.sum()
     else:
         new_orders = orders
@@ -0,0 +1,228 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from src.data.dump_data import DATA_FOLDER
+
+logger = logging.getLogger(__name__)
+
+KLINES_STORE_FOLDER = DATA_FOLDER / "klines"
+INTERVAL_MS = {
+    "1m": 60 * 1000,
+    "1h": 60 * 60 * 1000,
+    "1d": 24 * 60 * 60 * 1000,
+}
+N_KLINES_COLUMNS = 12
+
+Range = Tuple[int, int]
+
+
+def to_milliseconds(value: Union[int, float, str, pd.Timestamp]) -> int:
+    """
+    Convert timestamp in milliseconds or date string, i.e. "1 Jan, 2021", to UTC milliseconds.
+    """
+    if isinstance(value, (int, float, np.integer)):
+        return int(value)
+    return int(pd.Timestamp(value).value // 10**6)
+
+
+def merge_ranges(ranges: List[Range]) -> List[Range]:
+    """
+    Merge overlapping and adjacent [start, end) ranges.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if len(merged) > 0 and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_ranges(start: int, end: int, covered: List[Range]) -> List[Range]:
+    """
+    Get parts of [start, end) range which are not covered by sorted merged ranges.
+    """
+    missing = []
+    for covered_start, covered_end in covered:
+        if covered_end <= start:
+            continue
+        if covered_start >= end:
+            break
+        if covered_start > start:
+            missing.append((start, covered_start))
+        start = max(start, covered_end)
+    if start < end:
+        missing.append((start, end))
+    return missing
+
+
+class KlinesStore:
+    """
+    On-disk store of klines per symbol and interval.
+    Klines are kept as sorted float64 arrays in .npy files and read with memory mapping.
+    Queried time ranges are tracked separately, so ranges without trading are not queried again.
+    Only closed klines are stored, the current kline is always queried.
+    """
+
+    def __init__(self, folder: Path = KLINES_STORE_FOLDER):
+        self.folder = folder
+        self._locks = defaultdict(threading.Lock)
+        self._locks_lock = threading.Lock()
+
+    def _data_fpath(self, symbol: str, interval: str) -> Path:
+        return self.folder / f"{symbol}_{interval}.npy"
+
+    def _ranges_fpath(self, symbol: str, interval: str) -> Path:
+        return self.folder / f"{symbol}_{interval}.json"
+
+    def lock(self, symbol: str, interval: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks[(symbol, interval)]
+
+    def load(self, symbol: str, interval: str) -> np.ndarray:
+        fpath = self._data_fpath(symbol, interval)
+        if not fpath.exists():
+            return np.empty((0, N_KLINES_COLUMNS))
+        return np.load(fpath, mmap_mode="r")
+
+    def load_covered_ranges(self, symbol: str, interval: str) -> List[Range]:
+        fpath = self._ranges_fpath(symbol, interval)
+        if not fpath.exists():
+            return []
+        with open(fpath) as f:
+            return [tuple(r) for r in json.load(f)["ranges"]]
+
+    @staticmethod
+    def closed_klines_end(interval: str) -> int:
+        """
+        Open time of the current kline, klines opened before it are closed.
+        """
+        interval_ms = INTERVAL_MS[interval]
+        return int(time.time() * 1000) // interval_ms * interval_ms
+
+    def missing_ranges(
+        self, symbol: str, interval: str, start_time: int, end_time: int
+    ) -> List[Range]:
+        """
+        Get ranges of [start_time, end_time) which were never queried.
+        Part of range after the last closed kline is always missing.
+        """
+        interval_ms = INTERVAL_MS[interval]
+        start_time = start_time // interval_ms * interval_ms
+        return subtract_ranges(
+            start_time, end_time, self.load_covered_ranges(symbol, interval)
+        )
+
+    def add(self, symbol: str, interval: str, klines: List[list], ranges: List[Range]):
+        """
+        Save queried klines and mark ranges as queried. Klines after the last closed one are ignored.
+        """
+        closed_end = self.closed_klines_end(interval)
+        ranges = [(start, min(end, closed_end)) for start, end in ranges]
+        ranges = [(start, end) for start, end in ranges if start < end]
+        if len(ranges) == 0:
+            return
+        new_data = np.asarray(klines, dtype=float).reshape(-1, N_KLINES_COLUMNS)
+        new_data = new_data[new_data[:, 0] < closed_end]
+        data = np.concatenate([np.asarray(self.load(symbol, interval)), new_data])
+        _, unique_idx = np.unique(data[:, 0], return_index=True)
+        data = data[unique_idx]
+
+        self.folder.mkdir(exist_ok=True, parents=True)
+        # replace file instead of rewriting it, memory mapped readers keep the old one
+        fpath = self._data_fpath(symbol, interval)
+        tmp_fpath = fpath.with_suffix(".tmp.npy")
+        np.save(tmp_fpath, data)
+        os.replace(tmp_fpath, fpath)
+        covered = merge_ranges(self.load_covered_ranges(symbol, interval) + ranges)
+        with open(self._ranges_fpath(symbol, interval), "w") as f:
+            json.dump({"ranges": covered}, f)
+        logger.debug(
+            f"Klines store {symbol} {interval} was updated with {len(new_data)} klines"
+        )
+
+    def read(
+        self, symbol: str, interval: str, start_time: int, end_time: int
+    ) -> np.ndarray:
+        """
+        Read stored klines opened in [start_time, end_time).
+        """
+        data = self.load(symbol, interval)
+        start, end = np.searchsorted(data[:, 0], [start_time, end_time])
+        return np.array(data[start:end])
+
+    def get_klines(
+        self,
+        fetch: Callable[[str, str, int, int], List[list]],
+        symbol: str,
+        interval: str,
+        start_time: Union[int, str],
+        end_time: Optional[Union[int, str]] = None,
+    ) -> np.ndarray:
+        """
+        Get klines opened in [start_time, end_time), only missing ranges are queried.
+
+        Args:
+            fetch: Function querying klines of (symbol, interval, start_time, end_time).
+            symbol: Name of symbol.
+            interval: Klines interval, one of INTERVAL_MS keys.
+            start_time: Milliseconds or date string.
+            end_time: Milliseconds or date string. If None then up to now including the current kline.
+
+        Returns:
+            Array with KLINES_COLUMNS columns.
+        """
+        start_time, end_time = self.normalize_range(start_time, end_time)
+        with self.lock(symbol, interval):
+            missing = self.missing_ranges(symbol, interval, start_time, end_time)
+            fetched = []
+            for range_start, range_end in missing:
+                fetched.extend(fetch(symbol, interval, range_start, range_end - 1))
+            return self.save_and_read(
+                symbol, interval, start_time, end_time, missing, fetched
+            )
+
+    @staticmethod
+    def normalize_range(
+        start_time: Union[int, str], end_time: Optional[Union[int, str]] = None
+    ) -> Range:
+        start_time = to_milliseconds(start_time)
+        if end_time is None:
+            return start_time, int(time.time() * 1000) + 1
+        return start_time, to_milliseconds(end_time)
+
+    def save_and_read(
+        self,
+        symbol: str,
+        interval: str,
+        start_time: int,
+        end_time: int,
+        missing: List[Range],
+        fetched: List[list],
+    ) -> np.ndarray:
+        """
+        Save klines queried for missing ranges and read klines opened in [start_time, end_time).
+        Klines which are not stored, i.e. the current one, are taken from queried klines.
+        """
+        if len(missing) > 0:
+            self.add(symbol, interval, fetched, missing)
+        data = self.read(symbol, interval, start_time, end_time)
+
+        stored_end = self.closed_klines_end(interval)
+        if end_time > stored_end and len(fetched) > 0:
+            fetched = np.asarray(fetched, dtype=float).reshape(-1, N_KLINES_COLUMNS)
+            mask = (fetched[:, 0] >= stored_end) & (fetched[:, 0] < end_time)
+            data = np.concatenate([data, fetched[mask]])
+        return data
+
+
+KLINES_STORE = KlinesStore()
@@ -1,14 +1,34 @@
 import logging
-from typing import List
+from typing import List, Tuple
 
+import numpy as np
 import pandas as pd
 
 from src.client.client import ClientHelper
 from src.data.preprocessing.base import BaseProcessor
-from src.utils.utils import (cast_all_to_float, convert_timestamp_to_datetime)
+from src.data.schema import apply_order_schema, to_local_datetime
+from src.data.trade_prices import TradePriceResolver
 
 logger = logging.getLogger(__name__)
 
+ALLOWED_QUOTE_COINS = ["USDT", "BUSD", "RUB"]
+TRANSACTION_COIN = "USDT"
+
+
+def conversion_price_lookups(
+    div_orders: pd.DataFrame, transaction_coin: str = TRANSACTION_COIN
+) -> Tuple[pd.Series, pd.Series, np.ndarray]:
+    """
+    Get (symbol, time) lookups of prices of coin-to-coin orders in transaction coin.
+
+    Returns:
+        Symbols of sell legs, symbols of buy legs and times of orders in milliseconds.
+    """
+    sell_symbols = div_orders["quote_coin"].astype(str) + transaction_coin
+    buy_symbols = div_orders["base_coin"].astype(str) + transaction_coin
+    times = div_orders["updateTime"].to_numpy(dtype="int64")
+    return sell_symbols, buy_symbols, times
+
 
 class OrdersProcessor(BaseProcessor):
     def __init__(
@@ -25,6 +45,7 @@ class OrdersProcessor(BaseProcessor):
         """
         self.divide_coin_convertion = divide_coin_convertion
         self._client_helper = client_helper
+        self._price_resolver = TradePriceResolver(client_helper)
 
     def transform(self, data: pd.DataFrame) -> pd.DataFrame:
         """
@@ -32,58 +53,89 @@ class OrdersProcessor(BaseProcessor):
         Returns:
             Processed DataFrame with history of orders.
         """
-        cast_all_to_float(data, except_columns=["time", "updateTime"])
+        data = apply_order_schema(data)
 
         if self.divide_coin_convertion:
-            data = self.divide_coin_convertion_into_usdt_operations(data)
+            data = apply_order_schema(
+                self.divide_coin_convertion_into_usdt_operations(data)
+            )
 
         if len(data) > 0:
-            data["date"] = data["time"].apply(convert_timestamp_to_datetime)
+            data["date"] = to_local_datetime(data["time"])
             data = data.sort_values("date").reset_index(drop=True)
         return data
 
+    def klines_requests(self, data: pd.DataFrame) -> List[Tuple[str, str, int, int]]:
+        """
+        Get arguments of get_klines which transform queries for prices of coin-to-coin orders,
+        so klines can be fetched in advance, see TradePriceResolver.klines_requests.
+        """
+        if not self.divide_coin_convertion:
+            return []
+        data = apply_order_schema(data)
+        div_orders = data[~data["quote_coin"].isin(ALLOWED_QUOTE_COINS)]
+        sell_symbols, buy_symbols, times = conversion_price_lookups(div_orders)
+        return self._price_resolver.klines_requests(
+            np.concatenate([sell_symbols.to_numpy(), buy_symbols.to_numpy()]),
+            np.concatenate([times, times]),
+        )
+
     def divide_coin_convertion_into_usdt_operations(
         self, orders: pd.DataFrame, allowed_quote_coins: List[str] = None
     ):
         if allowed_quote_coins is None:
-            allowed_quote_coins = ["USDT", "BUSD", "RUB"]
-        transaction_coin = "USDT"
+            allowed_quote_coins = ALLOWED_QUOTE_COINS
+        transaction_coin = TRANSACTION_COIN
         pair_mask = orders["quote_coin"].isin(allowed_quote_coins)
         ok_orders = orders[pair_mask]
         div_orders = orders[~pair_mask]
-        divided_orders = []
-
-        for i, row in div_orders.iterrows():
-            time = row["updateTime"]
-            sell_row = row.copy()
-            sell_symbol = row["quote_coin"] + transaction_coin
-            candle = self._client_helper.get_aggregate_trades(
-                symbol=sell_symbol, time=time
-            )
-            sell_row["symbol"] = sell_symbol
-            sell_row["side"] = "SELL"
-            sell_row["price"] = float(candle["p"])
-            sell_row["base_coin"] = row["quote_coin"]
-            sell_row["quote_coin"] = transaction_coin
-            sell_row["cummulativeQuoteQty"] = (
-                row["cummulativeQuoteQty"] * sell_row["price"]
-            )
-            sell_row["origQty"] = row["cummulativeQuoteQty"]
-            sell_row["executedQty"] = row["cummulativeQuoteQty"]
 
-            buy_row = row.copy()
-            buy_symbol = row["base_coin"] + transaction_coin
-            candle = self._client_helper.get_aggregate_trades(
-                symbol=buy_symbol, time=time
+        # resolve prices of all sell and buy legs in one batch
+        sell_symbols, buy_symbols, times = conversion_price_lookups(
+            div_orders, transaction_coin
+        )
+        prices = self._price_resolver.resolve(
+            np.concatenate([sell_symbols.to_numpy(), buy_symbols.to_numpy()]),
+            np.concatenate([times, times]),
+        )
+        sell_prices, buy_prices = prices[: len(div_orders)], prices[len(div_orders):]
+        # NaN price would turn corrected balance of the whole coin history into NaN
+        resolved = ~np.isnan(sell_prices) & ~np.isnan(buy_prices)
+        if not resolved.all():
+            logger.warning(
+                f"{(~resolved).sum()} of {len(div_orders)} coin-to-coin orders are dropped, "
+                f"there are no prices to divide them into {transaction_coin} operations: "
+                f"orderId {div_orders.loc[~resolved, 'orderId'].tolist()}"
             )
+            div_orders = div_orders[resolved]
+            sell_symbols, buy_symbols = sell_symbols[resolved], buy_symbols[resolved]
+            sell_prices, buy_prices = sell_prices[resolved], buy_prices[resolved]
+
+        # sell quote coin for usdt
+        sell_orders = div_orders.copy()
+        sell_orders["symbol"] = sell_symbols
+        sell_orders["side"] = "SELL"
+        sell_orders["price"] = sell_prices
+        sell_orders["base_coin"] = div_orders["quote_coin"]
+        sell_orders["quote_coin"] = transaction_coin
+        sell_orders["cummulativeQuoteQty"] = (
+            div_orders["cummulativeQuoteQty"].to_numpy() * sell_prices
+        )
+        sell_orders["origQty"] = div_orders["cummulativeQuoteQty"]
+        sell_orders["executedQty"] = div_orders["cummulativeQuoteQty"]
 
-            buy_row["symbol"] = buy_symbol
-            buy_row["price"] = float(candle["p"])
-            buy_row["quote_coin"] = transaction_coin
-            buy_row["cummulativeQuoteQty"] = row["executedQty"] * buy_row["price"]
+        # buy base coin for usdt
+        buy_orders = div_orders.copy()
+        buy_orders["symbol"] = buy_symbols
+        buy_orders["price"] = buy_prices
+        buy_orders["quote_coin"] = transaction_coin
+        buy_orders["cummulativeQuoteQty"] = (
+            div_orders["executedQty"].to_numpy() * buy_prices
+        )
 
-            divided_orders.append(sell_row)
-            divided_orders.append(buy_row)
-        divided_orders = pd.DataFrame(divided_orders)
+        # keep sell leg right before buy leg of each order
+        divided_orders = pd.concat([sell_orders, buy_orders])
+        legs_order = np.arange(2 * len(div_orders)).reshape(2, -1).T.reshape(-1)
+        divided_orders = divided_orders.iloc[legs_order]
         orders = pd.concat([ok_orders, divided_orders])
         return orders
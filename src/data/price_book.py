@@ -0,0 +1,152 @@
+import logging
+from typing import Dict, Iterable, List, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from src.data.schema import TICKERS_SCHEMA, parse_records
+
+logger = logging.getLogger(__name__)
+
+MAIN_CURRENCY = "USDT"
+COINS_PRICE_MATCHES = {"BETH": "ETH"}
+
+
+class PriceBook:
+    """
+    Current prices indexed by (base_coin, quote_coin).
+    Coins from aliases get price of matched coin and each quote coin costs 1 of itself.
+    """
+
+    def __init__(
+        self, prices: pd.Series, aliases: Dict[str, str] = COINS_PRICE_MATCHES
+    ):
+        """
+        Args:
+            prices: Prices with (base_coin, quote_coin) MultiIndex.
+            aliases: Mapping of coin to coin with the same price, i.e. BETH -> ETH.
+        """
+        prices = prices.astype(float)
+        prices.index = prices.index.set_names(["base_coin", "quote_coin"])
+        prices = prices[~prices.index.duplicated(keep="first")]
+        extra = {}
+        quote_coins = prices.index.get_level_values("quote_coin").unique()
+        for quote_coin in quote_coins:
+            extra[(quote_coin, quote_coin)] = 1.0
+            for alias, coin in aliases.items():
+                if (coin, quote_coin) in prices.index:
+                    extra[(alias, quote_coin)] = prices[(coin, quote_coin)]
+        extra = {k: v for k, v in extra.items() if k not in prices.index}
+        if len(extra) > 0:
+            extra = pd.Series(
+                extra,
+                index=pd.MultiIndex.from_tuples(list(extra), names=prices.index.names),
+            )
+            prices = pd.concat([prices, extra])
+        self._prices = prices.sort_index()
+        self._prices.name = "price"
+        self._snapshot_id = None
+
+    @classmethod
+    def from_tickers(
+        cls,
+        tickers: List[Dict[str, str]],
+        quote_coins: Sequence[str] = (MAIN_CURRENCY,),
+        aliases: Dict[str, str] = COINS_PRICE_MATCHES,
+    ) -> "PriceBook":
+        """
+        Make price book from symbol price tickers.
+
+        Args:
+            tickers: List of dicts with symbol and price.
+            quote_coins: Symbols with these quote coins are kept.
+            aliases: Mapping of coin to coin with the same price.
+        """
+        tickers = parse_records(tickers, TICKERS_SCHEMA)
+        parts = []
+        for quote_coin in quote_coins:
+            quote_tickers = tickers[tickers["symbol"].str.endswith(quote_coin)]
+            parts.append(
+                pd.DataFrame(
+                    {
+                        "base_coin": quote_tickers["symbol"].str[: -len(quote_coin)],
+                        "quote_coin": quote_coin,
+                        "price": quote_tickers["price"],
+                    }
+                )
+            )
+        prices = pd.concat(parts).set_index(["base_coin", "quote_coin"])["price"]
+        return cls(prices, aliases=aliases)
+
+    @property
+    def prices(self) -> pd.Series:
+        return self._prices
+
+    @property
+    def snapshot_id(self) -> int:
+        """
+        Hash of prices, price books with the same prices have the same snapshot id.
+        """
+        if self._snapshot_id is None:
+            hashes = pd.util.hash_pandas_object(self._prices, index=True)
+            self._snapshot_id = int(hashes.to_numpy().sum())
+        return self._snapshot_id
+
+    def __contains__(self, base_coin: str) -> bool:
+        return base_coin in self._prices.index.get_level_values("base_coin")
+
+    def get(self, base_coin: str, quote_coin: str = MAIN_CURRENCY) -> float:
+        """
+        Get price of single coin, NaN if it is not listed.
+        """
+        return self._prices.get((base_coin, quote_coin), np.nan)
+
+    def lookup(
+        self,
+        base_coins: Iterable[str],
+        quote_coins: Union[str, Iterable[str]] = MAIN_CURRENCY,
+    ) -> np.ndarray:
+        """
+        Vectorized lookup of prices.
+
+        Args:
+            base_coins: Base coin of each lookup.
+            quote_coins: Quote coin of each lookup or single quote coin for all of them.
+
+        Returns:
+            Prices in the order of lookups, NaN for coins which are not listed.
+        """
+        base_coins = np.asarray(list(base_coins), dtype=object)
+        if isinstance(quote_coins, str):
+            quote_coins = np.full(len(base_coins), quote_coins, dtype=object)
+        else:
+            quote_coins = np.asarray(list(quote_coins), dtype=object)
+        index = pd.MultiIndex.from_arrays([base_coins, quote_coins])
+        return self._prices.reindex(index).to_numpy()
+
+    def join(
+        self,
+        df: pd.DataFrame,
+        base_col: str = "base_coin",
+        quote_col: str = None,
+        price_col: str = "price",
+    ) -> pd.DataFrame:
+        """
+        Add price column to table, like left merge on base and quote coin.
+
+        Args:
+            df: Table with base coin column.
+            base_col: Name of base coin column.
+            quote_col: Name of quote coin column. If None then prices in MAIN_CURRENCY are used.
+            price_col: Name of added column.
+        """
+        df = df.copy()
+        quote_coins = MAIN_CURRENCY if quote_col is None else df[quote_col]
+        df[price_col] = self.lookup(df[base_col], quote_coins)
+        return df
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Table with columns ['price', 'base_coin', 'quote_coin'].
+        """
+        return self._prices.reset_index()[["price", "base_coin", "quote_coin"]]
@@ -1,35 +1,43 @@
 import logging
+from typing import Dict, List
 
 import pandas as pd
 from binance.exceptions import BinanceAPIException
 
 from src.client.client import ClientHelper
 from src.data.dump_data import DUMP_PRICES_FPATH
+from src.data.price_book import COINS_PRICE_MATCHES
 
 logger = logging.getLogger(__name__)
 
 START_PRICES_DATE = "2017-01-01"
-COINS_PRICE_MATCHES = {"BETH": "ETH"}
+PRICES_INTERVAL = "1d"
+
+
+def get_price_symbols(currency_items: List[str]) -> Dict[str, str]:
+    """
+    Get usdt symbol of each coin, coins from COINS_PRICE_MATCHES take prices of matched coins.
+    """
+    return {
+        coin: COINS_PRICE_MATCHES.get(coin, coin) + "USDT" for coin in currency_items
+    }
 
 
 def get_prices(client_helper: ClientHelper, start_date=START_PRICES_DATE):
-    if DUMP_PRICES_FPATH.exists():
-        price_history_old = pd.read_csv(DUMP_PRICES_FPATH, parse_dates=["date"])
-        last_time = price_history_old.iloc[-1]["date"].strftime("%Y-%m-%d")
-        start_date = last_time
+    """
+    Get daily close prices of currency_items in usdt. Prices are read through the klines store of client_helper,
+    so only days which are not stored yet are queried.
 
-    currency_items = client_helper.currency_items
+    Returns:
+        Table with date column and column per coin.
+    """
+    price_symbols = get_price_symbols(client_helper.currency_items)
     price_history_new = []
 
-    for base_coin in currency_items:
+    for base_coin, symbol in price_symbols.items():
         try:
-            base_coin_ = (
-                COINS_PRICE_MATCHES[base_coin]
-                if base_coin in COINS_PRICE_MATCHES
-                else base_coin
-            )
             price_history = client_helper.get_historical_prices(
-                base_coin_ + "USDT", start_date=start_date
+                symbol, start_date=start_date
             )
             price_history = price_history[["Close", "date"]].set_index("date")
             price_history.columns = [base_coin]
@@ -38,14 +46,11 @@ def get_prices(client_helper: ClientHelper, start_date=START_PRICES_DATE):
             logger.info(f"Can not get prices for {base_coin}")
 
     price_history_new = pd.concat(price_history_new, axis=1).reset_index()
-    new_lines = len(price_history_new)
-
-    if DUMP_PRICES_FPATH.exists():
-        price_history_new = pd.concat([price_history_old.iloc[:-1], price_history_new])
 
+    DUMP_PRICES_FPATH.parent.mkdir(exist_ok=True, parents=True)
     price_history_new.to_csv(DUMP_PRICES_FPATH, index=False)
     logger.info(
-        f"Prices dump was updated with {new_lines} new lines (days): {DUMP_PRICES_FPATH}"
+        f"Prices dump was updated with {len(price_history_new)} lines (days): {DUMP_PRICES_FPATH}"
     )
     return price_history_new
 
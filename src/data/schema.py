@@ -0,0 +1,122 @@
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Union
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+HOUR_MS = 60 * 60 * 1000
+
+ORDER_SCHEMA: Dict[str, str] = {
+    "symbol": "category",
+    "orderId": "int64",
+    "orderListId": "int64",
+    "clientOrderId": "object",
+    "price": "float64",
+    "origQty": "float64",
+    "executedQty": "float64",
+    "cummulativeQuoteQty": "float64",
+    "status": "category",
+    "timeInForce": "category",
+    "type": "category",
+    "side": "category",
+    "stopPrice": "float64",
+    "icebergQty": "float64",
+    "time": "int64",
+    "updateTime": "int64",
+    "isWorking": "boolean",
+    "workingTime": "Int64",
+    "origQuoteOrderQty": "float64",
+    "selfTradePreventionMode": "category",
+    "base_coin": "category",
+    "quote_coin": "category",
+}
+
+KLINES_SCHEMA: Dict[str, str] = {
+    "Open time": "int64",
+    "Open": "float64",
+    "High": "float64",
+    "Low": "float64",
+    "Close": "float64",
+    "Volume": "float64",
+    "Close time": "int64",
+    "Quote asset volume": "float64",
+    "Number of trades": "int64",
+    "Taker buy base asset volume": "float64",
+    "Taker buy quote asset volume": "float64",
+    "Can be ignored": "float64",
+}
+TICKERS_SCHEMA: Dict[str, str] = {"symbol": "object", "price": "float64"}
+BALANCES_SCHEMA: Dict[str, str] = {
+    "asset": "object",
+    "free": "float64",
+    "locked": "float64",
+}
+SNAPSHOT_SCHEMA: Dict[str, str] = {
+    "type": "category",
+    "updateTime": "int64",
+    "totalAssetOfBtc": "float64",
+}
+
+
+def apply_schema(df: pd.DataFrame, schema: Dict[str, str]) -> pd.DataFrame:
+    """
+    Cast columns of table to dtypes of schema, columns which are not in schema are kept as is.
+    """
+    dtypes = {
+        col: dtype
+        for col, dtype in schema.items()
+        if col in df.columns and df[col].dtype != dtype
+    }
+    if len(dtypes) == 0:
+        return df
+    return df.astype(dtypes)
+
+
+def parse_records(records, schema: Dict[str, str]) -> pd.DataFrame:
+    """
+    Make table of payload records, i.e. list of dicts or rows, with columns and dtypes of schema.
+    """
+    return apply_schema(pd.DataFrame(records, columns=list(schema)), schema)
+
+
+def apply_order_schema(orders: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cast orders to ORDER_SCHEMA: categorical enum-like columns, int64 millisecond timestamps and ids,
+    float64 prices and quantities.
+    """
+    return apply_schema(orders, ORDER_SCHEMA)
+
+
+def replace_category(values: pd.Series, old: str, new: str) -> pd.Series:
+    """
+    Replace value of categorical column.
+    """
+    if new not in values.cat.categories:
+        values = values.cat.add_categories([new])
+    return values.mask(values == old, new).cat.remove_unused_categories()
+
+
+def to_local_datetime(timestamps: Union[pd.Series, np.ndarray]) -> pd.Series:
+    """
+    Vectorized conversion of millisecond timestamps to naive local datetimes, like datetime.fromtimestamp.
+    UTC offset is calculated once per hour of timestamps, so daylight saving time is taken into account.
+    """
+    timestamps = pd.Series(timestamps).astype("int64")
+    hours = timestamps.to_numpy() // HOUR_MS
+    unique_hours, hours_idx = np.unique(hours, return_inverse=True)
+    offsets_ms = np.array(
+        [
+            (
+                datetime.fromtimestamp(hour * 3600)
+                - datetime.fromtimestamp(hour * 3600, timezone.utc).replace(tzinfo=None)
+            )
+            // pd.Timedelta("1ms")
+            for hour in unique_hours.tolist()
+        ],
+        dtype=np.int64,
+    )
+    local_ms = timestamps + offsets_ms[hours_idx.reshape(-1)]
+    return pd.to_datetime(local_ms, unit="ms")
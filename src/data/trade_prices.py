@@ -0,0 +1,131 @@
+import logging
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from binance.exceptions import BinanceAPIException
+
+from src.client.client import ClientHelper
+from src.data.klines_store import INTERVAL_MS, merge_ranges
+
+logger = logging.getLogger(__name__)
+
+PRICE_INTERVAL = "1m"
+PRICE_SEARCH_HORIZON_MS = 60 * 60 * 1000
+OPEN_TIME_IDX = 0
+CLOSE_IDX = 4
+N_TRADES_IDX = 8
+
+
+def next_traded_index(n_trades: np.ndarray) -> np.ndarray:
+    """
+    For each kline get index of the first kline at or after it with trades, len(n_trades) if there is none.
+    """
+    idx = np.where(n_trades > 0, np.arange(len(n_trades)), len(n_trades))
+    return np.minimum.accumulate(idx[::-1])[::-1]
+
+
+class TradePriceResolver:
+    """
+    Resolve prices of many (symbol, time) lookups with few klines requests.
+    Lookups are grouped by symbol, klines covering all of them are read through the klines store,
+    and each lookup is answered with binary search over kline open times.
+    Price of lookup is close price of the first kline with trades at or after lookup time,
+    if there is no such kline within search horizon then price is NaN.
+    """
+
+    def __init__(
+        self,
+        client_helper: ClientHelper,
+        interval: str = PRICE_INTERVAL,
+        horizon_ms: int = PRICE_SEARCH_HORIZON_MS,
+    ):
+        self._client_helper = client_helper
+        self.interval = interval
+        self.horizon_ms = horizon_ms
+
+    def _covering_ranges(self, times: np.ndarray) -> List[Tuple[int, int]]:
+        interval_ms = INTERVAL_MS[self.interval]
+        starts = times // interval_ms * interval_ms
+        return merge_ranges(
+            [(int(s), int(t) + self.horizon_ms) for s, t in zip(starts, times)]
+        )
+
+    def _load_klines(self, symbol: str, times: np.ndarray) -> np.ndarray:
+        klines = [
+            self._client_helper.get_klines(symbol, self.interval, start, end)
+            for start, end in self._covering_ranges(times)
+        ]
+        return np.concatenate(klines)
+
+    def resolve_symbol(self, symbol: str, times: Sequence[int]) -> np.ndarray:
+        """
+        Resolve prices of one symbol.
+
+        Returns:
+            Prices in the order of times, NaN if there are no trades within search horizon.
+        """
+        times = np.asarray(times, dtype=np.int64)
+        prices = np.full(len(times), np.nan)
+        if len(times) == 0:
+            return prices
+        try:
+            klines = self._load_klines(symbol, times)
+        except BinanceAPIException as ex:
+            logger.warning(f"Can not get klines for {symbol}: {ex.message}")
+            return prices
+        if len(klines) == 0:
+            return prices
+
+        open_times = klines[:, OPEN_TIME_IDX]
+        interval_ms = INTERVAL_MS[self.interval]
+        idx = np.searchsorted(open_times, times // interval_ms * interval_ms)
+        idx = np.append(next_traded_index(klines[:, N_TRADES_IDX]), len(klines))[idx]
+        found = idx < len(klines)
+        found[found] = open_times[idx[found]] < times[found] + self.horizon_ms
+        prices[found] = klines[idx[found], CLOSE_IDX]
+        return prices
+
+    def klines_requests(
+        self, symbols: Sequence[str], times: Sequence[int]
+    ) -> List[Tuple[str, str, int, int]]:
+        """
+        Get arguments of get_klines which resolve queries for lookups, so klines can be fetched in advance.
+
+        Returns:
+            List of (symbol, interval, start_time, end_time).
+        """
+        lookups = pd.DataFrame({"symbol": symbols, "time": times})
+        return [
+            (symbol, self.interval, start, end)
+            for symbol, symbol_lookups in lookups.groupby("symbol")
+            for start, end in self._covering_ranges(
+                np.asarray(symbol_lookups["time"].values, dtype=np.int64)
+            )
+        ]
+
+    def resolve(self, symbols: Sequence[str], times: Sequence[int]) -> np.ndarray:
+        """
+        Resolve prices of (symbol, time) lookups.
+
+        Args:
+            symbols: Symbol of each lookup.
+            times: Time of each lookup in milliseconds.
+
+        Returns:
+            Prices in the order of lookups, NaN if price is not available.
+        """
+        lookups = pd.DataFrame({"symbol": symbols, "time": times})
+        prices = np.full(len(lookups), np.nan)
+        for symbol, symbol_lookups in lookups.groupby("symbol"):
+            prices[symbol_lookups.index.values] = self.resolve_symbol(
+                symbol, symbol_lookups["time"].values
+            )
+        is_missing = np.isnan(prices)
+        if is_missing.any():
+            missing_symbols = sorted(lookups.loc[is_missing, "symbol"].unique())
+            logger.warning(
+                f"Prices are not available for {is_missing.sum()} of {len(prices)} lookups, "
+                f"symbols: {missing_symbols}"
+            )
+        return prices
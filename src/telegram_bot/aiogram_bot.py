@@ -6,12 +6,14 @@ from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.utils import executor
 
+from src.analysis.html_report import SUMMARY_IMAGES, make_report_async
 from src.utils.utils import load_config_json
 
 logger = logging.getLogger(__name__)
 
 
 API_TOKEN = load_config_json("config/telegram_bot/token.json")["token"]
+MEDIA_GROUP_SIZE = 10  # telegram limit of photos in one message
 
 
 bot = Bot(token=API_TOKEN)
@@ -35,6 +37,7 @@ async def cmd_start(message: types.Message):
     row_btns = [
         types.InlineKeyboardButton("set api key", callback_data="set_api_key"),
         types.InlineKeyboardButton("get report", callback_data="get_report"),
+        types.InlineKeyboardButton("get summary", callback_data="get_summary"),
     ]
     keyboard_markup.row(*row_btns)
     keyboard_markup.add(
@@ -44,7 +47,8 @@ async def cmd_start(message: types.Message):
     # Set state
     await message.answer(
         "Hi there! Available commands:\n\n/set_api_key — set or update binance api key"
-        "\n\n/get_report — ask for creating html report",
+        "\n\n/get_report — ask for creating html report"
+        "\n\n/get_summary — ask for summary images of report",
         reply_markup=keyboard_markup,
     )
 
@@ -88,6 +92,14 @@ async def inline_get_report_callback_handler(query: types.CallbackQuery):
     )
     await query.answer(f"You click {answer_data!r}")
 
+    api_keys = load_config_json("config/telegram_bot/binance_keys.json")
+    html_fpath = await make_report_async(
+        api_keys["api_key"], api_keys["api_secret"], compact=True
+    )
+    with open(html_fpath, "rb") as html_file:
+        await bot.send_document(query.from_user.id, html_file)
+    logger.info("html file was sended to user")
+
 
 @dp.message_handler(commands="get_report")
 async def cmd_set_api_key(message: types.Message):
@@ -95,5 +107,33 @@ async def cmd_set_api_key(message: types.Message):
     await Form.user_api_key.set()
 
 
+async def send_summary_images(user_id: int):
+    api_keys = load_config_json("config/telegram_bot/binance_keys.json")
+    fpaths = await make_report_async(
+        api_keys["api_key"], api_keys["api_secret"], mode=SUMMARY_IMAGES
+    )
+    for start in range(0, len(fpaths), MEDIA_GROUP_SIZE):
+        media = types.MediaGroup()
+        for fpath in fpaths[start : start + MEDIA_GROUP_SIZE]:
+            media.attach_photo(types.InputFile(fpath))
+        await bot.send_media_group(user_id, media)
+    logger.info(f"{len(fpaths)} summary images were sended to user")
+
+
+@dp.callback_query_handler(text="get_summary")
+async def inline_get_summary_callback_handler(query: types.CallbackQuery):
+    await bot.send_message(
+        query.from_user.id, "Building summary images, wait a minute. 🐌"
+    )
+    await query.answer(f"You click {query.data!r}")
+    await send_summary_images(query.from_user.id)
+
+
+@dp.message_handler(commands="get_summary")
+async def cmd_get_summary(message: types.Message):
+    await message.answer("Building summary images, wait a minute. 🐌")
+    await send_summary_images(message.from_user.id)
+
+
 def start_bot():
     executor.start_polling(dp, skip_updates=True)
@@ -92,7 +92,10 @@ class TelegramBotHandler:
 
         api_keys = load_config_json("config/telegram_bot/binance_keys.json")
         html_fpath = make_report(
-            api_keys["api_key"], api_keys["api_secret"], open_file=False
+            api_keys["api_key"],
+            api_keys["api_secret"],
+            open_file=False,
+            compact=True,
         )
 
         with open(html_fpath, "rb") as html_file:
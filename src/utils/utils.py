@@ -1,15 +1,8 @@
-import datetime
 import json
 from pathlib import Path
-from typing import List
-
-import pandas as pd
-from kaleido.scopes.plotly import PlotlyScope
-
-PLOT_CONVERTER = PlotlyScope()
 
 try:
-    from plotly.offline import plot
+    from plotly.offline import get_plotlyjs, get_plotlyjs_version, plot
 except ModuleNotFoundError:
     pass
 
@@ -24,9 +17,19 @@ def get_html_body_from_plotly_figure(fig):
     return plot(fig, include_plotlyjs=False, output_type="div")
 
 
-def convert_plotly_figure_to_html(fig):
+def get_plotlyjs_script(inline=False):
+    """
+    Script tag of plotly.js of the version bundled with plotly, inlined report can be opened offline.
+    """
+    if inline:
+        return '<script type="text/javascript">' + get_plotlyjs() + "</script>"
+    src = f"https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"
+    return f'<script type="text/javascript" src="{src}"></script>'
+
+
+def convert_plotly_figure_to_html(fig, inline_plotlyjs=False):
     raw_html = '<html><head><meta charset="utf-8" />'
-    raw_html += '<script type="text/javascript" src="https://cdn.plot.ly/plotly-latest.min.js"></script></head>'
+    raw_html += get_plotlyjs_script(inline_plotlyjs) + "</head>"
     raw_html += "<body>"
     raw_html += get_html_body_from_plotly_figure(fig)
     raw_html += "</body></html>"
@@ -46,8 +49,11 @@ def save_plot_with_external_script_link(fig, fpath, auto_open=False):
 
 
 def save_multiple_formats(fig, html_path, scale=3, width=1200, height=700):
-    png_data = PLOT_CONVERTER.transform(
-        fig, format="png", scale=scale, width=width, height=height
+    # kaleido is started by exporter on the first export, not on import
+    from src.analysis.image_export import get_image_exporter
+
+    png_data = get_image_exporter().export(
+        fig, "png", width=width, height=height, scale=scale
     )
     Path(html_path).parent.mkdir(exist_ok=True, parents=True)
     png_path = Path(html_path).with_suffix(".png")
@@ -74,18 +80,3 @@ def load_api_keys_from_json(fpath):
     with open(fpath) as f:
         keys = json.load(f)
     return keys["api_key"], keys["api_secret"]
-
-
-def convert_timestamp_to_datetime(t):
-    return datetime.datetime.fromtimestamp(int(t) / 1000)
-
-
-def cast_all_to_float(df: pd.DataFrame, except_columns: List = None):
-    if except_columns is None:
-        except_columns = []
-    for c in set(df.columns) - set(except_columns):
-        try:
-            df[c] = df[c].astype(float)
-            df[c] = df[c].round(10)
-        except ValueError:
-            pass
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.analysis.analyse import calculate_corrected_balance_for_pair
+
+
+def calculate_corrected_balance_for_pair_reference(
+    pair_orders: pd.DataFrame,
+) -> pd.DataFrame:
+    """
+    Quadratic loop version of calculate_corrected_balance_for_pair which is replaced by it.
+    """
+    pair_orders = pair_orders.copy()
+    pair_orders["executedCorrectedQty"] = pair_orders["executedQty"]
+    pair_orders["usdtValue"] = np.nan
+    pair_orders["usdtValueCorrection"] = np.nan
+    pair_orders.loc[
+        pair_orders["side"] == "SELL", ["executedCorrectedQty", "usdtValue"]
+    ] = None
+    pair_orders["usdtQtyWeight"] = np.nan
+    pair_orders = pair_orders.reset_index(drop=True)
+    for i in range(len(pair_orders)):
+        mask_slice = pair_orders.index <= i
+        mask_buy = pair_orders["side"] == "BUY"
+        mask_slice_buy = mask_slice & mask_buy
+        if pair_orders.loc[mask_slice, "side"].iloc[-1] == "SELL":
+            pair_orders.loc[mask_slice_buy, "usdtValue"] = (
+                pair_orders.loc[mask_slice_buy, "cummulativeQuoteQty"]
+                * pair_orders.loc[mask_slice, "price"].iloc[-1]
+                / pair_orders.loc[mask_slice_buy, "price"]
+            )
+            pair_orders.loc[mask_slice_buy, "usdtQtyWeight"] = (
+                pair_orders.loc[mask_slice_buy, "usdtValue"]
+                / pair_orders.loc[mask_slice_buy, "usdtValue"].sum()
+            )
+            sell_amount = pair_orders.loc[mask_slice, "cummulativeQuoteQty"].iloc[-1]
+            pair_orders.loc[mask_slice_buy, "usdtValueCorrection"] = (
+                sell_amount * pair_orders.loc[mask_slice_buy, "usdtQtyWeight"]
+            )
+            if pair_orders.loc[mask_slice_buy, "executedCorrectedQty"].sum() == 0:
+                raise ValueError(
+                    "Bad balance error, looks like not all orders are listed. There are no coins available for selling"
+                )
+            pair_orders.loc[mask_slice_buy, "executedCorrectedQty"] *= (
+                1
+                - pair_orders.loc[mask_slice_buy, "usdtValueCorrection"]
+                / pair_orders.loc[mask_slice_buy, "usdtValue"]
+            )
+    return pair_orders.drop(
+        ["usdtValue", "usdtValueCorrection", "usdtQtyWeight"], axis=1
+    )
+
+
+def make_pair_orders(sides, prices, quote_qtys) -> pd.DataFrame:
+    prices = np.asarray(prices, dtype=float)
+    quote_qtys = np.asarray(quote_qtys, dtype=float)
+    return pd.DataFrame(
+        {
+            "base_coin": "ETH",
+            "side": sides,
+            "price": prices,
+            "cummulativeQuoteQty": quote_qtys,
+            "executedQty": quote_qtys / prices,
+        }
+    )
+
+
+def random_pair_orders(rng: np.random.Generator, n_orders: int) -> pd.DataFrame:
+    """
+    Random history which starts with purchase, each sale sells part of coins held at its price.
+    """
+    sides, prices, quote_qtys = [], [], []
+    held_qty = 0.0
+    for i in range(n_orders):
+        price = rng.uniform(10, 1000)
+        if i == 0 or rng.random() < 0.6:
+            quote_qty = rng.uniform(10, 1000)
+            held_qty += quote_qty / price
+            sides.append("BUY")
+        else:
+            sold_qty = held_qty * rng.uniform(0.01, 0.9)
+            held_qty -= sold_qty
+            quote_qty = sold_qty * price
+            sides.append("SELL")
+        prices.append(price)
+        quote_qtys.append(quote_qty)
+    return make_pair_orders(sides, prices, quote_qtys)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_corrected_balance_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    pair_orders = random_pair_orders(rng, int(rng.integers(1, 60)))
+
+    expected = calculate_corrected_balance_for_pair_reference(pair_orders)
+    result = calculate_corrected_balance_for_pair(pair_orders)
+
+    expected_qty = expected["executedCorrectedQty"].to_numpy(dtype=float)
+    result_qty = result["executedCorrectedQty"].to_numpy(dtype=float)
+    np.testing.assert_array_equal(np.isnan(result_qty), np.isnan(expected_qty))
+    np.testing.assert_allclose(result_qty, expected_qty, rtol=1e-9, equal_nan=True)
+
+
+def test_corrected_balance_keeps_order_columns():
+    pair_orders = make_pair_orders(["BUY", "SELL"], [10, 20], [100, 50])
+    pair_orders.index = [5, 7]
+
+    result = calculate_corrected_balance_for_pair(pair_orders)
+
+    assert list(result.index) == [0, 1]
+    pd.testing.assert_frame_equal(
+        result.drop(columns="executedCorrectedQty"), pair_orders.reset_index(drop=True)
+    )
+    np.testing.assert_allclose(
+        result["executedCorrectedQty"].to_numpy(), [7.5, np.nan], equal_nan=True
+    )
+
+
+@pytest.mark.parametrize(
+    "sides, prices, quote_qtys",
+    [
+        (["SELL", "BUY"], [10, 10], [100, 100]),
+        (["BUY", "SELL", "SELL"], [10, 20, 20], [100, 200, 10]),
+    ],
+    ids=["sale before purchases", "sale after everything is sold"],
+)
+def test_corrected_balance_bad_balance(sides, prices, quote_qtys):
+    pair_orders = make_pair_orders(sides, prices, quote_qtys)
+
+    with pytest.raises(ValueError, match="Bad balance error"):
+        calculate_corrected_balance_for_pair_reference(pair_orders)
+    with pytest.raises(ValueError, match="Bad balance error"):
+        calculate_corrected_balance_for_pair(pair_orders)
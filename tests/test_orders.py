@@ -0,0 +1,85 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from src.analysis.analyse import OrdersAnalyser
+from src.data.preprocessing.orders import OrdersProcessor
+from src.data.trade_prices import TradePriceResolver
+
+START_MS = 1672531200000  # 2023-01-01
+MINUTE_MS = 60 * 1000
+
+
+class KlinesClient:
+    """
+    Client helper with minute klines of constant price. Symbols without price have klines without trades.
+    """
+
+    def __init__(self, prices):
+        self.prices = prices
+
+    def get_klines(self, coin_pair, interval, start_time, end_time=None):
+        open_times = np.arange(start_time // MINUTE_MS * MINUTE_MS, end_time, MINUTE_MS)
+        klines = np.zeros((len(open_times), 12))
+        klines[:, 0] = open_times
+        klines[:, 4] = self.prices.get(coin_pair, 0.0)
+        klines[:, 8] = int(coin_pair in self.prices)
+        return klines
+
+
+def make_order(order_id, base_coin, quote_coin, side, executed_qty, quote_qty):
+    time = START_MS + order_id * MINUTE_MS
+    return {
+        "symbol": base_coin + quote_coin,
+        "orderId": order_id,
+        "price": quote_qty / executed_qty,
+        "origQty": executed_qty,
+        "executedQty": executed_qty,
+        "cummulativeQuoteQty": quote_qty,
+        "status": "FILLED",
+        "type": "LIMIT",
+        "side": side,
+        "time": time,
+        "updateTime": time,
+        "base_coin": base_coin,
+        "quote_coin": quote_coin,
+    }
+
+
+def test_conversion_without_price_is_dropped(caplog):
+    client_helper = KlinesClient({"ETHUSDT": 1000.0, "BNBUSDT": 250.0})
+    orders = pd.DataFrame(
+        [
+            make_order(1, "ETH", "USDT", "BUY", 2.0, 2000.0),
+            make_order(2, "BNB", "ETH", "BUY", 2.0, 0.5),
+            # XRPUSDT has no trades, so neither leg of conversion gets price
+            make_order(3, "XRP", "ETH", "BUY", 100.0, 0.1),
+            make_order(4, "BNB", "USDT", "SELL", 1.0, 250.0),
+        ]
+    )
+
+    with caplog.at_level(logging.WARNING):
+        processed = OrdersProcessor(client_helper).transform(orders)
+
+    assert "orderId [3]" in caplog.text
+    assert processed["orderId"].tolist() == [1, 2, 2, 4]
+    assert processed["base_coin"].astype(str).tolist() == ["ETH", "ETH", "BNB", "BNB"]
+    assert processed["side"].astype(str).tolist() == ["BUY", "SELL", "BUY", "SELL"]
+    np.testing.assert_allclose(processed["price"], [1000.0, 1000.0, 250.0, 250.0])
+    np.testing.assert_allclose(
+        processed["cummulativeQuoteQty"], [2000.0, 500.0, 500.0, 250.0]
+    )
+
+    analysed = OrdersAnalyser.prepare_dataframe(processed)
+    is_buy = analysed["side"] == "BUY"
+    assert analysed.loc[is_buy, "executedCorrectedQty"].notna().all()
+
+
+def test_resolver_price_is_nan_without_trades_within_horizon():
+    client_helper = KlinesClient({"ETHUSDT": 1000.0})
+    resolver = TradePriceResolver(client_helper, horizon_ms=10 * MINUTE_MS)
+    prices = resolver.resolve(
+        ["ETHUSDT", "XRPUSDT", "ETHUSDT"], [START_MS, START_MS, START_MS + 1]
+    )
+    np.testing.assert_array_equal(prices, [1000.0, np.nan, 1000.0])
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.analysis.analyse import OrdersAnalyser
+from src.analysis.orders_state import OrdersState
+
+START_MS = 1672531200000  # 2023-01-01
+MINUTE_MS = 60 * 1000
+
+
+def random_orders(rng: np.random.Generator, n: int) -> pd.DataFrame:
+    """
+    Orders of several coins, each coin starts with purchase. Some orders are not filled.
+    """
+    base_coins = rng.choice(["ETH", "BTC", "BNB"], n)
+    sides = np.where(rng.random(n) < 0.7, "BUY", "SELL")
+    for coin in np.unique(base_coins):
+        sides[np.argmax(base_coins == coin)] = "BUY"
+    time = START_MS + np.sort(rng.integers(0, 1000 * MINUTE_MS, n))
+    prices = rng.uniform(10, 20, n)
+    executed_qty = rng.uniform(0.1, 1, n)
+    return pd.DataFrame(
+        {
+            "symbol": [coin + "USDT" for coin in base_coins],
+            "orderId": np.arange(n),
+            "side": sides,
+            "status": np.where(rng.random(n) < 0.9, "FILLED", "CANCELED"),
+            "time": time,
+            "updateTime": time + rng.integers(0, MINUTE_MS, n),
+            "base_coin": base_coins,
+            "quote_coin": np.where(rng.random(n) < 0.5, "USDT", "BUSD"),
+            "price": prices,
+            "executedQty": executed_qty,
+            # small sales, so there are always coins for selling
+            "cummulativeQuoteQty": prices
+            * executed_qty
+            * np.where(sides == "BUY", 1, 0.1),
+        }
+    )
+
+
+def full_aggregates(orders: pd.DataFrame) -> pd.DataFrame:
+    analyser = OrdersAnalyser(None, orders)
+    aggregates = analyser.calculate_mean_price()
+    corrected_qty = analyser.orders.groupby("base_coin", observed=True)[
+        "executedCorrectedQty"
+    ].sum()
+    aggregates["executedCorrectedQty"] = (
+        aggregates["base_coin"].map(corrected_qty).astype(float)
+    )
+    return aggregates.astype({"base_coin": str, "quote_coin": str}).reset_index(
+        drop=True
+    )
+
+
+def state_aggregates(state: OrdersState) -> pd.DataFrame:
+    return state.aggregates()[
+        [
+            "base_coin",
+            "quote_coin",
+            "average_price",
+            "n_purchases",
+            "n_sales",
+            "executedCorrectedQty",
+        ]
+    ]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_sync_matches_full_calculation(seed, tmp_path):
+    rng = np.random.default_rng(seed)
+    orders = random_orders(rng, 300)
+    # order which is filled after the other orders were synced, with its old creation time
+    late_filled = orders.index[orders["status"] == "CANCELED"][0]
+    visible = orders.drop(late_filled)
+
+    filtered_lengths = []
+
+    def filter_orders(batch: pd.DataFrame) -> pd.DataFrame:
+        filtered_lengths.append(len(batch))
+        return OrdersAnalyser.filter_orders(batch)
+
+    state = OrdersState("key", tmp_path)
+    for end in [100, 200, len(visible)]:
+        filtered_lengths.clear()
+        state.sync(visible.iloc[:end], filter_orders)
+        state.dump()
+        state = OrdersState("key", tmp_path)
+        pd.testing.assert_frame_equal(
+            state_aggregates(state),
+            full_aggregates(visible.iloc[:end]),
+            check_dtype=False,
+        )
+    # the last batch touches only its new orders
+    assert filtered_lengths == [len(visible) - 200]
+
+    orders.loc[late_filled, ["status", "updateTime"]] = [
+        "FILLED",
+        orders["updateTime"].max() + MINUTE_MS,
+    ]
+    filtered_lengths.clear()
+    assert state.sync(orders, filter_orders) == 1
+    late_coin = orders.loc[late_filled, "base_coin"]
+    # coin of late order is rebuilt from its orders
+    assert filtered_lengths == [1, (orders["base_coin"] == late_coin).sum()]
+    pd.testing.assert_frame_equal(
+        state_aggregates(state), full_aggregates(orders), check_dtype=False
+    )
+
+    filtered_lengths.clear()
+    assert state.sync(orders, filter_orders) == 0
+    assert filtered_lengths == [0]
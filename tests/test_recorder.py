@@ -0,0 +1,188 @@
+import json
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+from binance.exceptions import BinanceAPIException
+
+import src.client.client as client_module
+from src.client.client import MAX_ORDERS, ClientHelper
+from src.client.order_sync import OrdersSyncState
+from src.client.recorder import RECORD_MODE, REPLAY_MODE, TransportRecorder
+from src.client.symbols import dump_cached_symbols
+from src.data.klines_store import KlinesStore
+
+API_KEY = "key"
+START_MS = 1672531200000  # 2023-01-01
+MINUTE_MS = 60 * 1000
+DAY_MS = 24 * 60 * MINUTE_MS
+SYMBOLS = {"ETHUSDT": ("ETH", "USDT"), "BTCUSDT": ("BTC", "USDT")}
+
+
+def make_order(symbol, order_id, order_type="LIMIT", executed_qty=1.0):
+    time = START_MS + order_id * MINUTE_MS
+    return {
+        "symbol": symbol,
+        "orderId": order_id,
+        "orderListId": -1,
+        "clientOrderId": f"order{order_id}",
+        "price": "10.0",
+        "origQty": "1.0",
+        "executedQty": str(executed_qty),
+        "cummulativeQuoteQty": str(10.0 * executed_qty),
+        "status": "FILLED",
+        "timeInForce": "GTC",
+        "type": order_type,
+        "side": "BUY" if order_id % 2 else "SELL",
+        "stopPrice": "0",
+        "icebergQty": "0",
+        "time": time,
+        "updateTime": time,
+        "isWorking": True,
+        "origQuoteOrderQty": "0",
+    }
+
+
+ORDERS = {
+    "ETHUSDT": [make_order("ETHUSDT", i) for i in range(1, MAX_ORDERS + 200)]
+    + [make_order("ETHUSDT", MAX_ORDERS + 300, "MARKET", executed_qty=0.0)],
+    "BTCUSDT": [make_order("BTCUSDT", 5)],
+}
+
+
+class FakeClient:
+    """
+    python-binance Client with static exchange data.
+    """
+
+    KLINE_INTERVAL_1MINUTE = "1m"
+    KLINE_INTERVAL_1DAY = "1d"
+    INTERVAL_MS = {"1m": MINUTE_MS, "1d": DAY_MS}
+
+    def __init__(self, api_key=None, api_secret=None):
+        self.response = None
+
+    def get_exchange_info(self):
+        return {
+            "symbols": [
+                {"symbol": symbol, "baseAsset": base, "quoteAsset": quote}
+                for symbol, (base, quote) in SYMBOLS.items()
+            ]
+        }
+
+    def get_all_orders(self, symbol, orderId, limit, recvWindow):
+        if symbol not in SYMBOLS:
+            raise BinanceAPIException(
+                None, 400, json.dumps({"code": -1121, "msg": "Invalid symbol."})
+            )
+        return [o for o in ORDERS.get(symbol, []) if o["orderId"] >= orderId][:limit]
+
+    def get_klines(self, symbol, interval, startTime, endTime, limit):
+        interval_ms = self.INTERVAL_MS[interval]
+        open_time = max(startTime, START_MS) // interval_ms * interval_ms
+        if open_time < startTime:
+            open_time += interval_ms
+        klines = []
+        while open_time <= endTime and len(klines) < limit:
+            price = str(1 + open_time // interval_ms % 100)
+            close_time = open_time + interval_ms - 1
+            klines.append(
+                [open_time, price, price, price, price, "1.0", close_time]
+                + ["1.0", 1, "0.5", "0.5", "0"]
+            )
+            open_time += interval_ms
+        return klines
+
+    def get_all_tickers(self):
+        return [{"symbol": symbol, "price": "10.0"} for symbol in SYMBOLS]
+
+
+class OfflineClient(FakeClient):
+    def __init__(self, *args, **kwargs):
+        raise AssertionError("Client should not be created in replay")
+
+
+def fetch(client_helper: ClientHelper):
+    client_helper.currency_items = ["ETH", "BTC", "USDT"]
+    orders = client_helper.load_orders(incremental=True)
+    prices = client_helper.get_historical_prices("ETHUSDT", start_date=START_MS)
+    current_prices = client_helper.query_prices().lookup(["ETH", "BTC"])
+    return orders, prices, current_prices
+
+
+@pytest.fixture
+def local_state(tmp_path, monkeypatch) -> KlinesStore:
+    """
+    Persisted state of previous sessions: sync cursor of ETHUSDT, stored klines and symbols cache.
+    """
+    sync_folder = tmp_path / "state" / "orders_sync"
+    monkeypatch.setattr(client_module, "ORDERS_SYNC_FOLDER", sync_folder)
+    symbols_fpath = tmp_path / "state" / "exchange_symbols.json"
+    monkeypatch.setattr(client_module, "EXCHANGE_SYMBOLS_FPATH", symbols_fpath)
+    sync_state = OrdersSyncState(API_KEY, sync_folder)
+    sync_state.update("ETHUSDT", ORDERS["ETHUSDT"][:3])
+    sync_state.dump()
+    dump_cached_symbols(FakeClient().get_exchange_info()["symbols"][:1], symbols_fpath)
+    klines_store = KlinesStore(tmp_path / "state" / "klines")
+    end_time = START_MS + 10 * DAY_MS
+    klines = FakeClient().get_klines("ETHUSDT", "1d", START_MS, end_time - 1, 1000)
+    klines_store.add("ETHUSDT", "1d", klines, [(START_MS, end_time)])
+    return klines_store
+
+
+def read_files(folder):
+    return {
+        path.relative_to(folder): path.read_bytes()
+        for path in sorted(folder.rglob("*"))
+        if path.is_file()
+    }
+
+
+def test_record_replay_round_trip(local_state, tmp_path, monkeypatch):
+    """
+    Session recorded with persisted state is replayed without it, and neither run changes that state.
+    """
+    archive = tmp_path / "session.jsonl.gz"
+    state_folder = tmp_path / "state"
+
+    monkeypatch.setattr(client_module, "Client", FakeClient)
+    with TransportRecorder(archive, RECORD_MODE) as recorder:
+        recorded = fetch(
+            ClientHelper(API_KEY, "secret", klines_store=local_state, recorder=recorder)
+        )
+    orders = recorded[0]
+    assert len(orders) == len(ORDERS["ETHUSDT"]) + len(ORDERS["BTCUSDT"])
+    assert orders["price"].notna().all()
+
+    # replay on machine without persisted state
+    shutil.rmtree(state_folder)
+    monkeypatch.setattr(client_module, "Client", OfflineClient)
+    # the first replay should not leave state which changes requests of the second one
+    for _ in range(2):
+        with TransportRecorder(archive, REPLAY_MODE) as recorder:
+            replayed = fetch(
+                ClientHelper(
+                    API_KEY, "secret", klines_store=local_state, recorder=recorder
+                )
+            )
+        pd.testing.assert_frame_equal(replayed[0], recorded[0])
+        pd.testing.assert_frame_equal(replayed[1], recorded[1])
+        np.testing.assert_array_equal(replayed[2], recorded[2])
+    assert not state_folder.exists()
+
+
+def test_recording_keeps_persisted_state(local_state, tmp_path, monkeypatch):
+    state_folder = tmp_path / "state"
+    persisted = read_files(state_folder)
+
+    monkeypatch.setattr(client_module, "Client", FakeClient)
+    with TransportRecorder(tmp_path / "session.jsonl.gz", RECORD_MODE) as recorder:
+        fetch(
+            ClientHelper(API_KEY, "secret", klines_store=local_state, recorder=recorder)
+        )
+        session_folder = recorder.state_folder
+        assert session_folder.exists()
+
+    assert read_files(state_folder) == persisted
+    assert not session_folder.exists()